@@ -0,0 +1,67 @@
+"""Awaitable wrappers around database.py for use inside discord.py event handlers.
+
+pymongo's MongoClient is blocking, so each call is run on a bounded thread pool to keep
+the gateway heartbeat and other events flowing while MongoDB answers.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import config
+import database
+
+_executor = ThreadPoolExecutor(
+    max_workers=config.MONGO_EXECUTOR_WORKERS,
+    thread_name_prefix="mongo",
+)
+
+
+def _run_in_executor(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    return wrapper
+
+
+def shutdown():
+    """Wait for in-flight database calls and release the worker threads."""
+    _executor.shutdown(wait=True)
+
+
+load_roles_state = _run_in_executor(database.load_roles_state)
+save_roles_state = _run_in_executor(database.save_roles_state)
+load_registered_channels_state = _run_in_executor(database.load_registered_channels_state)
+save_registered_channels_state = _run_in_executor(database.save_registered_channels_state)
+load_linked_channel_groups_state = _run_in_executor(database.load_linked_channel_groups_state)
+save_linked_channel_groups_state = _run_in_executor(database.save_linked_channel_groups_state)
+
+save_message_group_entry = _run_in_executor(database.save_message_group_entry)
+get_message_group_entry_by_message_id = _run_in_executor(database.get_message_group_entry_by_message_id)
+get_thread_message_group_entry = _run_in_executor(database.get_thread_message_group_entry)
+delete_message_group_entry_by_message_id = _run_in_executor(database.delete_message_group_entry_by_message_id)
+get_message_group_documents_by_message_ids = _run_in_executor(database.get_message_group_documents_by_message_ids)
+delete_message_group_documents = _run_in_executor(database.delete_message_group_documents)
+append_message_group_mirror = _run_in_executor(database.append_message_group_mirror)
+set_message_group_edited_at = _run_in_executor(database.set_message_group_edited_at)
+migrate_group_collections = _run_in_executor(database.migrate_group_collections)
+
+set_user_avatar = _run_in_executor(database.set_user_avatar)
+get_user_avatar = _run_in_executor(database.get_user_avatar)
+delete_user_avatar = _run_in_executor(database.delete_user_avatar)
+load_avatars_version = _run_in_executor(database.load_avatars_version)
+
+save_forum_thread_group_entry = _run_in_executor(database.save_forum_thread_group_entry)
+get_forum_thread_group_entry_by_thread_id = _run_in_executor(database.get_forum_thread_group_entry_by_thread_id)
+delete_forum_thread_group_entry_by_thread_id = _run_in_executor(database.delete_forum_thread_group_entry_by_thread_id)
+
+heartbeat_instance = _run_in_executor(database.heartbeat_instance)
+load_live_instance_ids = _run_in_executor(database.load_live_instance_ids)
+acquire_group_lease = _run_in_executor(database.acquire_group_lease)
+release_group_lease = _run_in_executor(database.release_group_lease)
+release_instance = _run_in_executor(database.release_instance)
+
+ensure_outbox_indexes = _run_in_executor(database.ensure_outbox_indexes)
+append_outbox_jobs = _run_in_executor(database.append_outbox_jobs)
+mark_outbox_jobs_done = _run_in_executor(database.mark_outbox_jobs_done)
+load_orphaned_outbox_jobs = _run_in_executor(database.load_orphaned_outbox_jobs)
+claim_outbox_job = _run_in_executor(database.claim_outbox_job)
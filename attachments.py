@@ -0,0 +1,103 @@
+import asyncio
+import io
+import os
+import tempfile
+import weakref
+from typing import List, Optional
+import discord
+import config
+from sender_pool import sender_pool
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class SharedAttachment:
+    """A downloaded attachment whose bytes can be sent to any number of destinations."""
+
+    def __init__(self, filename: str, spoiler: bool, description: Optional[str], data: Optional[bytes] = None, path: Optional[str] = None):
+        self.filename = filename
+        self.spoiler = spoiler
+        self.description = description
+        self.data = data
+        self.path = path
+
+    def to_file(self) -> discord.File:
+        """Return a fresh discord.File over the shared bytes. Each send consumes its own File."""
+        if self.path is not None:
+            # discord.File opens and owns the handle when given a path, so it is closed after the send.
+            return discord.File(self.path, filename=self.filename, spoiler=self.spoiler, description=self.description)
+        return discord.File(io.BytesIO(self.data), filename=self.filename, spoiler=self.spoiler, description=self.description)
+
+
+def _remove_paths(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove spooled attachment {path}: {e}")
+
+
+class AttachmentFanout:
+    """
+    Downloads each attachment of a message once and hands out new discord.File objects per target.
+
+    Attachments up to ATTACHMENT_SPOOL_THRESHOLD_BYTES are kept in memory, larger ones (and all of
+    them while the sender pool runs, so workers get a path instead of the bytes) are spooled to a
+    temporary file that is removed on close() or when the fan-out is garbage collected.
+    Holders that outlive the handler (delivery retries) retain() it and close() when done.
+    """
+
+    def __init__(self, attachments: List[SharedAttachment]):
+        self.attachments = attachments
+        self._refs = 1
+        spooled_paths = [attachment.path for attachment in attachments if attachment.path is not None]
+        self._finalizer = weakref.finalize(self, _remove_paths, spooled_paths)
+
+    @classmethod
+    async def from_attachments(cls, attachments: List[discord.Attachment]) -> "AttachmentFanout":
+        if not attachments:
+            return cls([])
+        results = await asyncio.gather(*(cls._download(attachment) for attachment in attachments), return_exceptions=True)
+        shared = []
+        for attachment, result in zip(attachments, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to download attachment {attachment.filename}: {result}")
+                continue
+            shared.append(result)
+        return cls(shared)
+
+    @classmethod
+    async def from_message(cls, message: discord.Message) -> "AttachmentFanout":
+        return await cls.from_attachments(message.attachments)
+
+    @staticmethod
+    async def _download(attachment: discord.Attachment) -> SharedAttachment:
+        spoiler = attachment.is_spoiler()
+        if attachment.size > config.ATTACHMENT_SPOOL_THRESHOLD_BYTES or sender_pool.running:
+            fd, path = tempfile.mkstemp(prefix="hackbridge_", suffix=f"_{attachment.id}")
+            os.close(fd)
+            try:
+                await attachment.save(path)
+            except Exception:
+                _remove_paths([path])
+                raise
+            logger.debug(f"Spooled attachment {attachment.filename} ({attachment.size} bytes) to {path}")
+            return SharedAttachment(attachment.filename, spoiler, attachment.description, path=path)
+
+        data = await attachment.read()
+        return SharedAttachment(attachment.filename, spoiler, attachment.description, data=data)
+
+    def files(self) -> List[discord.File]:
+        """Build a new list of discord.File objects for one destination."""
+        return [attachment.to_file() for attachment in self.attachments]
+
+    def retain(self):
+        self._refs += 1
+
+    def close(self):
+        self._refs -= 1
+        if self._refs <= 0:
+            self._finalizer()
@@ -0,0 +1,147 @@
+import time
+from typing import Dict, List, Optional
+import config
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# Discord JSON error code for "Unknown Channel". Other 404s (a mirror message that was deleted)
+# say nothing about the destination itself.
+UNKNOWN_CHANNEL = 10003
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a destination whose circuit is open."""
+
+    def __init__(self, destination_id: str):
+        super().__init__(f"Destination {destination_id} is unavailable (circuit open)")
+        self.destination_id = destination_id
+
+
+def is_dead_destination(error: BaseException, sending: bool = False) -> bool:
+    """
+    True for failures that mean the destination is gone or off-limits: 404 Unknown Channel, or a
+    403 on a call that sends into the channel (sending, creating threads). A 403 on a reaction,
+    edit or delete only means that action is not allowed, and the channel still takes mirrors.
+    """
+    status = getattr(error, "status", None)
+    if status == 403:
+        return sending
+    return status == 404 and getattr(error, "code", None) == UNKNOWN_CHANNEL
+
+
+class _Circuit:
+    __slots__ = ("failures", "opened_at", "next_probe_at", "probe_interval", "probe_in_flight", "last_error")
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.next_probe_at = 0.0
+        self.probe_interval = 0.0
+        self.probe_in_flight = False
+        self.last_error = ""
+
+
+class DestinationBreakers:
+    """
+    Circuit breakers for destination channels.
+
+    A destination that fails failure_threshold times in a row with a dead-destination error (see
+    is_dead_destination) is opened: calls to it are refused without a request until its next probe is due. Then a
+    single call goes through as the probe while the others are still refused; a success closes the
+    circuit, another failure reopens it with the probe interval doubled, up to max_probe_interval.
+    """
+
+    def __init__(self, failure_threshold: int, probe_interval: float, max_probe_interval: float):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self._circuits: Dict[str, _Circuit] = {}
+
+    def is_open(self, destination_id) -> bool:
+        """True while calls to the destination are refused. Unlike allow(), never starts a probe."""
+        circuit = self._circuits.get(str(destination_id))
+        if circuit is None or circuit.opened_at is None:
+            return False
+        return circuit.probe_in_flight or time.monotonic() < circuit.next_probe_at
+
+    def allow(self, destination_id) -> bool:
+        """
+        True if a call to the destination may be made. Once a probe is due, the first caller makes
+        it; its outcome must be recorded with record_result, which ends the probe.
+        """
+        if self.is_open(destination_id):
+            return False
+        circuit = self._circuits.get(str(destination_id))
+        if circuit is not None and circuit.opened_at is not None:
+            circuit.probe_in_flight = True
+        return True
+
+    def record_success(self, destination_id):
+        circuit = self._circuits.pop(str(destination_id), None)
+        if circuit is not None and circuit.opened_at is not None:
+            logger.info(f"Destination {destination_id} is reachable again, closing its circuit")
+
+    def record_failure(self, destination_id, reason: str):
+        destination_id = str(destination_id)
+        circuit = self._circuits.setdefault(destination_id, _Circuit())
+        circuit.probe_in_flight = False
+        circuit.failures += 1
+        circuit.last_error = reason
+        now = time.monotonic()
+
+        if circuit.opened_at is not None:
+            if now < circuit.next_probe_at:
+                return
+            circuit.probe_interval = min(self.max_probe_interval, circuit.probe_interval * 2)
+            circuit.next_probe_at = now + circuit.probe_interval
+            logger.info(f"Probe of destination {destination_id} failed ({reason}), next probe in {circuit.probe_interval:.0f}s")
+        elif circuit.failures >= self.failure_threshold:
+            circuit.opened_at = now
+            circuit.probe_interval = self.probe_interval
+            circuit.next_probe_at = now + circuit.probe_interval
+            logger.warning(
+                f"Opening circuit for destination {destination_id} after {circuit.failures} failures ({reason}), "
+                f"skipping it for {circuit.probe_interval:.0f}s"
+            )
+
+    def record_result(self, destination_id, error: Optional[BaseException], sending: bool = False):
+        """Record the outcome of a call: success, a dead-destination failure, or neither."""
+        if error is None:
+            self.record_success(destination_id)
+        elif is_dead_destination(error, sending):
+            self.record_failure(destination_id, str(error))
+        else:
+            # Says nothing about the destination; the next call probes it instead.
+            circuit = self._circuits.get(str(destination_id))
+            if circuit is not None:
+                circuit.probe_in_flight = False
+
+    def snapshot(self) -> List[dict]:
+        """State of every destination with recent failures, open circuits first."""
+        now = time.monotonic()
+        rows = []
+        for destination_id, circuit in self._circuits.items():
+            if circuit.opened_at is None:
+                state = "closed"
+            elif circuit.probe_in_flight or now >= circuit.next_probe_at:
+                state = "probing"
+            else:
+                state = "open"
+            rows.append({
+                "destination_id": destination_id,
+                "state": state,
+                "failures": circuit.failures,
+                "open_for": now - circuit.opened_at if circuit.opened_at is not None else 0.0,
+                "next_probe_in": max(0.0, circuit.next_probe_at - now) if circuit.opened_at is not None else 0.0,
+                "last_error": circuit.last_error,
+            })
+        rows.sort(key=lambda row: (row["state"] == "closed", -row["failures"]))
+        return rows
+
+
+destination_breakers = DestinationBreakers(
+    config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    config.CIRCUIT_BREAKER_PROBE_SECONDS,
+    config.CIRCUIT_BREAKER_MAX_PROBE_SECONDS,
+)
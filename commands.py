@@ -1,16 +1,28 @@
 from discord import app_commands
 from discord.ext import commands
 import discord
+import math
 import re
 from roles import SuperAdmin, Admin, Registrator
 import helpers
 from logger_config import get_logger
 import database
+import async_database
 import commands_helpers
+from routing import routing_index
+from outbound import outbound
+from delivery_retry import delivery_retries
+from delivery_queue import delivery_queues
+from circuit_breaker import destination_breakers
 
 # Set up logger for commands module
 logger = get_logger(__name__)
 
+# Rows shown by /circuit_status, to stay under Discord's message length limit.
+CIRCUIT_STATUS_MAX_ROWS = 15
+# Most backed-up destination queues shown by /outbound_status.
+DELIVERY_QUEUE_STATUS_MAX_ROWS = 5
+
 
 def setup(bot):
     def format_guild_display_name(guild: discord.Guild | None, fallback_name: str) -> str:
@@ -448,6 +460,7 @@ def setup(bot):
         commands_helpers.add_new_linked_group(linked_channels, group_name, current_entry, target_entry)
         try:
             commands_helpers.save_json_file("linked_channels.json", linked_channels)
+            routing_index.rebuild(linked_channels)
             logger.info(f"Successfully created new link group '{group_name}' with channels {[current_entry['channel_id'], target_entry['channel_id']]}")
         except Exception as e:
             logger.error(f"Failed to save linked channels data: {e}")
@@ -683,6 +696,7 @@ def setup(bot):
                     
                     try:
                         database.save_linked_channel_groups_state(linked_channels)
+                        routing_index.rebuild(linked_channels)
                         logger.info(f"Successfully unlinked channel {interaction.channel.name} ({interaction.channel.id}) from group")
                     except Exception as e:
                         logger.error(f"Failed to save linked channels data after unlinking: {e}")
@@ -1125,6 +1139,7 @@ def setup(bot):
 
         try:
             commands_helpers.save_json_file("linked_channels.json", linked_channels)
+            routing_index.rebuild(linked_channels)
             logger.info(f"Successfully linked channel {source_channel.name} ({source_channel.id}) to group '{group_name}'")
         except Exception as e:
             logger.error(f"Failed to save linked channels data: {e}")
@@ -1367,6 +1382,7 @@ def setup(bot):
         try:
             # Set the user's avatar in the database
             database.set_user_avatar(str(interaction.user.id), emoji)
+            helpers.invalidate_user_avatar(str(interaction.user.id))
             logger.info(f"Successfully set avatar {emoji} for user {interaction.user.display_name} ({interaction.user.id})")
             
             await interaction.response.send_message(
@@ -1392,6 +1408,7 @@ def setup(bot):
             
             # Remove the user's avatar from the database
             success = database.delete_user_avatar(str(interaction.user.id))
+            helpers.invalidate_user_avatar(str(interaction.user.id))
             if success:
                 logger.info(f"Successfully removed avatar for user {interaction.user.display_name} ({interaction.user.id})")
                 await interaction.response.send_message(
@@ -1548,3 +1565,124 @@ def setup(bot):
                 return
 
             await interaction.response.send_message(msg, ephemeral=True)
+
+    @bot.tree.command(name="migrate_message_mappings", description="Index message mapping collections of all linked groups")
+    async def migrate_message_mappings(interaction: discord.Interaction):
+        '''Create lookup indexes on the message and forum thread mapping collections of every linked group.'''
+        logger.info(f"migrate_message_mappings command invoked by {interaction.user.display_name} ({interaction.user.id})")
+
+        if not helpers.has_user_permission(str(interaction.user.id), str(interaction.guild.id), "superadmin_only"):
+            logger.warning(f"User {interaction.user.display_name} ({interaction.user.id}) attempted to migrate message mappings without permission")
+            await interaction.response.send_message("You have no permission to migrate message mappings.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        try:
+            linked_channels = commands_helpers.load_linked_channels()
+            group_names = [group["group_name"] for group in linked_channels.get("groups", [])]
+            report = await async_database.migrate_group_collections(group_names)
+        except Exception as e:
+            logger.error(f"Failed to migrate message mapping collections: {e}")
+            await send_interaction_message(interaction, "An error occurred while migrating message mappings.")
+            return
+
+        indexed = [name for name, status in report if status == "indexed"]
+        logger.info(f"Migrated {len(indexed)} message mapping collections")
+        await send_interaction_message(
+            interaction,
+            f"Indexed {len(indexed)} mapping collections across {len(group_names)} linked groups.",
+        )
+
+    @bot.tree.command(name="shard_status", description="Show gateway latency and guild count per shard")
+    async def shard_status(interaction: discord.Interaction):
+        '''Report the gateway latency and number of guilds for every shard of this process.'''
+        logger.info(f"shard_status command invoked by {interaction.user.display_name} ({interaction.user.id})")
+
+        if not helpers.has_user_permission(str(interaction.user.id), str(interaction.guild.id), "superadmin_only"):
+            logger.warning(f"User {interaction.user.display_name} ({interaction.user.id}) attempted to view shard status without permission")
+            await interaction.response.send_message("You have no permission to view shard status.", ephemeral=True)
+            return
+
+        latencies = getattr(bot, "latencies", None) or [(bot.shard_id or 0, bot.latency)]
+        guild_counts = {}
+        for guild in bot.guilds:
+            guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+
+        lines = [f"Shards in this process: {len(latencies)} (shard count: {bot.shard_count or 1})"]
+        for shard_id, latency in latencies:
+            latency_text = f"{latency * 1000:.0f} ms" if math.isfinite(latency) else "not connected"
+            lines.append(f"- Shard {shard_id}: {latency_text}, {guild_counts.get(shard_id, 0)} guilds")
+
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+    @bot.tree.command(name="outbound_status", description="Show outbound queue depth and wait times per priority")
+    async def outbound_status(interaction: discord.Interaction):
+        '''Report the outbound scheduler's queue depth and wait times for each priority class.'''
+        logger.info(f"outbound_status command invoked by {interaction.user.display_name} ({interaction.user.id})")
+
+        if not helpers.has_user_permission(str(interaction.user.id), str(interaction.guild.id), "superadmin_only"):
+            logger.warning(f"User {interaction.user.display_name} ({interaction.user.id}) attempted to view outbound status without permission")
+            await interaction.response.send_message("You have no permission to view outbound status.", ephemeral=True)
+            return
+
+        lines = [f"In flight: {outbound.in_flight}/{outbound.max_concurrency}"]
+        for priority_name, stats in outbound.stats().items():
+            lines.append(
+                f"- {priority_name}: {stats['depth']} queued, {stats['completed']}/{stats['submitted']} done, "
+                f"avg wait {stats['avg_wait'] * 1000:.0f} ms, max wait {stats['max_wait'] * 1000:.0f} ms"
+            )
+
+        retries = delivery_retries.stats()
+        lines.append(
+            f"Delivery retries: {retries['pending']} pending, {retries['delivered']} delivered, "
+            f"{retries['expired']} expired, {retries['dropped']} dropped"
+        )
+
+        queues = delivery_queues.stats()
+        lines.append(
+            f"Delivery queues: {len(queues)} destinations, {sum(stats['depth'] for stats in queues.values())} pending"
+        )
+        backed_up = sorted(queues.items(), key=lambda item: (-item[1]["depth"], -item[1]["max_wait"]))
+        for (channel_id, thread_id), stats in backed_up[:DELIVERY_QUEUE_STATUS_MAX_ROWS]:
+            target = f"<#{channel_id}>" + (f" thread {thread_id}" if thread_id else "")
+            lines.append(
+                f"- {target}: {stats['depth']} pending, {stats['delivered']} delivered, "
+                f"avg wait {stats['avg_wait'] * 1000:.0f} ms, max wait {stats['max_wait'] * 1000:.0f} ms"
+            )
+
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+    @bot.tree.command(name="circuit_status", description="Show destination channels that are failing or skipped")
+    async def circuit_status(interaction: discord.Interaction):
+        '''Report the circuit breaker state of destination channels with recent 403/404 failures.'''
+        logger.info(f"circuit_status command invoked by {interaction.user.display_name} ({interaction.user.id})")
+
+        if not helpers.has_user_permission(str(interaction.user.id), str(interaction.guild.id), "superadmin_only"):
+            logger.warning(f"User {interaction.user.display_name} ({interaction.user.id}) attempted to view circuit status without permission")
+            await interaction.response.send_message("You have no permission to view circuit status.", ephemeral=True)
+            return
+
+        rows = destination_breakers.snapshot()
+        if not rows:
+            await interaction.response.send_message("All destination channels are healthy.", ephemeral=True)
+            return
+
+        open_count = sum(1 for row in rows if row["state"] != "closed")
+        lines = [f"Destinations with failures: {len(rows)} ({open_count} open)"]
+        for row in rows[:CIRCUIT_STATUS_MAX_ROWS]:
+            group_name = helpers.get_group_name(row["destination_id"]) or "unlinked"
+            if row["state"] == "closed":
+                timing = ""
+            elif row["state"] == "probing":
+                timing = f", open {row['open_for'] / 60:.0f} min, probing now"
+            else:
+                timing = f", open {row['open_for'] / 60:.0f} min, next probe in {row['next_probe_in']:.0f}s"
+            lines.append(
+                f"- <#{row['destination_id']}> ({group_name}): {row['state']}, {row['failures']} failures{timing}"
+                f" - {row['last_error'][:80]}"
+            )
+        if len(rows) > CIRCUIT_STATUS_MAX_ROWS:
+            lines.append(f"... and {len(rows) - CIRCUIT_STATUS_MAX_ROWS} more")
+
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -16,6 +17,9 @@ REGISTERED_CHANNELS_COLLECTION_NAME = os.environ.get("REGISTERED_CHANNELS_COLLEC
 LINKED_CHANNEL_GROUPS_COLLECTION_NAME = os.environ.get("LINKED_CHANNEL_GROUPS_COLLECTION_NAME") or "hackbridge_linked_channel_groups_state"
 DEFAULT_AVATAR = ":monkey_face:"
 
+# Worker threads used to run blocking MongoDB calls off the event loop.
+MONGO_EXECUTOR_WORKERS = int(os.environ.get("MONGO_EXECUTOR_WORKERS") or 8)
+
 AVATAR_EMOJIS = [
     ":monkey_face:", ":monkey:", ":gorilla:", ":orangutan:", ":dog:", ":guide_dog:", ":service_dog:", 
     ":poodle:", ":wolf:", ":raccoon:", ":cat:", ":black_cat:", ":lion:", ":tiger:", 
@@ -30,3 +34,94 @@ AVATAR_EMOJIS = [
     ":ant:", ":beetle:", ":lady_beetle:", ":cricket:", ":cockroach:", ":spider:", ":spider_web:", ":scorpion:", 
     ":mosquito:", ":fly:", ":worm:", ":microbe:", ":turtle:", ":snake:", ":lizard:", ":crocodile:"
 ]
+
+# Attachments larger than this are spooled to a temp file instead of held in memory while mirrored.
+ATTACHMENT_SPOOL_THRESHOLD_BYTES = int(os.environ.get("ATTACHMENT_SPOOL_THRESHOLD_BYTES") or 8 * 1024 * 1024)
+
+# Resolved sticker types and downloaded guild sticker images, keyed by sticker ID.
+STICKER_CACHE_SIZE = int(os.environ.get("STICKER_CACHE_SIZE") or 256)
+STICKER_CACHE_TTL_SECONDS = float(os.environ.get("STICKER_CACHE_TTL_SECONDS") or 3600)
+
+# Per-destination delivery queues: idle workers exit after this many seconds, and a warning
+# is logged when a destination has this many deliveries waiting.
+DELIVERY_QUEUE_IDLE_SECONDS = float(os.environ.get("DELIVERY_QUEUE_IDLE_SECONDS") or 60)
+DELIVERY_QUEUE_DEPTH_WARNING = int(os.environ.get("DELIVERY_QUEUE_DEPTH_WARNING") or 50)
+
+# Per-user header avatar emoji cache.
+AVATAR_CACHE_SIZE = int(os.environ.get("AVATAR_CACHE_SIZE") or 4096)
+AVATAR_CACHE_TTL_SECONDS = float(os.environ.get("AVATAR_CACHE_TTL_SECONDS") or 600)
+
+# LRU size for sanitized display names used in headers.
+DISPLAY_NAME_CACHE_SIZE = int(os.environ.get("DISPLAY_NAME_CACHE_SIZE") or 4096)
+
+# Reaction events for the same message and emoji are coalesced for this many seconds, and at
+# most REACTION_MAX_IN_FLIGHT reaction calls run at once for one source message.
+REACTION_DEBOUNCE_SECONDS = float(os.environ.get("REACTION_DEBOUNCE_SECONDS") or 1.0)
+REACTION_MAX_IN_FLIGHT = int(os.environ.get("REACTION_MAX_IN_FLIGHT") or 4)
+
+# Lean cache mode trims discord.py caches the bridge never reads: members are not cached or
+# chunked at startup (display names come from message and interaction payloads) and the
+# message cache defaults to off, since edits and deletes are handled from raw events.
+LEAN_CACHE_MODE = (os.environ.get("LEAN_CACHE_MODE") or "false").lower() in ("1", "true", "yes")
+# Messages kept in discord.py's cache; 0 disables it.
+MESSAGE_CACHE_SIZE = int(os.environ.get("MESSAGE_CACHE_SIZE") or (0 if LEAN_CACHE_MODE else 1000))
+CHUNK_GUILDS_AT_STARTUP = (os.environ.get("CHUNK_GUILDS_AT_STARTUP") or ("false" if LEAN_CACHE_MODE else "true")).lower() in ("1", "true", "yes")
+
+# Sharding. AUTO_SHARD=true (or a SHARD_COUNT) runs an AutoShardedBot; without SHARD_COUNT
+# Discord's recommended count is used. All shards run in this process, so header state,
+# forum sync and delivery queues see events for a group whichever shard they arrive on.
+# SHARD_IDS (comma-separated, requires SHARD_COUNT) limits the process to some shards.
+AUTO_SHARD = (os.environ.get("AUTO_SHARD") or "false").lower() in ("1", "true", "yes")
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+SHARD_IDS = [int(shard_id) for shard_id in (os.environ.get("SHARD_IDS") or "").split(",") if shard_id.strip()] or None
+
+# Multi-instance mode: every replica claims a fair share of link groups through lease documents
+# in MongoDB and only mirrors the groups it owns. Leases not renewed within GROUP_LEASE_SECONDS
+# are taken over by the remaining instances.
+MULTI_INSTANCE_MODE = (os.environ.get("MULTI_INSTANCE_MODE") or "false").lower() in ("1", "true", "yes")
+INSTANCE_ID = os.environ.get("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+GROUP_LEASE_SECONDS = float(os.environ.get("GROUP_LEASE_SECONDS") or 30)
+GROUP_LEASE_HEARTBEAT_SECONDS = float(os.environ.get("GROUP_LEASE_HEARTBEAT_SECONDS") or 10)
+GROUP_LEASES_COLLECTION_NAME = os.environ.get("GROUP_LEASES_COLLECTION_NAME") or "hackbridge_group_leases"
+INSTANCES_COLLECTION_NAME = os.environ.get("INSTANCES_COLLECTION_NAME") or "hackbridge_instances"
+
+# Sender processes: with SENDER_PROCESSES > 0 the REST calls that deliver mirrored messages run
+# in that many worker processes, each with its own HTTP client, instead of the gateway loop.
+SENDER_PROCESSES = int(os.environ.get("SENDER_PROCESSES") or 0)
+SENDER_JOB_TIMEOUT_SECONDS = float(os.environ.get("SENDER_JOB_TIMEOUT_SECONDS") or 120)
+
+# Delivery retries: sends that fail with a 5xx, 429 or cannot connect are retried with
+# jittered exponential backoff until they succeed or are older than the max age.
+DELIVERY_RETRY_BASE_SECONDS = float(os.environ.get("DELIVERY_RETRY_BASE_SECONDS") or 2)
+DELIVERY_RETRY_MAX_DELAY_SECONDS = float(os.environ.get("DELIVERY_RETRY_MAX_DELAY_SECONDS") or 300)
+DELIVERY_RETRY_MAX_AGE_SECONDS = float(os.environ.get("DELIVERY_RETRY_MAX_AGE_SECONDS") or 1800)
+DELIVERY_RETRY_MAX_PENDING = int(os.environ.get("DELIVERY_RETRY_MAX_PENDING") or 1000)
+
+# Circuit breaker per destination channel: after this many 404 Unknown Channel failures, or 403s
+# to sends, in a row the channel is skipped, and probed again after the probe interval (doubling up
+# to the max).
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_BREAKER_FAILURE_THRESHOLD") or 3)
+CIRCUIT_BREAKER_PROBE_SECONDS = float(os.environ.get("CIRCUIT_BREAKER_PROBE_SECONDS") or 60)
+CIRCUIT_BREAKER_MAX_PROBE_SECONDS = float(os.environ.get("CIRCUIT_BREAKER_MAX_PROBE_SECONDS") or 3600)
+
+# Webhook delivery: send mirrors through one webhook per destination channel with the author's
+# name and avatar instead of a header line. Needs the Manage Webhooks permission.
+WEBHOOK_DELIVERY = (os.environ.get("WEBHOOK_DELIVERY") or "false").lower() in ("1", "true", "yes")
+WEBHOOK_NAME = os.environ.get("WEBHOOK_NAME") or "HackBridge"
+AVATAR_PATH = os.environ.get("AVATAR_PATH") or None
+# How long a channel without a usable webhook is served by the bot before trying again.
+WEBHOOK_UNAVAILABLE_RETRY_SECONDS = float(os.environ.get("WEBHOOK_UNAVAILABLE_RETRY_SECONDS") or 600)
+
+# Durable outbox: every message being mirrored is recorded in MongoDB (in batches) until it is
+# done, so jobs cut off by a crash or redeploy are resumed on the next start.
+OUTBOX_COLLECTION_NAME = os.environ.get("OUTBOX_COLLECTION_NAME") or "hackbridge_outbox"
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE") or 100)
+OUTBOX_FLUSH_SECONDS = float(os.environ.get("OUTBOX_FLUSH_SECONDS") or 0.5)
+OUTBOX_RESUME_INTERVAL_SECONDS = float(os.environ.get("OUTBOX_RESUME_INTERVAL_SECONDS") or 60)
+OUTBOX_MAX_RESUME_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_RESUME_ATTEMPTS") or 3)
+OUTBOX_DONE_TTL_SECONDS = float(os.environ.get("OUTBOX_DONE_TTL_SECONDS") or 86400)
+# On SIGTERM, how long to let in-flight jobs finish before disconnecting.
+SHUTDOWN_GRACE_SECONDS = float(os.environ.get("SHUTDOWN_GRACE_SECONDS") or 8)
+
+# Mirroring REST calls in flight at once through the outbound scheduler.
+OUTBOUND_MAX_CONCURRENCY = int(os.environ.get("OUTBOUND_MAX_CONCURRENCY") or 16)
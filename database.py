@@ -1,17 +1,27 @@
 import copy
+from datetime import datetime, timedelta, timezone
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
 import config
 from logger_config import get_logger
 
 logger = get_logger(__name__)
 
 # MongoDB configuration
-mongo_client = MongoClient(config.MONGO_URI)
+# connect=False defers pymongo's monitor threads to the first operation, so the sender pool can
+# fork from a single-threaded process (see SenderPool.start).
+mongo_client = MongoClient(config.MONGO_URI, connect=False)
 db = mongo_client[config.DB_NAME]
 
 ROLES_STATE_DOC_ID = "roles_state"
 REGISTERED_CHANNELS_STATE_DOC_ID = "registered_channels_state"
 LINKED_CHANNEL_GROUPS_STATE_DOC_ID = "linked_channel_groups_state"
+# Counter in the avatar collection, bumped on every avatar change so other instances can drop their caches.
+AVATARS_VERSION_DOC_ID = "avatars_version"
+
+# Process-level registry of collections known to exist, so mapping reads and writes
+# don't list the catalog on every call. Warmed at startup by warm_collection_registry().
+_known_collections = set()
 
 DEFAULT_ROLES_STATE = {
     "superadmins": [],
@@ -104,12 +114,60 @@ def save_linked_channel_groups_state(state: dict):
         state,
     )
 
+MESSAGE_GROUP_INDEX_FIELDS = ("messages.message_id", "messages.thread_id")
+FORUM_THREAD_INDEX_FIELDS = ("threads.thread_id",)
+
+
+def _index_fields_for_collection(collection_name: str):
+    if collection_name.endswith("_forum_threads"):
+        return FORUM_THREAD_INDEX_FIELDS
+    return MESSAGE_GROUP_INDEX_FIELDS
+
+
+def ensure_group_collection_indexes(collection_name: str):
+    """Create the multikey indexes used for point lookups into mirror sets."""
+    collection = db[collection_name]
+    for field in _index_fields_for_collection(collection_name):
+        collection.create_index(field)
+
+
+def warm_collection_registry():
+    """Load the existing collection names once so mapping calls can skip the catalog listing."""
+    _known_collections.update(db.list_collection_names())
+    logger.info(f"Collection registry warmed with {len(_known_collections)} collections")
+
+
 def check_and_create_group_collection(group_name: str):
-    if group_name not in db.list_collection_names():
+    if group_name in _known_collections:
+        return
+    try:
         db.create_collection(group_name)
         logger.info(f"Created collection: {group_name}")
-    else:
-        logger.info(f"Collection {group_name} already exists.")
+    except CollectionInvalid:
+        logger.debug(f"Collection {group_name} already exists.")
+    # create_index is idempotent; only remember the collection once its indexes exist.
+    ensure_group_collection_indexes(group_name)
+    _known_collections.add(group_name)
+
+
+def migrate_group_collections(group_names: list):
+    """
+    Bring existing message and forum thread mapping collections up to the indexed schema.
+
+    Returns a list of (collection_name, status) tuples for reporting.
+    """
+    existing = set(db.list_collection_names())
+    _known_collections.update(existing)
+    report = []
+    for group_name in group_names:
+        for collection_name in (group_name, _forum_thread_collection_name(group_name)):
+            if collection_name not in existing:
+                report.append((collection_name, "missing"))
+                continue
+            ensure_group_collection_indexes(collection_name)
+            report.append((collection_name, "indexed"))
+            logger.info(f"Migrated mapping collection: {collection_name}")
+    return report
 
 def save_message_group_entry(group_name: str, message_group_entry: list):
     check_and_create_group_collection(group_name)
@@ -123,13 +181,7 @@ def get_message_group_entry_by_message_id(message_id: str, group_name: str):
 
     check_and_create_group_collection(group_name)
     collection = db[group_name]
-    result = collection.find_one({
-        "messages": {
-            "$elemMatch": {
-                "message_id": message_id
-            }
-        }
-    })
+    result = collection.find_one({"messages.message_id": message_id})
     if result:
         return result["messages"]
     else:
@@ -143,13 +195,7 @@ def get_thread_message_group_entry(thread_id: str, group_name: str):
 
     check_and_create_group_collection(group_name)
     collection = db[group_name]
-    result = collection.find_one({
-        "messages": {
-            "$elemMatch": {
-                "thread_id": thread_id
-            }
-        }
-    })
+    result = collection.find_one({"messages.thread_id": thread_id})
     if result:
         return result["messages"]
     else:
@@ -163,13 +209,7 @@ def delete_message_group_entry_by_message_id(message_id: str, group_name: str):
 
     check_and_create_group_collection(group_name)
     collection = db[group_name]
-    result = collection.delete_one({
-        "messages": {
-            "$elemMatch": {
-                "message_id": message_id
-            }
-        }
-    })
+    result = collection.delete_one({"messages.message_id": message_id})
     if result.deleted_count > 0:
         logger.info(f"Deleted message group entry for message ID: {message_id} in group: {group_name}")
         return True
@@ -177,6 +217,52 @@ def delete_message_group_entry_by_message_id(message_id: str, group_name: str):
         logger.info(f"No entry found to delete for message ID: {message_id} in group: {group_name}")
         return False
 
+def get_message_group_documents_by_message_ids(message_ids: list, group_name: str):
+    """Get every message group document that contains any of the message IDs, in one query."""
+    message_ids = [str(message_id) for message_id in message_ids]
+
+    check_and_create_group_collection(group_name)
+    collection = db[group_name]
+    return list(collection.find({"messages.message_id": {"$in": message_ids}}))
+
+def delete_message_group_documents(document_ids: list, group_name: str):
+    """Delete message group documents by their _id in one round trip."""
+    if not document_ids:
+        return 0
+
+    check_and_create_group_collection(group_name)
+    collection = db[group_name]
+    result = collection.delete_many({"_id": {"$in": list(document_ids)}})
+    logger.info(f"Deleted {result.deleted_count} message group entries in group: {group_name}")
+    return result.deleted_count
+
+def append_message_group_mirror(group_name: str, source_message_id: str, mirror_entry: dict) -> bool:
+    """Add a late-delivered mirror to the group document of its source message. False if the document does not exist yet."""
+    if not type(source_message_id) is str:
+        source_message_id = str(source_message_id)
+
+    check_and_create_group_collection(group_name)
+    collection = db[group_name]
+    result = collection.update_one(
+        {"messages.message_id": source_message_id},
+        {"$addToSet": {"messages": mirror_entry}},
+    )
+    if result.matched_count > 0:
+        logger.info(f"Added mirror {mirror_entry.get('message_id')} to message group of {source_message_id} in group: {group_name}")
+        return True
+    return False
+
+def set_message_group_edited_at(group_name: str, source_message_id: str, edited_at: str):
+    """Record the edited_at of the last edit propagated to the mirrors, on the first entry of the group."""
+    if not type(source_message_id) is str:
+        source_message_id = str(source_message_id)
+
+    check_and_create_group_collection(group_name)
+    db[group_name].update_one(
+        {"messages.message_id": source_message_id},
+        {"$set": {"messages.0.edited_at": edited_at}},
+    )
+
 def set_user_avatar(user_id: str, emoji_avatar: str):
     """Set emoji avatar for a user."""
     if not type(user_id) is str:
@@ -189,6 +275,7 @@ def set_user_avatar(user_id: str, emoji_avatar: str):
         {"$set": {"user_id": user_id, "emoji_avatar": emoji_avatar}},
         upsert=True
     )
+    _bump_avatars_version()
     
     if result.upserted_id:
         logger.info(f"Created new avatar entry for user {user_id}: {emoji_avatar}")
@@ -221,12 +308,21 @@ def delete_user_avatar(user_id: str):
     result = collection.delete_one({"user_id": user_id})
     
     if result.deleted_count > 0:
+        _bump_avatars_version()
         logger.info(f"Deleted avatar for user {user_id}")
         return True
     else:
         logger.info(f"No avatar found to delete for user {user_id}")
         return False
 
+def _bump_avatars_version():
+    db[config.AVATAR_COLLECTION_NAME].update_one({"_id": AVATARS_VERSION_DOC_ID}, {"$inc": {"version": 1}}, upsert=True)
+
+def load_avatars_version() -> int:
+    """Return the avatar change counter; it changes whenever any user's avatar is set or removed."""
+    document = db[config.AVATAR_COLLECTION_NAME].find_one({"_id": AVATARS_VERSION_DOC_ID})
+    return document["version"] if document else 0
+
 def _forum_thread_collection_name(group_name: str) -> str:
     return f"{group_name}_forum_threads"
 
@@ -244,13 +340,7 @@ def get_forum_thread_group_entry_by_thread_id(thread_id: str, group_name: str):
     collection_name = _forum_thread_collection_name(group_name)
     check_and_create_group_collection(collection_name)
     collection = db[collection_name]
-    result = collection.find_one({
-        "threads": {
-            "$elemMatch": {
-                "thread_id": thread_id
-            }
-        }
-    })
+    result = collection.find_one({"threads.thread_id": thread_id})
     if result:
         return result["threads"]
     else:
@@ -264,16 +354,119 @@ def delete_forum_thread_group_entry_by_thread_id(thread_id: str, group_name: str
     collection_name = _forum_thread_collection_name(group_name)
     check_and_create_group_collection(collection_name)
     collection = db[collection_name]
-    result = collection.delete_one({
-        "threads": {
-            "$elemMatch": {
-                "thread_id": thread_id
-            }
-        }
-    })
+    result = collection.delete_one({"threads.thread_id": thread_id})
     if result.deleted_count > 0:
         logger.info(f"Deleted forum thread group entry for thread ID: {thread_id} in group: {group_name}")
         return True
     else:
         logger.info(f"No forum thread entry found to delete for thread ID: {thread_id} in group: {group_name}")
         return False
+
+def heartbeat_instance(instance_id: str, lease_seconds: float):
+    """Record that a bot instance is alive for the next lease_seconds."""
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+    db[config.INSTANCES_COLLECTION_NAME].update_one(
+        {"_id": instance_id},
+        {"$set": {"expires_at": expires_at}},
+        upsert=True,
+    )
+
+def load_live_instance_ids():
+    """Return the IDs of bot instances whose heartbeat has not expired."""
+    now = datetime.now(timezone.utc)
+    return [document["_id"] for document in db[config.INSTANCES_COLLECTION_NAME].find({"expires_at": {"$gt": now}}, {"_id": 1})]
+
+def acquire_group_lease(group_name: str, instance_id: str, lease_seconds: float) -> bool:
+    """Take or renew the lease on a link group. Fails while another instance holds an unexpired lease."""
+    now = datetime.now(timezone.utc)
+    try:
+        db[config.GROUP_LEASES_COLLECTION_NAME].update_one(
+            {"_id": group_name, "$or": [{"owner": instance_id}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": instance_id, "expires_at": now + timedelta(seconds=lease_seconds)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The lease document exists and belongs to a live instance, so the upsert collided.
+        return False
+    return True
+
+def release_group_lease(group_name: str, instance_id: str):
+    """Expire a lease held by instance_id so another instance can take it immediately."""
+    db[config.GROUP_LEASES_COLLECTION_NAME].update_one(
+        {"_id": group_name, "owner": instance_id},
+        {"$set": {"expires_at": datetime.now(timezone.utc)}},
+    )
+
+def release_instance(instance_id: str):
+    """Expire every lease held by an instance and remove its heartbeat."""
+    db[config.GROUP_LEASES_COLLECTION_NAME].update_many(
+        {"owner": instance_id},
+        {"$set": {"expires_at": datetime.now(timezone.utc)}},
+    )
+    db[config.INSTANCES_COLLECTION_NAME].delete_one({"_id": instance_id})
+    logger.info(f"Released all group leases of instance {instance_id}")
+
+def ensure_outbox_indexes(done_ttl_seconds: float):
+    """Index pending jobs by owner and let MongoDB expire finished ones."""
+    collection = db[config.OUTBOX_COLLECTION_NAME]
+    collection.create_index([("done_at", 1), ("instance_id", 1)], name="pending_by_instance")
+    try:
+        collection.create_index("done_at", name="done_ttl", expireAfterSeconds=int(done_ttl_seconds))
+    except OperationFailure as e:
+        if e.code != 85:  # IndexOptionsConflict: OUTBOX_DONE_TTL_SECONDS changed since the index was built
+            raise
+        db.command("collMod", config.OUTBOX_COLLECTION_NAME, index={"name": "done_ttl", "expireAfterSeconds": int(done_ttl_seconds)})
+        logger.info(f"Changed the outbox TTL to {int(done_ttl_seconds)}s")
+
+def append_outbox_jobs(jobs: list):
+    """Insert mirror jobs in one round trip. Jobs that are already recorded are left as they are."""
+    if not jobs:
+        return 0
+    try:
+        result = db[config.OUTBOX_COLLECTION_NAME].insert_many(jobs, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        # Duplicate keys are resumed jobs that were recorded again; anything else is a real failure.
+        errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+        if errors:
+            raise
+        return e.details.get("nInserted", 0)
+
+def mark_outbox_jobs_done(job_ids: list):
+    """Mark mirror jobs finished in one round trip; the TTL index removes them later."""
+    if not job_ids:
+        return 0
+    result = db[config.OUTBOX_COLLECTION_NAME].update_many(
+        {"_id": {"$in": list(job_ids)}},
+        {"$set": {"done_at": datetime.now(timezone.utc)}},
+    )
+    return result.modified_count
+
+def load_orphaned_outbox_jobs(instance_id: str, live_instance_ids: list, started_at: datetime, retry_before: datetime, limit: int):
+    """
+    Unfinished jobs of instances that are gone, of this instance from before it (re)started, jobs
+    this instance claimed before retry_before without finishing them, and jobs recorded without an
+    owner before retry_before.
+    """
+    return list(
+        db[config.OUTBOX_COLLECTION_NAME]
+        .find({
+            "done_at": None,
+            "$or": [
+                {"instance_id": {"$nin": list(live_instance_ids) + [None]}},
+                {"instance_id": None, "created_at": {"$lt": retry_before}},
+                {"instance_id": instance_id, "claimed_at": None, "created_at": {"$lt": started_at}},
+                {"instance_id": instance_id, "claimed_at": {"$lt": retry_before}},
+            ],
+        })
+        .sort("created_at", 1)
+        .limit(limit)
+    )
+
+def claim_outbox_job(job_id: str, previous_instance_id: str, previous_claimed_at, instance_id: str) -> bool:
+    """Take over an unfinished job unless it was claimed since it was loaded."""
+    result = db[config.OUTBOX_COLLECTION_NAME].update_one(
+        {"_id": job_id, "instance_id": previous_instance_id, "claimed_at": previous_claimed_at, "done_at": None},
+        {"$set": {"instance_id": instance_id, "claimed_at": datetime.now(timezone.utc)}, "$inc": {"attempts": 1}},
+    )
+    return result.modified_count == 1
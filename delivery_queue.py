@@ -0,0 +1,170 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+import config
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# (target_channel_id, source_thread_id). A source thread maps to exactly one thread per
+# destination channel, so keying by the source thread orders deliveries per destination
+# thread without having to resolve the target thread before reserving a place in line.
+DestinationKey = Tuple[str, Optional[str]]
+
+T = TypeVar("T")
+
+
+def destination_key(channel_id, thread_id=None) -> DestinationKey:
+    return str(channel_id), str(thread_id) if thread_id else None
+
+
+class DeliveryTurn:
+    """A reserved place in a destination queue."""
+
+    __slots__ = ("key", "reserved_at", "granted", "done", "used")
+
+    def __init__(self, key: DestinationKey):
+        self.key = key
+        self.reserved_at = time.monotonic()
+        self.granted = asyncio.Event()
+        self.done = asyncio.Event()
+        self.used = False
+
+
+class DeliveryQueues:
+    """
+    Per-destination FIFO queues with one worker task per destination.
+
+    A handler reserves its turns synchronously once the payload is prepared (header rendered,
+    attachments downloaded), so a slow download only delays its own message, and deliveries to a
+    destination happen in the order messages became ready. The worker grants one turn at a time
+    and waits for it to finish; different destinations run in parallel.
+    """
+
+    def __init__(self, idle_timeout: float, depth_warning: int):
+        self.idle_timeout = idle_timeout
+        self.depth_warning = depth_warning
+        self._queues: Dict[DestinationKey, asyncio.Queue] = {}
+        self._workers: Dict[DestinationKey, asyncio.Task] = {}
+        self._stats: Dict[DestinationKey, Dict[str, float]] = {}
+
+    def reserve(self, channel_id, thread_id=None) -> DeliveryTurn:
+        key = destination_key(channel_id, thread_id)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+        turn = DeliveryTurn(key)
+        queue.put_nowait(turn)
+
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            self._workers[key] = asyncio.create_task(self._worker(key, queue), name=f"delivery:{key[0]}:{key[1] or 'root'}")
+
+        depth = queue.qsize()
+        if depth >= self.depth_warning:
+            logger.warning(f"Delivery queue for {key} is backing up: {depth} pending")
+        return turn
+
+    def open_dispatch(self, channel_ids: Iterable[str] = (), thread_id=None) -> "Dispatch":
+        """Start the dispatch of one source message, reserving a turn in the given destination queues."""
+        dispatch = Dispatch(self, {})
+        dispatch.reserve(channel_ids, thread_id)
+        return dispatch
+
+    async def _worker(self, key: DestinationKey, queue: asyncio.Queue):
+        stats = self._stats.setdefault(key, {"delivered": 0, "skipped": 0, "total_wait": 0.0, "max_wait": 0.0})
+        while True:
+            try:
+                turn = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    self._queues.pop(key, None)
+                    self._workers.pop(key, None)
+                    return
+                continue
+
+            if turn.done.is_set():
+                # Released without being used (no delivery needed, or the handler was cancelled).
+                stats["skipped"] += 1
+                continue
+
+            wait = time.monotonic() - turn.reserved_at
+            turn.granted.set()
+            await turn.done.wait()
+
+            if not turn.used:
+                stats["skipped"] += 1
+                continue
+            stats["delivered"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+
+    def stats(self) -> Dict[DestinationKey, Dict[str, float]]:
+        """Queue depth and wait-time counters per destination."""
+        snapshot = {}
+        for key, stats in self._stats.items():
+            queue = self._queues.get(key)
+            delivered = stats["delivered"]
+            snapshot[key] = {
+                "depth": queue.qsize() if queue else 0,
+                "delivered": delivered,
+                "skipped": stats["skipped"],
+                "avg_wait": stats["total_wait"] / delivered if delivered else 0.0,
+                "max_wait": stats["max_wait"],
+            }
+        return snapshot
+
+
+class Dispatch:
+    """The turns reserved for one source message across its destinations."""
+
+    def __init__(self, queues: DeliveryQueues, turns: Dict[DestinationKey, DeliveryTurn]):
+        self._queues = queues
+        self._turns = turns
+
+    def reserve(self, channel_ids: Iterable[str], thread_id=None):
+        """Take a place in line at every destination that has none yet; call once the payload is ready."""
+        for channel_id in channel_ids:
+            key = destination_key(channel_id, thread_id)
+            if key not in self._turns:
+                self._turns[key] = self._queues.reserve(channel_id, thread_id)
+
+    def release(self, channel_id, thread_id=None):
+        """Give up an unused turn, so later messages to the destination do not wait for it."""
+        turn = self._turns.pop(destination_key(channel_id, thread_id), None)
+        if turn is not None:
+            turn.done.set()
+
+    def delivering(self, deliver: Callable[[T], Awaitable], thread_id=None, channel_of: Callable[[T], str] = str) -> Callable[[T], Awaitable]:
+        """Wrap a fan_out deliver(target) so the target's turn is released as soon as it returns, used or not."""
+        async def wrapped(target: T):
+            try:
+                return await deliver(target)
+            finally:
+                self.release(channel_of(target), thread_id)
+        return wrapped
+
+    @asynccontextmanager
+    async def turn(self, channel_id, thread_id=None):
+        """Wait for this message's turn at a destination and hold it for the delivery."""
+        key = destination_key(channel_id, thread_id)
+        turn = self._turns.pop(key, None)
+        if turn is None:
+            # Destination was not known when the message arrived; queue behind what is already there.
+            turn = self._queues.reserve(*key)
+        try:
+            await turn.granted.wait()
+            turn.used = True
+            yield
+        finally:
+            turn.done.set()
+
+    def close(self):
+        """Release turns that were reserved but not used."""
+        for turn in self._turns.values():
+            turn.done.set()
+        self._turns.clear()
+
+
+delivery_queues = DeliveryQueues(config.DELIVERY_QUEUE_IDLE_SECONDS, config.DELIVERY_QUEUE_DEPTH_WARNING)
@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+import aiohttp
+import discord
+import config
+import async_database
+import helpers
+from sender_pool import SenderError
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    True for failures worth retrying: 5xx and 429 responses, and connections that could not be
+    opened. Timeouts and connections dropped mid-request are not retried, since the message may
+    have been delivered anyway and a retry would mirror it twice.
+    """
+    if isinstance(error, (discord.HTTPException, SenderError)):
+        status = error.status
+        if status is None:
+            return isinstance(error, SenderError) and error.connection_error
+        return status == 429 or status >= 500
+    return isinstance(error, aiohttp.ClientConnectorError)
+
+
+class RetryJob:
+    __slots__ = ("group_name", "source_message_id", "destination", "send", "entry", "attachments", "created_at", "attempts", "sent")
+
+    def __init__(self, group_name: str, source_message_id: str, destination: str, send: Callable[[], Awaitable], entry: dict, attachments):
+        self.group_name = group_name
+        self.source_message_id = source_message_id
+        self.destination = destination
+        self.send = send
+        self.entry = entry
+        self.attachments = attachments
+        self.created_at = time.monotonic()
+        self.attempts = 0
+        self.sent = False
+
+
+class DeliveryRetryQueue:
+    """
+    Re-sends mirrored messages that failed with a transient error.
+
+    Jobs are retried with jittered exponential backoff until they succeed or are older than
+    max_age. Once a retry is delivered, the mirror is appended to the message group document of
+    the source message, so edits, deletes and replies reach it like any other mirror. A retry
+    that is sent before the document is saved keeps retrying only the mapping update.
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, max_age: float, max_pending: int):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self._heap: List[Tuple[float, int, RetryJob]] = []
+        self._order = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stats = {"scheduled": 0, "delivered": 0, "expired": 0, "dropped": 0}
+
+    def schedule(self, error: BaseException, group_name: str, source_message_id, destination, send: Callable[[], Awaitable], entry: dict, attachments=None) -> bool:
+        """
+        Queue send() for another attempt if error is transient.
+
+        send() must build a fresh payload on every call and return the sent message; entry is the
+        mirror mapping without its message_id. Returns False when the failure is not retried.
+        """
+        if not is_transient(error):
+            return False
+        if len(self._heap) >= self.max_pending:
+            self._stats["dropped"] += 1
+            logger.warning(f"Retry queue full ({self.max_pending}), dropping delivery of {source_message_id} to {destination}")
+            return False
+
+        if attachments is not None:
+            attachments.retain()
+        job = RetryJob(group_name, str(source_message_id), str(destination), send, entry, attachments)
+        self._stats["scheduled"] += 1
+        self._push(job, self._backoff(job, error))
+        logger.info(f"Delivery of {job.source_message_id} to {job.destination} failed ({error}), retrying")
+        return True
+
+    def _backoff(self, job: RetryJob, error: Optional[BaseException] = None) -> float:
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            return float(retry_after)
+        delay = min(self.max_delay, self.base_delay * (2 ** job.attempts))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _push(self, job: RetryJob, delay: float):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._order), job))
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run(), name="delivery-retries")
+        self._wakeup.set()
+
+    async def _run(self):
+        while self._heap:
+            due_at, _, job = self._heap[0]
+            delay = due_at - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            asyncio.create_task(self._attempt(job))
+
+    async def _attempt(self, job: RetryJob):
+        job.attempts += 1
+        error = None
+        try:
+            if not job.sent:
+                result = await job.send()
+                helpers.set_mirror_message(job.entry, result)
+                job.sent = True
+                logger.info(f"Delivered {job.source_message_id} to {job.destination} after {job.attempts} retries")
+            if await async_database.append_message_group_mirror(job.group_name, job.source_message_id, job.entry):
+                self._stats["delivered"] += 1
+                self._finish(job)
+                return
+            logger.debug(f"Mapping for {job.source_message_id} not saved yet, retrying the update")
+        except Exception as e:
+            if not job.sent and not is_transient(e):
+                logger.error(f"Retry of {job.source_message_id} to {job.destination} failed permanently: {e}")
+                self._finish(job)
+                return
+            error = e
+
+        if time.monotonic() - job.created_at + self._backoff(job) > self.max_age:
+            self._stats["expired"] += 1
+            what = "mapping update" if job.sent else "delivery"
+            logger.error(f"Giving up {what} of {job.source_message_id} to {job.destination} after {job.attempts} retries: {error}")
+            self._finish(job)
+            return
+        self._push(job, self._backoff(job, error))
+
+    def _finish(self, job: RetryJob):
+        if job.attachments is not None:
+            job.attachments.close()
+            job.attachments = None
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def stats(self) -> dict:
+        return {"pending": self.pending(), **self._stats}
+
+    async def stop(self):
+        """Drop pending retries and release their attachments."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._heap:
+            logger.warning(f"Dropping {len(self._heap)} pending delivery retries on shutdown")
+        for _, _, job in self._heap:
+            self._finish(job)
+        self._heap.clear()
+
+
+delivery_retries = DeliveryRetryQueue(
+    config.DELIVERY_RETRY_BASE_SECONDS,
+    config.DELIVERY_RETRY_MAX_DELAY_SECONDS,
+    config.DELIVERY_RETRY_MAX_AGE_SECONDS,
+    config.DELIVERY_RETRY_MAX_PENDING,
+)
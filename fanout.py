@@ -0,0 +1,26 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, TypeVar
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+async def fan_out(targets: List[T], deliver: Callable[[T], Awaitable[Optional[dict]]]) -> List[dict]:
+    """
+    Run deliver(target) for every destination concurrently.
+
+    Returns the non-empty results in target order, so they can be appended to a
+    message_group_entry. A failing destination is logged and skipped without
+    affecting the others.
+    """
+    results = await asyncio.gather(*(deliver(target) for target in targets), return_exceptions=True)
+    entries = []
+    for target, result in zip(targets, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Delivery to {target} failed: {result}", exc_info=result)
+            continue
+        if result is not None:
+            entries.append(result)
+    return entries
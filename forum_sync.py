@@ -2,8 +2,12 @@ import time
 from datetime import timezone
 import discord
 import helpers
-import database
+from attachments import AttachmentFanout
+from fanout import fan_out
+import async_database
 from header_state import header_state
+from group_leases import group_leases
+from outbound import outbound, CREATE_THREAD, DELETE_CHANNEL, EDIT_CHANNEL
 from logger_config import get_logger
 
 logger = get_logger(__name__)
@@ -58,7 +62,7 @@ class ForumSync:
             return
 
         group_name = helpers.get_group_name(parent_channel_id)
-        if not group_name:
+        if not group_name or not group_leases.owns(group_name):
             return
 
         starter_message = await self._fetch_starter_message(thread)
@@ -76,31 +80,33 @@ class ForumSync:
         source_guild_id = str(starter_message.guild.id) if starter_message.guild else "unknown"
         header_state.update_group_source(group_name, source_guild_id)
 
-        for target_channel_id in target_channel_ids:
+        header = await helpers.form_header(starter_message, starter_message.guild.name if starter_message.guild else "Unknown Guild", len(target_channel_ids))
+        attachments = await AttachmentFanout.from_message(starter_message)
+
+        async def create_in(target_channel_id: str):
             target_forum = await self._resolve_forum_channel(target_channel_id)
             if not target_forum:
                 logger.warning("Target forum channel %s not found", target_channel_id)
-                continue
+                return None
             if not isinstance(target_forum, discord.ForumChannel) and getattr(target_forum, "type", None) != discord.ChannelType.forum:
                 logger.warning("Target channel %s is not a forum channel", target_channel_id)
-                continue
+                return None
 
             try:
-                files, stickers = await self._build_files_and_stickers(starter_message)
+                files, stickers = await self._build_files_and_stickers(starter_message, attachments)
                 content = starter_message.content or ""
-                header = helpers.form_header(starter_message, starter_message.guild.name if starter_message.guild else "Unknown Guild", len(target_channel_ids))
                 body = helpers.form_message_text(header, content)
                 embeds = starter_message.embeds if starter_message.embeds else None
                 applied_tags = self._map_tags_by_name(thread.applied_tags, target_forum)
 
-                result = await target_forum.create_thread(
+                result = await outbound.submit(CREATE_THREAD, target_forum.id, lambda: target_forum.create_thread(
                     name=thread.name,
                     content=body if body else None,
                     files=files or [],
                     embeds=embeds or [],
                     stickers=stickers or [],
                     applied_tags=applied_tags or []
-                )
+                ))
                 target_thread = getattr(result, "thread", result)
                 target_message = getattr(result, "message", None)
                 starter_message_id = str(target_message.id) if target_message else None
@@ -117,18 +123,21 @@ class ForumSync:
                     source_guild_id=source_guild_id,
                     timestamp=starter_message.created_at,
                 )
-                thread_group_entry.append({
+                return {
                     "guild_id": helpers.get_guild_id_from_channel_id(target_channel_id),
                     "channel_id": target_channel_id,
                     "thread_id": str(target_thread.id),
                     "starter_message_id": starter_message_id
-                })
+                }
             except Exception as exc:
                 logger.error("Failed to create synced forum thread in %s: %s", target_channel_id, exc)
 
+        thread_group_entry += await fan_out(target_channel_ids, create_in)
+        attachments.close()
+
         if len(thread_group_entry) > 1:
             try:
-                database.save_forum_thread_group_entry(group_name, thread_group_entry)
+                await async_database.save_forum_thread_group_entry(group_name, thread_group_entry)
                 logger.info("Saved forum thread mapping for thread %s", thread.id)
             except Exception as exc:
                 logger.error("Failed to save forum thread mapping: %s", exc)
@@ -138,13 +147,15 @@ class ForumSync:
                     "channel_id": entry["channel_id"],
                     "thread_id": entry["thread_id"],
                     "message_id": entry.get("starter_message_id"),
+                    # Forum starters are always posted with a header.
+                    "has_header": True,
                 }
                 for entry in thread_group_entry
                 if entry.get("starter_message_id")
             ]
             if starter_message_entry:
                 try:
-                    database.save_message_group_entry(group_name, starter_message_entry)
+                    await async_database.save_message_group_entry(group_name, starter_message_entry)
                 except Exception as exc:
                     logger.error("Failed to save forum starter message mapping: %s", exc)
 
@@ -163,10 +174,10 @@ class ForumSync:
 
         parent_channel_id = str(after.parent_id)
         group_name = helpers.get_group_name(parent_channel_id)
-        if not group_name:
+        if not group_name or not group_leases.owns(group_name):
             return
 
-        thread_entry = database.get_forum_thread_group_entry_by_thread_id(str(after.id), group_name)
+        thread_entry = await async_database.get_forum_thread_group_entry_by_thread_id(str(after.id), group_name)
         if not thread_entry:
             return
 
@@ -193,7 +204,7 @@ class ForumSync:
 
             try:
                 self._mark_ignore(target_thread.id)
-                await target_thread.edit(**kwargs)
+                await outbound.submit(EDIT_CHANNEL, target_thread.id, lambda: target_thread.edit(**kwargs), destination_id=entry["channel_id"])
             except Exception as exc:
                 logger.error("Failed to update forum thread %s: %s", entry["thread_id"], exc)
 
@@ -205,10 +216,10 @@ class ForumSync:
 
         parent_channel_id = str(thread.parent_id)
         group_name = helpers.get_group_name(parent_channel_id)
-        if not group_name:
+        if not group_name or not group_leases.owns(group_name):
             return
 
-        thread_entry = database.get_forum_thread_group_entry_by_thread_id(str(thread.id), group_name)
+        thread_entry = await async_database.get_forum_thread_group_entry_by_thread_id(str(thread.id), group_name)
         if not thread_entry:
             return
 
@@ -220,12 +231,12 @@ class ForumSync:
                 continue
             try:
                 self._mark_ignore(target_thread.id)
-                await target_thread.delete()
+                await outbound.submit(DELETE_CHANNEL, target_thread.id, target_thread.delete, destination_id=entry["channel_id"])
             except Exception as exc:
                 logger.error("Failed to delete synced forum thread %s: %s", entry["thread_id"], exc)
 
         try:
-            database.delete_forum_thread_group_entry_by_thread_id(str(thread.id), group_name)
+            await async_database.delete_forum_thread_group_entry_by_thread_id(str(thread.id), group_name)
         except Exception as exc:
             logger.error("Failed to remove forum thread mapping for %s: %s", thread.id, exc)
 
@@ -257,8 +268,8 @@ class ForumSync:
         except Exception:
             return None
 
-    async def _build_files_and_stickers(self, message: discord.Message):
-        files = await helpers.process_attachments(message)
+    async def _build_files_and_stickers(self, message: discord.Message, attachments: AttachmentFanout):
+        files = attachments.files()
         global_stickers, guild_sticker_files = await helpers.process_stickers(message)
         files += guild_sticker_files
         return files, global_stickers
@@ -0,0 +1,128 @@
+import asyncio
+import math
+import time
+from typing import Dict, Optional
+import async_database
+import config
+import helpers
+from routing import routing_index
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# Lease that decides which instance answers slash commands.
+COMMANDS_LEASE = "__commands__"
+
+
+class GroupLeaseManager:
+    """
+    Partitions link groups between bot instances through lease documents in MongoDB.
+
+    Every heartbeat the instance refreshes its presence, reloads the routing index and drops
+    cached avatars if they changed (another instance may have changed either), renews the
+    leases it keeps, releases the ones above its fair share and claims free or expired ones up
+    to that share. A lease only counts as owned locally until GROUP_LEASE_SECONDS after the
+    renewal started, so an instance that stops heartbeating stops mirroring before another one
+    can take over.
+
+    With multi-instance mode off, the instance owns everything.
+    """
+
+    def __init__(self, instance_id: str, enabled: bool, lease_seconds: float, heartbeat_seconds: float):
+        self.instance_id = instance_id
+        self.enabled = enabled
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._owned: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._linked_channels: Optional[dict] = None
+
+    def owns(self, group_name: Optional[str]) -> bool:
+        """Return True if this instance should mirror the group's events."""
+        if not self.enabled:
+            return True
+        expiry = self._owned.get(group_name)
+        return expiry is not None and time.monotonic() < expiry
+
+    def owns_commands(self) -> bool:
+        return self.owns(COMMANDS_LEASE)
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        logger.info(f"Multi-instance mode: instance {self.instance_id} starting group lease heartbeat")
+        self._task = asyncio.create_task(self._run(), name="group-leases")
+
+    async def stop(self):
+        """Stop heartbeating and hand every lease over to the other instances."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._owned.clear()
+        try:
+            await async_database.release_instance(self.instance_id)
+        except Exception as e:
+            logger.error(f"Failed to release group leases of instance {self.instance_id}: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error(f"Group lease heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    async def rebalance(self):
+        started = time.monotonic()
+        await async_database.heartbeat_instance(self.instance_id, self.lease_seconds)
+        linked_channels = await async_database.load_linked_channel_groups_state()
+        if linked_channels != self._linked_channels:
+            routing_index.rebuild(linked_channels)
+            self._linked_channels = linked_channels
+        # Only the commands lease holder runs /set_my_avatar and /remove_my_avatar.
+        await helpers.sync_avatar_cache()
+
+        group_names = sorted(routing_index.get_group_names())
+        live_instances = set(await async_database.load_live_instance_ids()) | {self.instance_id}
+        fair_share = math.ceil(len(group_names) / len(live_instances))
+
+        owned = [group_name for group_name in group_names if group_name in self._owned]
+        surplus = owned[fair_share:] + [group_name for group_name in self._owned if group_name not in group_names and group_name != COMMANDS_LEASE]
+        for group_name in surplus:
+            self._owned.pop(group_name, None)
+            await async_database.release_group_lease(group_name, self.instance_id)
+            logger.info(f"Released lease on group {group_name}")
+
+        candidates = [COMMANDS_LEASE] + owned[:fair_share] + [group_name for group_name in group_names if group_name not in self._owned]
+        held = 0
+        for group_name in candidates:
+            is_group = group_name != COMMANDS_LEASE
+            if is_group and held >= fair_share:
+                break
+            was_owned = group_name in self._owned
+            if await async_database.acquire_group_lease(group_name, self.instance_id, self.lease_seconds):
+                self._owned[group_name] = started + self.lease_seconds
+                held += is_group
+                if not was_owned:
+                    logger.info(f"Acquired lease on {group_name}")
+            elif was_owned:
+                self._owned.pop(group_name, None)
+                logger.warning(f"Lost lease on {group_name} to another instance")
+
+        logger.debug(
+            f"Group leases: {held}/{len(group_names)} groups owned, fair share {fair_share}, "
+            f"{len(live_instances)} live instances"
+        )
+
+
+group_leases = GroupLeaseManager(
+    config.INSTANCE_ID,
+    config.MULTI_INSTANCE_MODE,
+    config.GROUP_LEASE_SECONDS,
+    config.GROUP_LEASE_HEARTBEAT_SECONDS,
+)
@@ -1,4 +1,3 @@
-import asyncio
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Optional
 
@@ -10,24 +9,17 @@ DEFAULT_IDLE_TIMEOUT = timedelta(minutes=5)
 
 
 class HeaderState:
-    """Manages per-destination header decisions and serialization."""
+    """Manages per-destination header decisions. Serialization is handled by delivery_queue."""
 
     def __init__(self, idle_timeout: timedelta = DEFAULT_IDLE_TIMEOUT):
         self.idle_timeout = idle_timeout
         self._state: Dict[str, Dict[str, object]] = {}
-        self._locks: Dict[str, asyncio.Lock] = {}
         self._group_versions: Dict[str, Dict[str, object]] = {}
 
     def _dest_key(self, group_name: str, channel_id: str, thread_id: Optional[str]) -> str:
         thread_part = thread_id or "root"
         return f"{group_name}:{channel_id}:{thread_part}"
 
-    def get_lock(self, group_name: str, channel_id: str, thread_id: Optional[str]) -> asyncio.Lock:
-        key = self._dest_key(group_name, channel_id, thread_id)
-        if key not in self._locks:
-            self._locks[key] = asyncio.Lock()
-        return self._locks[key]
-
     def decide_header(
         self,
         group_name: str,
@@ -1,5 +1,4 @@
 import io
-import aiohttp
 from roles import SuperAdmin, Admin, Registrator
 import config
 import emoji
@@ -7,6 +6,18 @@ from header_state import HEADER_MARKER
 import discord
 import random
 import database
+import async_database
+from routing import routing_index
+from sticker_cache import sticker_cache
+from ttl_cache import TTLCache
+from name_sanitizer import sanitize_display_name
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+_avatar_cache = TTLCache(config.AVATAR_CACHE_SIZE, config.AVATAR_CACHE_TTL_SECONDS)
+# Last avatar change counter seen by sync_avatar_cache().
+_avatars_version = None
 
 ROLE_CLASSES = {
     "superadmins": SuperAdmin,
@@ -66,47 +77,115 @@ def remove_registrator(user_id: str, guild_id: str, file_path="roles.json"):
 # These functions help with linked channels, group names, and guild/channel lookups.
 
 def find_linked_channels(channel_id: str, file_path="linked_channels.json"):
-    linked_channels = load_linked_channels(file_path)
-
     # Return the remaining channel IDs in the group without mutating persisted state.
-    for group in linked_channels["groups"]:
-        if channel_id in group["channel_list"]:
-            return [linked_channel_id for linked_channel_id in group["channel_list"] if linked_channel_id != channel_id]
-
-    return None
+    return routing_index.find_linked_channels(channel_id)
 
 def get_group_name(channel_id: str, file_path="linked_channels.json"):
-    linked_channels = load_linked_channels(file_path)
     # Return the group name for the given channel_id
-    for group in linked_channels["groups"]:
-        if channel_id in group["channel_list"]:
-            return group["group_name"]
-    return None
+    return routing_index.get_group_name(channel_id)
 
 def get_guild_id_from_channel_id(channel_id: str, file_path="linked_channels.json"):
-    linked_channels = load_linked_channels(file_path)
     # Return the guild_id for the given channel_id
-    for group in linked_channels["groups"]:
-        if channel_id in group["channel_list"]:
-            for entry in group["links"]:
-                if entry["channel_id"] == channel_id:
-                    return entry["guild_id"]
-    return None
+    return routing_index.get_guild_id(channel_id)
 
 async def get_or_create_webhook(target_channel):
-    # Get or create a webhook in the target channel with the bot's avatar
+    """Find the bridge webhook of a text or forum channel, creating it if missing. Always asks the API; cache the result."""
     webhooks = await target_channel.webhooks()
-    webhook = next((wh for wh in webhooks if wh.name == config.WEBHOOK_NAME), None)
+    bot_member = target_channel.guild.me
+    webhook = next(
+        (
+            wh for wh in webhooks
+            if wh.name == config.WEBHOOK_NAME and wh.token
+            and (wh.user is None or bot_member is None or wh.user.id == bot_member.id)
+        ),
+        None,
+    )
     if not webhook:
-        with open(config.AVATAR_PATH, "rb") as avatar_file:
-            avatar_data = avatar_file.read()
-            webhook = await target_channel.create_webhook(
-                name=config.WEBHOOK_NAME,
-                avatar=avatar_data
-            )
-        print(f"Created webhook in {target_channel.name} with ID {webhook.id}")
+        avatar_data = None
+        if config.AVATAR_PATH:
+            with open(config.AVATAR_PATH, "rb") as avatar_file:
+                avatar_data = avatar_file.read()
+        webhook = await target_channel.create_webhook(name=config.WEBHOOK_NAME, avatar=avatar_data)
+        logger.info(f"Created webhook in {target_channel.name} with ID {webhook.id}")
     return webhook
 
+def set_mirror_message(entry: dict, result):
+    """Record the sent mirror in its mapping entry; webhook mirrors also keep the webhook that owns them."""
+    entry["message_id"] = str(result.id)
+    webhook_id = getattr(result, "webhook_id", None)
+    if webhook_id:
+        entry["webhook_id"] = str(webhook_id)
+    return entry
+
+async def record_mirror(group_name: str, source_message_id, entry: dict):
+    """Add a delivered mirror to the message group entry of its source message, saved before the fan-out."""
+    try:
+        if not await async_database.append_message_group_mirror(group_name, source_message_id, entry):
+            logger.error(f"No message group entry for message {source_message_id} in group {group_name}, mirror {entry['message_id']} is not mapped")
+    except Exception as e:
+        logger.error(f"Failed to map mirror {entry['message_id']} of message {source_message_id}: {e}")
+
+def unmirrored(targets, saved_entry, channel_of=str) -> list:
+    """
+    The targets still to be mirrored to. saved_entry is the message group entry of a resumed message
+    (None for a new one); targets whose channel already has a mirror in it are left out.
+    """
+    if not saved_entry:
+        return list(targets)
+    mirrored = {entry["channel_id"] for entry in saved_entry[1:]}
+    return [target for target in targets if channel_of(target) not in mirrored]
+
+async def resolve_bridged_channel(bot, guild_id, channel_id):
+    """
+    Return the channel or thread for raw event IDs if it, or its parent, is linked.
+
+    The cache is tried first and the API is only asked in guilds that have linked channels,
+    so events from unrelated channels cost no REST calls. Returns None otherwise.
+    """
+    if get_group_name(str(channel_id)):
+        return bot.get_channel(int(channel_id)) or bot.get_partial_messageable(int(channel_id), guild_id=guild_id)
+    if not guild_id or not routing_index.has_guild(str(guild_id)):
+        return None
+
+    channel = bot.get_channel(int(channel_id))
+    if channel is None:
+        try:
+            channel = await bot.fetch_channel(int(channel_id))
+        except discord.HTTPException:
+            return None
+    if isinstance(channel, discord.Thread) and get_group_name(str(channel.parent_id)):
+        return channel
+    return None
+
+def may_be_bridged(bot, guild_id, channel_id) -> bool:
+    """
+    Cache-only pre-check for raw events: False when the channel is certainly not linked nor a
+    thread of a linked channel. Uncached channels in guilds with links count as possibly bridged.
+    """
+    if get_group_name(str(channel_id)):
+        return True
+    if not guild_id or not routing_index.has_guild(str(guild_id)):
+        return False
+    channel = bot.get_channel(int(channel_id))
+    if channel is None:
+        return True
+    return isinstance(channel, discord.Thread) and bool(get_group_name(str(channel.parent_id)))
+
+def get_source_group_name(channel):
+    """Return the group of a channel, or of its parent channel if it is a thread."""
+    if isinstance(channel, discord.Thread):
+        return get_group_name(str(channel.parent_id))
+    return get_group_name(str(channel.id))
+
+def get_mirror_thread_id(entry: dict):
+    """
+    Return the thread channel ID of a thread message mapping entry.
+
+    Entries saved before thread_channel_id was recorded fall back to thread_id, the
+    parent message ID, which Discord reuses as the ID of a thread started from it.
+    """
+    return entry.get("thread_channel_id") or entry.get("thread_id")
+
 def get_channel_invite_url(channel_id: str, file_path="linked_channels.json") -> str:
     # Look up the invite URL for a channel from linked_channels.json
     linked_channels = load_linked_channels(file_path)
@@ -116,20 +195,39 @@ def get_channel_invite_url(channel_id: str, file_path="linked_channels.json") ->
                 return link["invite_url"]
     return None
 
-def form_header(message: discord.Message, guild_name: str, channel_group_len: int) -> str:
-    user_name = message.author.display_name
-    # Remove emojis from user name for cleaner display
-    user_name = emoji.demojize(user_name)
-    # Remove emoji codes (pattern :emoji_name:) for cleaner display
-    import re
-    user_name = re.sub(r':[a-zA-Z0-9_+-]+:', '', user_name)
-    user_name = user_name.strip()  # Remove any extra whitespace
+async def get_cached_user_avatar(user_id: str):
+    """Return the user's avatar emoji, reading MongoDB only on a cache miss."""
+    cached = _avatar_cache.get(user_id)
+    if cached is not None:
+        return cached or None
+
+    user_avatar = await async_database.get_user_avatar(user_id)
+    # Cache "no avatar" as an empty string so users without one don't hit the database either.
+    _avatar_cache.set(user_id, user_avatar or "")
+    return user_avatar
+
+def invalidate_user_avatar(user_id: str):
+    """Drop a cached avatar after the user changes or removes it."""
+    _avatar_cache.pop(user_id)
+
+async def sync_avatar_cache():
+    """Clear the avatar cache if any instance changed an avatar since the last call."""
+    global _avatars_version
+    version = await async_database.load_avatars_version()
+    if _avatars_version is not None and version != _avatars_version:
+        logger.debug(f"Avatars changed (version {_avatars_version} -> {version}), clearing the avatar cache")
+        _avatar_cache.clear()
+    _avatars_version = version
+
+async def form_header(message: discord.Message, guild_name: str, channel_group_len: int) -> str:
+    # Remove emojis and emoji codes from user name for cleaner display
+    user_name = sanitize_display_name(message.author.display_name)
 
     user_id = message.author.id
     guild_id = message.guild.id
 
     # Get user's custom avatar emoji from database, or use random default from config
-    user_avatar = database.get_user_avatar(str(user_id))
+    user_avatar = await get_cached_user_avatar(str(user_id))
     if user_avatar:
         avatar_emoji = user_avatar
     else:
@@ -196,11 +294,6 @@ def validate_single_emoji(emoji_string: str) -> bool:
         )
         return bool(unicode_emoji_pattern.match(emoji_string))
 
-async def process_attachments(message: discord.Message):
-    """Convert message attachments to discord.File objects."""
-    files = [await f.to_file() for f in message.attachments]
-    return files
-
 async def process_stickers(message: discord.Message):
     """
     Process stickers:
@@ -213,25 +306,22 @@ async def process_stickers(message: discord.Message):
     if not message.stickers:
         return global_stickers, guild_sticker_files
 
-    async with aiohttp.ClientSession() as session:
-        for sticker_item in message.stickers:
-            # Only try to download guild-native static PNG stickers
-            if sticker_item.format == discord.StickerFormatType.png and message.guild:
-                try:
-                    sticker = await message.guild.fetch_sticker(sticker_item.id)
-                    if sticker.type == discord.StickerType.guild:
-                        async with session.get(sticker.url) as resp:
-                            if resp.status == 200:
-                                data = await resp.read()
-                                guild_sticker_files.append(
-                                    discord.File(io.BytesIO(data), filename=f"{sticker.name}.png")
-                                )
-                        continue  # Done, do not send as sticker
-                except Exception as e:
-                    print(f"Failed to fetch guild sticker {sticker_item.id}: {e}")
-                    continue
-
-            # Non-guild / global sticker → send as sticker
-            global_stickers.append(sticker_item)
+    for sticker_item in message.stickers:
+        # Only try to download guild-native static PNG stickers
+        if sticker_item.format == discord.StickerFormatType.png and message.guild:
+            try:
+                sticker = await sticker_cache.resolve(message.guild, sticker_item)
+                if sticker.is_guild:
+                    if sticker.data is not None:
+                        guild_sticker_files.append(
+                            discord.File(io.BytesIO(sticker.data), filename=f"{sticker.name}.png")
+                        )
+                    continue  # Done, do not send as sticker
+            except Exception as e:
+                print(f"Failed to fetch guild sticker {sticker_item.id}: {e}")
+                continue
+
+        # Non-guild / global sticker → send as sticker
+        global_stickers.append(sticker_item)
 
     return global_stickers, guild_sticker_files
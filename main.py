@@ -1,15 +1,27 @@
+import asyncio
+import signal
+import aiohttp
 from discord.ext import commands
 from discord import app_commands
 import discord
 import logging
+import config
 from config import TOKEN
 import commands as command_module
 import message_edit
 import message_delete
 import message_reaction
 import database
+import async_database
 from message_worker import MessageWorker
 import forum_sync
+from routing import routing_index
+from group_leases import group_leases
+from sticker_cache import sticker_cache
+from sender_pool import sender_pool
+from delivery_retry import delivery_retries
+from outbox import outbox
+from outbound import outbound
 from logger_config import setup_logging, get_logger
 
 # Setup logging before anything else
@@ -21,11 +33,48 @@ intents.message_content = True
 intents.guilds = True
 intents.messages = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+if config.LEAN_CACHE_MODE:
+    # Only the bot's own member is kept; authors arrive with every message and interaction.
+    member_cache_flags = discord.MemberCacheFlags.none()
+else:
+    member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+
+bot_options = dict(
+    command_prefix="!",
+    intents=intents,
+    # Feeds rate limit headers into the outbound scheduler's buckets.
+    http_trace=outbound.trace_config(),
+    max_messages=config.MESSAGE_CACHE_SIZE or None,
+    member_cache_flags=member_cache_flags,
+    chunk_guilds_at_startup=config.CHUNK_GUILDS_AT_STARTUP,
+)
+
+if config.AUTO_SHARD or config.SHARD_COUNT or config.SHARD_IDS:
+    if config.SHARD_IDS and not config.SHARD_COUNT:
+        raise ValueError("SHARD_IDS requires SHARD_COUNT")
+    if config.SHARD_IDS and len(config.SHARD_IDS) < config.SHARD_COUNT:
+        # Header state, forum sync and delivery queues live in this process only.
+        logger.warning(
+            f"Running shards {config.SHARD_IDS} of {config.SHARD_COUNT}; groups spanning guilds on "
+            f"shards served by other processes will not share header or delivery state"
+        )
+    bot = commands.AutoShardedBot(shard_count=config.SHARD_COUNT, shard_ids=config.SHARD_IDS, **bot_options)
+else:
+    bot = commands.Bot(**bot_options)
+logger.info(
+    f"Caches: lean={config.LEAN_CACHE_MODE} max_messages={config.MESSAGE_CACHE_SIZE or None} "
+    f"chunk_guilds_at_startup={config.CHUNK_GUILDS_AT_STARTUP}"
+)
 forum_sync_handler = forum_sync.setup(bot)
 message_worker = MessageWorker(bot, forum_sync_handler)
 
+# Sender processes fork here: before the event loop exists and before the first MongoDB call
+# starts pymongo's background threads.
+sender_pool.start(TOKEN)
+
 database.ensure_state_documents()
+database.warm_collection_registry()
+routing_index.refresh()
 
 @bot.event
 async def on_ready():
@@ -37,18 +86,34 @@ async def on_ready():
         logger.error(f"Error syncing slash commands: {e}")
         print("Error synchronizing slash commands:", e)
 
+@bot.event
+async def on_shard_ready(shard_id):
+    logger.info(f"Shard {shard_id} ready")
+
+@bot.event
+async def on_shard_resumed(shard_id):
+    logger.info(f"Shard {shard_id} resumed")
+
+@bot.event
+async def on_shard_disconnect(shard_id):
+    logger.warning(f"Shard {shard_id} disconnected")
+
 @bot.event
 async def on_message(message):
     await message_worker.process_message(message)
     await bot.process_commands(message)
 
 @bot.event
-async def on_message_edit(before, after):
-    await message_edit.handle_message_edit(bot, before, after)
+async def on_raw_message_edit(payload):
+    await message_edit.handle_message_edit(bot, payload)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    await message_delete.handle_message_delete(bot, payload)
 
 @bot.event
-async def on_message_delete(message):
-    await message_delete.handle_message_delete(bot, message)
+async def on_raw_bulk_message_delete(payload):
+    await message_delete.handle_bulk_message_delete(bot, payload)
 
 @bot.event
 async def on_raw_reaction_add(payload):
@@ -71,4 +136,40 @@ async def on_command_error(ctx, error):
 # Register commands
 command_module.setup(bot)
 
-bot.run(TOKEN)
+async def only_commands_owner(interaction: discord.Interaction) -> bool:
+    # Every instance receives the interaction; only the commands lease holder answers it.
+    return group_leases.owns_commands()
+
+bot.tree.interaction_check = only_commands_owner
+
+async def shutdown():
+    """Graceful stop (docker stop, rolling deploy): let in-flight mirror jobs finish, then disconnect."""
+    logger.info("SIGTERM received, shutting down")
+    await outbox.drain(config.SHUTDOWN_GRACE_SECONDS)
+    await bot.close()
+
+async def main():
+    # One long-lived HTTP session for non-Discord downloads (e.g. guild sticker images).
+    async with aiohttp.ClientSession() as http_session:
+        bot.http_session = http_session
+        sticker_cache.bind_session(http_session)
+        group_leases.start()
+        sender_pool.attach()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(shutdown()))
+        try:
+            async with bot:
+                outbox.start(bot, message_worker.process_message)
+                await bot.start(TOKEN)
+        finally:
+            await outbox.stop()
+            await delivery_retries.stop()
+            await sender_pool.stop()
+            await group_leases.stop()
+            # Last: the stops above still write through the executor.
+            async_database.shutdown()
+
+try:
+    asyncio.run(main())
+except KeyboardInterrupt:
+    logger.info("Shutting down")
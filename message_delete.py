@@ -1,31 +1,45 @@
+from typing import Dict, List, Tuple
 import discord
 import helpers
-import database
+import async_database
+from fanout import fan_out
+from group_leases import group_leases
+from outbound import outbound, BULK_DELETE_MESSAGES, DELETE_MESSAGE
+from circuit_breaker import is_dead_destination
+from webhook_pool import webhook_pool, UNKNOWN_WEBHOOK
 from logger_config import get_logger
 
 logger = get_logger(__name__)
 
-async def handle_message_delete(bot, message: discord.Message):
-    """Handles deleted messages and deletes all linked messages."""
-    
-    # Ignore deletions of messages from the bot itself
-    if message.author == bot.user:
-        return
-    
-    # Ignore deletions of messages from webhooks
-    if message.webhook_id:
+# Discord's bulk delete endpoint accepts at most this many messages per call.
+BULK_DELETE_BATCH_SIZE = 100
+
+async def handle_message_delete(bot, payload: discord.RawMessageDeleteEvent):
+    """Handles deleted messages and deletes all linked messages. Works without the message cache."""
+
+    channel = await helpers.resolve_bridged_channel(bot, payload.guild_id, payload.channel_id)
+    if channel is None or not group_leases.owns(helpers.get_source_group_name(channel)):
         return
 
-    logger.info(f"Handling message deletion from {message.author} in {message.guild.name}#{message.channel.name}")
-    
+    logger.debug(f"Handling deletion of message {payload.message_id} in channel {payload.channel_id}")
+
     # Check if the deleted message is in a thread
-    if isinstance(message.channel, discord.Thread):
-        if _is_forum_thread(message.channel):
-            await handle_forum_thread_message_delete(bot, message)
+    if isinstance(channel, discord.Thread):
+        if _is_forum_thread(channel):
+            await handle_forum_thread_message_delete(bot, channel, payload.message_id)
         else:
-            await handle_thread_message_delete(bot, message)
+            await handle_thread_message_delete(bot, channel, payload.message_id)
     else:
-        await handle_channel_message_delete(bot, message)
+        await handle_channel_message_delete(bot, channel, payload.message_id)
+
+def _is_source_message(message_entry: list, message_id: int) -> bool:
+    """Only deletions of the source propagate; mirrors (bot or webhook messages) are never the first entry."""
+    return message_entry[0]["message_id"] == str(message_id)
+
+async def _resolve_group_name(bot, guild_id, channel_id):
+    """Return the group of a channel, or of its parent if it is a thread."""
+    channel = await helpers.resolve_bridged_channel(bot, guild_id, channel_id)
+    return helpers.get_source_group_name(channel) if channel is not None else None
 
 def _is_forum_thread(thread: discord.Thread) -> bool:
     parent = thread.parent
@@ -35,10 +49,10 @@ def _is_forum_thread(thread: discord.Thread) -> bool:
         return True
     return getattr(parent, "type", None) == discord.ChannelType.forum
 
-async def handle_channel_message_delete(bot, message: discord.Message):
+async def handle_channel_message_delete(bot, channel, message_id: int):
     """Handles deleted messages in regular channels and deletes all linked messages."""
     
-    channel_id = str(message.channel.id)
+    channel_id = str(channel.id)
     target_channel_ids = helpers.find_linked_channels(channel_id)
     
     if target_channel_ids is None:
@@ -47,10 +61,13 @@ async def handle_channel_message_delete(bot, message: discord.Message):
     
     # Find the message group entry for the deleted message
     group_name = helpers.get_group_name(channel_id)
-    message_entry = database.get_message_group_entry_by_message_id(message.id, group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(message_id, group_name)
     
     if not message_entry:
-        logger.warning(f"No message group entry found for deleted message {message.id}")
+        logger.debug(f"No message group entry found for deleted message {message_id}")
+        return
+
+    if not _is_source_message(message_entry, message_id):
         return
     
     logger.info(f"Deleting linked messages in {len(target_channel_ids)} linked channels")
@@ -65,9 +82,9 @@ async def handle_channel_message_delete(bot, message: discord.Message):
         target_channel = bot.get_channel(int(entry["channel_id"]))
         if target_channel:
             try:
-                # Fetch the linked message and delete it
-                linked_message = await target_channel.fetch_message(int(entry["message_id"]))
-                await linked_message.delete()
+                # Delete the linked message through a partial handle, no fetch needed
+                linked_message = target_channel.get_partial_message(int(entry["message_id"]))
+                await _delete_mirror(bot, entry, linked_message)
                 deleted_count += 1
                 logger.debug(f"Deleted message in {target_channel.guild.name}#{target_channel.name}")
             except discord.NotFound:
@@ -81,17 +98,25 @@ async def handle_channel_message_delete(bot, message: discord.Message):
     
     # Remove the message group entry from the database
     try:
-        database.delete_message_group_entry_by_message_id(message.id, group_name)
-        logger.debug(f"Removed message group entry for deleted message {message.id}")
+        await async_database.delete_message_group_entry_by_message_id(message_id, group_name)
+        logger.debug(f"Removed message group entry for deleted message {message_id}")
     except Exception as e:
         logger.error(f"Failed to remove message group entry: {e}")
     
     logger.info(f"Successfully deleted {deleted_count} linked messages")
 
-async def handle_thread_message_delete(bot, message: discord.Message):
+async def _delete_mirror(bot, entry: dict, linked_message: discord.PartialMessage):
+    """Delete a mirror through its webhook when it has one, so Manage Messages is not needed."""
+    webhook = await webhook_pool.for_entry(bot, entry)
+    if webhook is not None:
+        await webhook_pool.delete_message(webhook, entry)
+        return
+    await outbound.submit(DELETE_MESSAGE, linked_message.channel.id, linked_message.delete, destination_id=entry["channel_id"])
+
+async def handle_thread_message_delete(bot, channel: discord.Thread, message_id: int):
     """Handles deleted messages in threads and deletes all linked messages."""
     
-    parent_channel_id = str(message.channel.parent_id)
+    parent_channel_id = str(channel.parent_id)
     target_channel_ids = helpers.find_linked_channels(parent_channel_id)
     
     if target_channel_ids is None:
@@ -100,10 +125,13 @@ async def handle_thread_message_delete(bot, message: discord.Message):
     
     # Find the message group entry for the deleted message
     group_name = helpers.get_group_name(parent_channel_id)
-    message_entry = database.get_message_group_entry_by_message_id(message.id, group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(message_id, group_name)
     
     if not message_entry:
-        logger.warning(f"No message group entry found for deleted thread message {message.id}")
+        logger.debug(f"No message group entry found for deleted thread message {message_id}")
+        return
+
+    if not _is_source_message(message_entry, message_id):
         return
     
     logger.info(f"Deleting linked thread messages in {len(target_channel_ids)} linked channels")
@@ -114,22 +142,18 @@ async def handle_thread_message_delete(bot, message: discord.Message):
         # Skip the original message entry (already deleted)
         if (entry["guild_id"] == helpers.get_guild_id_from_channel_id(parent_channel_id) and 
             entry["channel_id"] == parent_channel_id and 
-            entry.get("thread_id") == str(message.channel.id)):
+            entry.get("thread_id") == str(channel.id)):
             continue
         
         target_channel = bot.get_channel(int(entry["channel_id"]))
         if target_channel and "thread_id" in entry:
             try:
-                # Get the parent message to access the thread
-                parent_message = await target_channel.fetch_message(int(entry["thread_id"]))
-                if parent_message.thread:
-                    # Fetch the linked message in the thread and delete it
-                    linked_message = await parent_message.thread.fetch_message(int(entry["message_id"]))
-                    await linked_message.delete()
-                    deleted_count += 1
-                    logger.debug(f"Deleted thread message in {target_channel.guild.name}#{target_channel.name}")
-                else:
-                    logger.warning(f"Thread not found for parent message {entry['thread_id']}")
+                # Address the mirror thread directly instead of going through its parent message
+                target_thread = bot.get_partial_messageable(int(helpers.get_mirror_thread_id(entry)), guild_id=target_channel.guild.id)
+                linked_message = target_thread.get_partial_message(int(entry["message_id"]))
+                await _delete_mirror(bot, entry, linked_message)
+                deleted_count += 1
+                logger.debug(f"Deleted thread message in {target_channel.guild.name}#{target_channel.name}")
             except discord.NotFound:
                 logger.warning(f"Linked thread message {entry['message_id']} already deleted or not found")
             except discord.Forbidden:
@@ -141,17 +165,17 @@ async def handle_thread_message_delete(bot, message: discord.Message):
     
     # Remove the message group entry from the database
     try:
-        database.delete_message_group_entry_by_message_id(message.id, group_name)
-        logger.debug(f"Removed message group entry for deleted thread message {message.id}")
+        await async_database.delete_message_group_entry_by_message_id(message_id, group_name)
+        logger.debug(f"Removed message group entry for deleted thread message {message_id}")
     except Exception as e:
         logger.error(f"Failed to remove message group entry: {e}")
     
     logger.info(f"Successfully deleted {deleted_count} linked thread messages")
 
-async def handle_forum_thread_message_delete(bot, message: discord.Message):
+async def handle_forum_thread_message_delete(bot, channel: discord.Thread, message_id: int):
     """Handles deleted messages in forum threads and deletes all linked messages."""
 
-    parent_channel_id = str(message.channel.parent_id)
+    parent_channel_id = str(channel.parent_id)
     target_channel_ids = helpers.find_linked_channels(parent_channel_id)
 
     if target_channel_ids is None:
@@ -159,35 +183,139 @@ async def handle_forum_thread_message_delete(bot, message: discord.Message):
         return
 
     group_name = helpers.get_group_name(parent_channel_id)
-    message_entry = database.get_message_group_entry_by_message_id(message.id, group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(message_id, group_name)
     if not message_entry:
-        logger.warning(f"No message group entry found for deleted forum message {message.id}")
+        logger.debug(f"No message group entry found for deleted forum message {message_id}")
+        return
+
+    if not _is_source_message(message_entry, message_id):
         return
 
     deleted_count = 0
     for entry in message_entry:
-        if entry.get("thread_id") == str(message.channel.id):
+        if entry.get("thread_id") == str(channel.id):
             continue
 
-        target_thread = bot.get_channel(int(entry["thread_id"]))
-        if not target_thread:
-            try:
-                target_thread = await bot.fetch_channel(int(entry["thread_id"]))
-            except Exception as e:
-                logger.error(f"Failed to fetch forum thread {entry['thread_id']}: {e}")
-                continue
+        target_thread = bot.get_partial_messageable(int(entry["thread_id"]))
 
         try:
-            linked_message = await target_thread.fetch_message(int(entry["message_id"]))
-            await linked_message.delete()
+            linked_message = target_thread.get_partial_message(int(entry["message_id"]))
+            await _delete_mirror(bot, entry, linked_message)
             deleted_count += 1
         except Exception as e:
             logger.error(f"Failed to delete forum thread message {entry['message_id']}: {e}")
 
     try:
-        database.delete_message_group_entry_by_message_id(message.id, group_name)
-        logger.debug(f"Removed message group entry for deleted forum message {message.id}")
+        await async_database.delete_message_group_entry_by_message_id(message_id, group_name)
+        logger.debug(f"Removed message group entry for deleted forum message {message_id}")
     except Exception as e:
         logger.error(f"Failed to remove forum message group entry: {e}")
 
     logger.info(f"Successfully deleted {deleted_count} linked forum messages")
+
+async def handle_bulk_message_delete(bot, payload: discord.RawBulkMessageDeleteEvent):
+    """Mirrors a purge: one mapping query, batched deletes per destination, one mapping cleanup."""
+    group_name = await _resolve_group_name(bot, payload.guild_id, payload.channel_id)
+    if not group_name or not group_leases.owns(group_name):
+        return
+
+    documents = await async_database.get_message_group_documents_by_message_ids(list(payload.message_ids), group_name)
+    deleted_ids = {str(message_id) for message_id in payload.message_ids}
+    # Only propagate for purged source messages; the first entry of a mapping is the source.
+    documents = [document for document in documents if document["messages"] and document["messages"][0]["message_id"] in deleted_ids]
+    if not documents:
+        logger.debug(f"No mapped messages among {len(payload.message_ids)} bulk deleted in channel {payload.channel_id}")
+        return
+
+    logger.info(f"Mirroring bulk delete of {len(documents)} messages from channel {payload.channel_id}")
+
+    # destination channel or thread ID -> (guild ID, mirror message IDs sent by the bot, webhook mirror entries)
+    destinations: Dict[str, Tuple[str, List[int], List[dict]]] = {}
+    for document in documents:
+        for entry in document["messages"][1:]:
+            destination_id = helpers.get_mirror_thread_id(entry) if "thread_id" in entry else entry["channel_id"]
+            _, message_ids, webhook_entries = destinations.setdefault(destination_id, (entry.get("guild_id"), [], []))
+            if entry.get("webhook_id"):
+                webhook_entries.append(entry)
+            else:
+                message_ids.append(int(entry["message_id"]))
+
+    async def delete_in(destination_id: str):
+        guild_id, message_ids, webhook_entries = destinations[destination_id]
+        deleted_count, unowned_ids = await _delete_webhook_mirrors(bot, destination_id, webhook_entries)
+        message_ids = message_ids + unowned_ids
+        if message_ids:
+            deleted_count += await _bulk_delete_in_destination(bot, destination_id, guild_id, message_ids)
+        return deleted_count
+
+    deleted_count = sum(await fan_out(list(destinations), delete_in))
+
+    try:
+        await async_database.delete_message_group_documents([document["_id"] for document in documents], group_name)
+    except Exception as e:
+        logger.error(f"Failed to remove message group entries after bulk delete: {e}")
+
+    logger.info(f"Successfully deleted {deleted_count} linked messages in {len(destinations)} destinations")
+
+async def _delete_webhook_mirrors(bot, destination_id: str, entries: List[dict]) -> Tuple[int, List[int]]:
+    """
+    Delete mirrors sent through a webhook one by one with that webhook, which needs no Manage
+    Messages. Returns how many were deleted and the IDs whose webhook is gone, for the bot to delete.
+    """
+    deleted_count = 0
+    unowned_ids = []
+    for entry in entries:
+        webhook = await webhook_pool.for_entry(bot, entry)
+        if webhook is None:
+            unowned_ids.append(int(entry["message_id"]))
+            continue
+        try:
+            await webhook_pool.delete_message(webhook, entry)
+            deleted_count += 1
+        except discord.NotFound as e:
+            if e.code == UNKNOWN_WEBHOOK:
+                unowned_ids.append(int(entry["message_id"]))
+            else:
+                logger.debug(f"Linked message {entry['message_id']} already deleted in {destination_id}")
+        except discord.HTTPException as e:
+            logger.error(f"Failed to delete webhook message {entry['message_id']} in {destination_id}: {e}")
+    return deleted_count, unowned_ids
+
+async def _bulk_delete_in_destination(bot, destination_id: str, guild_id, message_ids: List[int]) -> int:
+    """Delete mirror messages in one channel or thread, up to BULK_DELETE_BATCH_SIZE per request."""
+    channel = bot.get_channel(int(destination_id))
+    if channel is None:
+        try:
+            channel = await bot.fetch_channel(int(destination_id))
+        except discord.HTTPException as e:
+            logger.error(f"Destination {destination_id} (guild {guild_id}) not found for bulk delete: {e}")
+            return 0
+
+    linked_channel_id = getattr(channel, "parent_id", None) or channel.id
+    deleted_count = 0
+    for start in range(0, len(message_ids), BULK_DELETE_BATCH_SIZE):
+        batch = message_ids[start:start + BULK_DELETE_BATCH_SIZE]
+        try:
+            await outbound.submit(
+                BULK_DELETE_MESSAGES,
+                channel.id,
+                lambda: channel.delete_messages([discord.Object(id=message_id) for message_id in batch]),
+                destination_id=linked_channel_id,
+            )
+            deleted_count += len(batch)
+        except discord.HTTPException as e:
+            if is_dead_destination(e):
+                logger.error(f"Destination {destination_id} is gone, stopping bulk delete: {e}")
+                return deleted_count
+            # Bulk delete rejects messages older than 14 days and needs Manage Messages, while the
+            # bot can always delete its own mirrors; fall back to single deletes for this batch.
+            logger.warning(f"Bulk delete failed in {destination_id}, deleting {len(batch)} messages one by one: {e}")
+            for message_id in batch:
+                try:
+                    await outbound.submit(DELETE_MESSAGE, channel.id, channel.get_partial_message(message_id).delete, destination_id=linked_channel_id)
+                    deleted_count += 1
+                except discord.NotFound:
+                    logger.debug(f"Linked message {message_id} already deleted in {destination_id}")
+                except discord.HTTPException as exc:
+                    logger.error(f"Failed to delete message {message_id} in {destination_id}: {exc}")
+    return deleted_count
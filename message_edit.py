@@ -1,14 +1,19 @@
 import discord
 import helpers
-import database
+import async_database
 from header_state import header_state
+from group_leases import group_leases
+from outbound import outbound, EDIT_MESSAGE
+from webhook_pool import webhook_pool
 from logger_config import get_logger
 
 logger = get_logger(__name__)
 
-async def handle_message_edit(bot, before: discord.Message, after: discord.Message):
-    """Handles edited messages and updates all linked messages."""
-    
+async def handle_message_edit(bot, payload: discord.RawMessageUpdateEvent):
+    """Handles edited messages and updates all linked messages. Works without the message cache."""
+    before = payload.cached_message
+    after = payload.message
+
     # Ignore edits from the bot itself
     if after.author == bot.user:
         return
@@ -17,24 +22,64 @@ async def handle_message_edit(bot, before: discord.Message, after: discord.Messa
     if after.webhook_id:
         return
 
-    # Only handle edits if the content actually changed
-    if before.content == after.content:
+    # Only handle edits if the content actually changed. Without a cached copy, rely on
+    # edited_at: updates that only unfurl embeds do not set it, and later unfurls or pin updates
+    # repeat it, so handlers also skip an edited_at that was already propagated.
+    if before is not None:
+        if before.content == after.content:
+            return
+    elif after.edited_at is None:
         return
     
     # Ignore if the edited message has no content (e.g., only embeds)
-    if not after.content and not before.content:
+    if not after.content and before is not None and not before.content:
         return
-    
-    logger.info(f"Handling message edit from {after.author} in {after.guild.name}#{after.channel.name}")
+
+    channel = after.channel
+    if isinstance(channel, discord.PartialMessageable):
+        # Channel or thread not in the cache; resolve it only if it can be bridged.
+        channel = await helpers.resolve_bridged_channel(bot, payload.guild_id, payload.channel_id)
+        if channel is None:
+            return
+
+    # In multi-instance mode another instance may own this group.
+    if not group_leases.owns(helpers.get_source_group_name(channel)):
+        return
+
+    logger.info(f"Handling message edit from {after.author} in channel {payload.channel_id}")
     
     # Check if the edited message is in a thread
-    if isinstance(after.channel, discord.Thread):
-        if _is_forum_thread(after.channel):
-            await handle_forum_thread_message_edit(bot, before, after)
+    if isinstance(channel, discord.Thread):
+        if _is_forum_thread(channel):
+            await handle_forum_thread_message_edit(bot, channel, after)
         else:
-            await handle_thread_message_edit(bot, before, after)
+            await handle_thread_message_edit(bot, channel, after)
     else:
-        await handle_channel_message_edit(bot, before, after)
+        await handle_channel_message_edit(bot, channel, after)
+
+async def _edit_mirror(bot, entry: dict, linked_message: discord.PartialMessage, content: str) -> bool:
+    """Edit a mirror as whoever sent it: webhook mirrors through their webhook, the others as the bot."""
+    if entry.get("webhook_id"):
+        webhook = await webhook_pool.for_entry(bot, entry)
+        if webhook is None:
+            logger.warning(f"Webhook {entry['webhook_id']} of linked message {entry['message_id']} no longer exists, cannot edit it")
+            return False
+        await webhook_pool.edit_message(webhook, entry, content)
+        return True
+    await outbound.submit(EDIT_MESSAGE, linked_message.channel.id, lambda: linked_message.edit(content=content), destination_id=entry["channel_id"])
+    return True
+
+def _already_propagated(message_entry: list, after: discord.Message) -> bool:
+    """True if the mirrors already carry this edit, judged by its edited_at."""
+    return after.edited_at is not None and message_entry[0].get("edited_at") == after.edited_at.isoformat()
+
+async def _record_propagated(group_name: str, after: discord.Message):
+    if after.edited_at is None:
+        return
+    try:
+        await async_database.set_message_group_edited_at(group_name, str(after.id), after.edited_at.isoformat())
+    except Exception as e:
+        logger.error(f"Failed to record the propagated edit of message {after.id}: {e}")
 
 def _is_forum_thread(thread: discord.Thread) -> bool:
     parent = thread.parent
@@ -44,10 +89,19 @@ def _is_forum_thread(thread: discord.Thread) -> bool:
         return True
     return getattr(parent, "type", None) == discord.ChannelType.forum
 
-async def handle_channel_message_edit(bot, before: discord.Message, after: discord.Message):
+async def _mirror_has_header(entry: dict, linked_message: discord.PartialMessage) -> bool:
+    """Return whether a mirrored message was sent with a header."""
+    has_header = entry.get("has_header")
+    if has_header is None:
+        # Mappings saved before the flag was recorded: read the mirror once to find out.
+        fetched = await linked_message.fetch()
+        has_header = header_state.content_has_header(fetched.content or "")
+    return has_header
+
+async def handle_channel_message_edit(bot, channel, after: discord.Message):
     """Handles edited messages in regular channels and updates all linked messages."""
     
-    channel_id = str(after.channel.id)
+    channel_id = str(channel.id)
     target_channel_ids = helpers.find_linked_channels(channel_id)
     
     if target_channel_ids is None:
@@ -56,11 +110,14 @@ async def handle_channel_message_edit(bot, before: discord.Message, after: disco
     
     # Find the message group entry for the edited message
     group_name = helpers.get_group_name(channel_id)
-    message_entry = database.get_message_group_entry_by_message_id(after.id, group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(after.id, group_name)
     
     if not message_entry:
         logger.warning(f"No message group entry found for edited message {after.id}")
         return
+    if _already_propagated(message_entry, after):
+        logger.debug(f"Edit of message {after.id} was already propagated")
+        return
     
     logger.info(f"Updating edited message in {len(target_channel_ids)} linked channels")
     
@@ -68,6 +125,7 @@ async def handle_channel_message_edit(bot, before: discord.Message, after: disco
     guild_name = after.guild.name if after.guild else "Unknown Guild"
     channel_group_len = len(target_channel_ids)
     
+    header_text = await helpers.form_header(after, guild_name, channel_group_len)
     edited_count = 0
     # Update the message in each linked channel
     for entry in message_entry:
@@ -78,13 +136,13 @@ async def handle_channel_message_edit(bot, before: discord.Message, after: disco
         target_channel = bot.get_channel(int(entry["channel_id"]))
         if target_channel:
             try:
-                # Fetch the linked message and edit it
-                linked_message = await target_channel.fetch_message(int(entry["message_id"]))
-                include_header = header_state.content_has_header(linked_message.content or "")
-                header = helpers.form_header(after, guild_name, channel_group_len) if include_header else ""
+                # Edit the linked message through a partial handle, no fetch needed
+                linked_message = target_channel.get_partial_message(int(entry["message_id"]))
+                include_header = await _mirror_has_header(entry, linked_message)
+                header = header_text if include_header else ""
                 new_msg = helpers.form_message_text(header, after.content)
-                await linked_message.edit(content=new_msg)
-                edited_count += 1
+                if await _edit_mirror(bot, entry, linked_message, new_msg):
+                    edited_count += 1
                 logger.debug(f"Updated message in {target_channel.guild.name}#{target_channel.name}")
             except discord.NotFound:
                 logger.warning(f"Linked message {entry['message_id']} not found in {target_channel.guild.name}#{target_channel.name}")
@@ -95,12 +153,13 @@ async def handle_channel_message_edit(bot, before: discord.Message, after: disco
         else:
             logger.error(f"Target channel with ID {entry['channel_id']} not found")
     
+    await _record_propagated(group_name, after)
     logger.info(f"Successfully updated {edited_count} linked messages")
 
-async def handle_thread_message_edit(bot, before: discord.Message, after: discord.Message):
+async def handle_thread_message_edit(bot, channel: discord.Thread, after: discord.Message):
     """Handles edited messages in threads and updates all linked messages."""
     
-    parent_channel_id = str(after.channel.parent_id)
+    parent_channel_id = str(channel.parent_id)
     target_channel_ids = helpers.find_linked_channels(parent_channel_id)
     
     if target_channel_ids is None:
@@ -109,11 +168,14 @@ async def handle_thread_message_edit(bot, before: discord.Message, after: discor
     
     # Find the message group entry for the edited message
     group_name = helpers.get_group_name(parent_channel_id)
-    message_entry = database.get_message_group_entry_by_message_id(after.id, group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(after.id, group_name)
     
     if not message_entry:
         logger.warning(f"No message group entry found for edited thread message {after.id}")
         return
+    if _already_propagated(message_entry, after):
+        logger.debug(f"Edit of message {after.id} was already propagated")
+        return
     
     logger.info(f"Updating edited thread message in {len(target_channel_ids)} linked channels")
     
@@ -121,31 +183,28 @@ async def handle_thread_message_edit(bot, before: discord.Message, after: discor
     guild_name = after.guild.name if after.guild else "Unknown Guild"
     channel_group_len = len(target_channel_ids)
 
+    header_text = await helpers.form_header(after, guild_name, channel_group_len)
     edited_count = 0
     # Update the message in each linked thread
     for entry in message_entry:
         # Skip the original message entry
         if (entry["guild_id"] == helpers.get_guild_id_from_channel_id(parent_channel_id) and 
             entry["channel_id"] == parent_channel_id and 
-            entry.get("thread_id") == str(after.channel.id)):
+            entry.get("thread_id") == str(channel.id)):
             continue
         
         target_channel = bot.get_channel(int(entry["channel_id"]))
         if target_channel and "thread_id" in entry:
             try:
-                # Get the parent message to access the thread
-                parent_message = await target_channel.fetch_message(int(entry["thread_id"]))
-                if parent_message.thread:
-                    # Fetch the linked message in the thread and edit it
-                    linked_message = await parent_message.thread.fetch_message(int(entry["message_id"]))
-                    include_header = header_state.content_has_header(linked_message.content or "")
-                    header = helpers.form_header(after, guild_name, channel_group_len) if include_header else ""
-                    new_msg = helpers.form_message_text(header, after.content)
-                    await linked_message.edit(content=new_msg)
+                # Address the mirror thread directly instead of going through its parent message
+                target_thread = bot.get_partial_messageable(int(helpers.get_mirror_thread_id(entry)), guild_id=target_channel.guild.id)
+                linked_message = target_thread.get_partial_message(int(entry["message_id"]))
+                include_header = await _mirror_has_header(entry, linked_message)
+                header = header_text if include_header else ""
+                new_msg = helpers.form_message_text(header, after.content)
+                if await _edit_mirror(bot, entry, linked_message, new_msg):
                     edited_count += 1
-                    logger.debug(f"Updated thread message in {target_channel.guild.name}#{target_channel.name}")
-                else:
-                    logger.warning(f"Thread not found for parent message {entry['thread_id']}")
+                logger.debug(f"Updated thread message in {target_channel.guild.name}#{target_channel.name}")
             except discord.NotFound:
                 logger.warning(f"Linked thread message {entry['message_id']} not found")
             except discord.Forbidden:
@@ -155,12 +214,13 @@ async def handle_thread_message_edit(bot, before: discord.Message, after: discor
         else:
             logger.error(f"Target channel with ID {entry['channel_id']} not found or no thread_id in entry")
     
+    await _record_propagated(group_name, after)
     logger.info(f"Successfully updated {edited_count} linked thread messages")
 
-async def handle_forum_thread_message_edit(bot, before: discord.Message, after: discord.Message):
+async def handle_forum_thread_message_edit(bot, channel: discord.Thread, after: discord.Message):
     """Handles edited messages in forum threads and updates all linked messages."""
 
-    parent_channel_id = str(after.channel.parent_id)
+    parent_channel_id = str(channel.parent_id)
     target_channel_ids = helpers.find_linked_channels(parent_channel_id)
 
     if target_channel_ids is None:
@@ -168,35 +228,34 @@ async def handle_forum_thread_message_edit(bot, before: discord.Message, after:
         return
 
     group_name = helpers.get_group_name(parent_channel_id)
-    message_entry = database.get_message_group_entry_by_message_id(after.id, group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(after.id, group_name)
     if not message_entry:
         logger.warning(f"No message group entry found for edited forum message {after.id}")
         return
+    if _already_propagated(message_entry, after):
+        logger.debug(f"Edit of message {after.id} was already propagated")
+        return
 
     guild_name = after.guild.name if after.guild else "Unknown Guild"
     channel_group_len = len(target_channel_ids)
 
+    header_text = await helpers.form_header(after, guild_name, channel_group_len)
     edited_count = 0
     for entry in message_entry:
-        if entry.get("thread_id") == str(after.channel.id):
+        if entry.get("thread_id") == str(channel.id):
             continue
 
-        target_thread = bot.get_channel(int(entry["thread_id"]))
-        if not target_thread:
-            try:
-                target_thread = await bot.fetch_channel(int(entry["thread_id"]))
-            except Exception as e:
-                logger.error(f"Failed to fetch forum thread {entry['thread_id']}: {e}")
-                continue
+        target_thread = bot.get_partial_messageable(int(entry["thread_id"]))
 
         try:
-            linked_message = await target_thread.fetch_message(int(entry["message_id"]))
-            include_header = header_state.content_has_header(linked_message.content or "")
-            header = helpers.form_header(after, guild_name, channel_group_len) if include_header else ""
+            linked_message = target_thread.get_partial_message(int(entry["message_id"]))
+            include_header = await _mirror_has_header(entry, linked_message)
+            header = header_text if include_header else ""
             new_msg = helpers.form_message_text(header, after.content)
-            await linked_message.edit(content=new_msg)
-            edited_count += 1
+            if await _edit_mirror(bot, entry, linked_message, new_msg):
+                edited_count += 1
         except Exception as e:
             logger.error(f"Failed to edit forum thread message {entry['message_id']}: {e}")
 
+    await _record_propagated(group_name, after)
     logger.info(f"Successfully updated {edited_count} linked forum messages")
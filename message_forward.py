@@ -1,16 +1,26 @@
 from datetime import timezone
+from typing import Optional
 import discord
 import emoji
 import helpers
-import database
+from attachments import AttachmentFanout
+from fanout import fan_out
+import async_database
 from header_state import header_state
+from delivery_queue import Dispatch, delivery_queues
+from sender_pool import sender_pool
+from delivery_retry import delivery_retries
+from webhook_pool import webhook_pool
+from circuit_breaker import destination_breakers
 from logger_config import get_logger
 import json
 
 logger = get_logger(__name__)
 
-async def handle_forward_message(bot, message: discord.Message):
+async def handle_forward_message(bot, message: discord.Message, dispatch: Optional[Dispatch] = None, saved_entry: Optional[list] = None):
     """Handles forward messages and forwards them to all linked channels."""
+    if dispatch is None:
+        dispatch = delivery_queues.open_dispatch([])
 
     timestamp = message.created_at
     if timestamp.tzinfo is None:
@@ -50,65 +60,103 @@ async def handle_forward_message(bot, message: discord.Message):
     
     forwarded_label = f"_Forwarded message_ {emoji.emojize(':arrow_heading_down:')}"
     body = f"{forwarded_label}\n{forwarded_text}" if forwarded_text else forwarded_label
+    # The mapping is saved before the fan-out and each mirror added once delivered, so a resumed
+    # message (saved_entry) only goes to the destinations that have no mirror yet.
+    pending = helpers.unmirrored(target_channel_ids, saved_entry)
+    if not pending:
+        return
+    if saved_entry is None:
+        try:
+            await async_database.save_message_group_entry(group_name, message_group_entry)
+        except Exception as e:
+            logger.error(f"Failed to save forwarded message group entry: {e}")
+
+    header_text = await helpers.form_header(message, guild_name, channel_group_len)
+    attachments = await AttachmentFanout.from_attachments(forwarded_attachments)
         
-    for target_channel_id in target_channel_ids:
+    async def deliver(target_channel_id: str):
+        if destination_breakers.is_open(target_channel_id):
+            logger.debug(f"Skipping target channel {target_channel_id}, its circuit is open")
+            return None
         target_channel = bot.get_channel(int(target_channel_id))
         target_guild_id = helpers.get_guild_id_from_channel_id(target_channel_id)
-        if target_channel:
-            lock = header_state.get_lock(group_name, target_channel_id, None)
-            async with lock:
-                include_header, reason, prev_state = header_state.decide_header(
+        if not target_channel:
+            logger.error(f"Target channel with ID {target_channel_id} not found")
+            destination_breakers.record_failure(target_channel_id, "channel not found")
+            return None
+
+        webhook = await webhook_pool.get(target_channel)
+        async with dispatch.turn(target_channel_id):
+            include_header, reason, prev_state = header_state.decide_header(
+                group_name=group_name,
+                channel_id=target_channel_id,
+                thread_id=None,
+                author_id=author_id,
+                source_guild_id=source_guild_id,
+                timestamp=timestamp,
+                is_reply=False,
+            )
+
+            logger.debug(
+                "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
+                group_name, target_channel_id, None, include_header, reason, author_id, source_guild_id, prev_state,
+            )
+
+            if webhook:
+                include_header = False
+            header = header_text if include_header else ""
+            msg = helpers.form_message_text(header, body)
+
+            async def send():
+                if webhook:
+                    result = await webhook_pool.send(
+                        webhook,
+                        target_channel,
+                        message,
+                        guild_name,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=attachments.files() or None
+                    )
+                else:
+                    result = await sender_pool.send(
+                        target_channel,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=attachments.files() or None,
+                        attachments=attachments
+                    )
+                # Here rather than after the first attempt, so a late delivery by the retry queue counts too.
+                header_state.update_state(
                     group_name=group_name,
                     channel_id=target_channel_id,
                     thread_id=None,
                     author_id=author_id,
                     source_guild_id=source_guild_id,
                     timestamp=timestamp,
-                    is_reply=False,
                 )
+                return result
 
-                logger.debug(
-                    "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
-                    group_name, target_channel_id, None, include_header, reason, author_id, source_guild_id, prev_state,
-                )
+            entry = {
+                "guild_id": target_guild_id,
+                "channel_id": target_channel_id,
+                "has_header": include_header
+            }
 
-                header = helpers.form_header(message, guild_name, channel_group_len) if include_header else ""
-                msg = helpers.form_message_text(header, body)
+            # Send the forwarded message to the target channel
+            try:
+                result = await send()
+            except Exception as e:
+                logger.error(f"Failed to send forwarded message to {target_channel.guild.name}#{target_channel.name}: {e}")
+                delivery_retries.schedule(e, group_name, message.id, target_channel_id, send, entry, attachments)
+                return None
 
-                # Send the forwarded message to the target channel
-                try:
-                    result = await target_channel.send(
-                        content=msg,
-                        embed=message.embeds[0] if message.embeds else None,
-                        files=[await file.to_file() for file in forwarded_attachments] if forwarded_attachments else None
-                    )
-                    header_state.update_state(
-                        group_name=group_name,
-                        channel_id=target_channel_id,
-                        thread_id=None,
-                        author_id=author_id,
-                        source_guild_id=source_guild_id,
-                        timestamp=timestamp,
-                    )
-                except Exception as e:
-                    logger.error(f"Failed to send forwarded message to {target_channel.guild.name}#{target_channel.name}: {e}")
-                    return
-
-                # Form message entry for every linked channel
-                entry = {
-                    "guild_id": target_guild_id,
-                    "channel_id": target_channel_id,
-                    "message_id": str(result.id)
-                }
-                message_group_entry.append(entry)
-        else:
-            logger.error(f"Target channel with ID {target_channel_id} not found")
-            return
-    
-    # Save the message group entry to the database
-    group_name = helpers.get_group_name(channel_id_for_lookup)
-    try:
-        database.save_message_group_entry(group_name, message_group_entry)
-        logger.info(f"Forwarded message successfully sent and saved")
-    except Exception as e:
-        logger.error(f"Failed to save forwarded message group entry: {e}")
+            # Form message entry for every linked channel
+            helpers.set_mirror_message(entry, result)
+            await helpers.record_mirror(group_name, message.id, entry)
+            return entry
+
+    # Queue up at the destinations only now that the payload is ready.
+    dispatch.reserve(pending)
+    await fan_out(pending, dispatch.delivering(deliver))
+    attachments.close()
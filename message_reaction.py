@@ -1,56 +1,128 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
 import discord
+import config
 import helpers
-import database
+import async_database
+from fanout import fan_out
+from group_leases import group_leases
+from circuit_breaker import CircuitOpenError
+from outbound import outbound, ADD_REACTION, REMOVE_REACTION
 from logger_config import get_logger
 
 logger = get_logger(__name__)
 
+# (source channel ID, source message ID, emoji)
+ReactionKey = Tuple[int, int, str]
+
+
+class ReactionAggregator:
+    """
+    Coalesces reaction events per reacted message and emoji.
+
+    The first event for a key opens a short window; adds and removes inside it cancel out and
+    only the net change is propagated to the mirrors when it closes. Propagation for one source
+    message is limited to max_in_flight concurrent reaction calls across all of its emojis.
+    """
+
+    def __init__(self, window_seconds: float, max_in_flight: int):
+        self.window_seconds = window_seconds
+        self.max_in_flight = max_in_flight
+        self._net: Dict[ReactionKey, int] = {}
+        self._payloads: Dict[ReactionKey, discord.RawReactionActionEvent] = {}
+        self._flushes: Dict[ReactionKey, asyncio.Task] = {}
+        self._limits: Dict[int, asyncio.Semaphore] = {}
+        self._limit_users: Dict[int, int] = {}
+
+    def submit(self, bot, payload: discord.RawReactionActionEvent, delta: int):
+        """Record a reaction add (+1) or remove (-1) for the next flush of its key."""
+        key = (payload.channel_id, payload.message_id, str(payload.emoji))
+        self._payloads[key] = payload
+        if key in self._net:
+            self._net[key] += delta
+            return
+        self._net[key] = delta
+        self._flushes[key] = asyncio.create_task(self._flush_later(bot, key), name=f"reaction:{payload.message_id}")
+
+    async def _flush_later(self, bot, key: ReactionKey):
+        try:
+            await asyncio.sleep(self.window_seconds)
+            net = self._net.pop(key)
+            payload = self._payloads.pop(key)
+            if net == 0:
+                logger.debug(f"Reaction {key[2]} on message {key[1]} cancelled out; nothing to propagate")
+                return
+            await _process_reaction(bot, payload, operation="add" if net > 0 else "remove")
+        except Exception as e:
+            logger.error(f"Failed to propagate reaction {key[2]} on message {key[1]}: {e}")
+        finally:
+            self._flushes.pop(key, None)
+
+    @asynccontextmanager
+    async def slot(self, message_id: int):
+        """Hold one of the in-flight reaction slots of a source message."""
+        semaphore = self._limits.get(message_id)
+        if semaphore is None:
+            semaphore = self._limits[message_id] = asyncio.Semaphore(self.max_in_flight)
+        self._limit_users[message_id] = self._limit_users.get(message_id, 0) + 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self._limit_users[message_id] -= 1
+            if not self._limit_users[message_id]:
+                self._limit_users.pop(message_id)
+                self._limits.pop(message_id, None)
+
+
+reaction_aggregator = ReactionAggregator(config.REACTION_DEBOUNCE_SECONDS, config.REACTION_MAX_IN_FLIGHT)
+
 
 async def handle_reaction_add(bot, payload: discord.RawReactionActionEvent):
     """Propagate reaction additions to all linked messages."""
-    await _process_reaction(bot, payload, operation="add")
+    if payload.user_id == bot.user.id:
+        return
+    if not helpers.may_be_bridged(bot, payload.guild_id, payload.channel_id):
+        return
+    reaction_aggregator.submit(bot, payload, 1)
 
 
 async def handle_reaction_remove(bot, payload: discord.RawReactionActionEvent):
     """Propagate reaction removals to all linked messages."""
-    await _process_reaction(bot, payload, operation="remove")
-
-
-async def _process_reaction(bot, payload: discord.RawReactionActionEvent, operation: str):
-    """Route reaction events between regular channels and threads."""
     if payload.user_id == bot.user.id:
         return
+    if not helpers.may_be_bridged(bot, payload.guild_id, payload.channel_id):
+        return
+    reaction_aggregator.submit(bot, payload, -1)
+
 
+async def _process_reaction(bot, payload: discord.RawReactionActionEvent, operation: str):
+    """Route reaction events between regular channels and threads using the payload IDs only."""
     if not payload.guild_id:
         logger.debug("Reaction event without guild_id; ignoring.")
         return
 
-    channel = await _resolve_channel(bot, payload.guild_id, payload.channel_id)
-    if channel is None:
-        logger.warning(f"Unable to resolve channel {payload.channel_id} for reaction event.")
-        return
+    channel_id = str(payload.channel_id)
+    emoji = payload.emoji
 
-    try:
-        message = await channel.fetch_message(payload.message_id)
-    except discord.Forbidden:
-        logger.error(f"No permission to fetch message {payload.message_id} in channel {channel.id}")
-        return
-    except discord.NotFound:
-        logger.warning(f"Message {payload.message_id} not found in channel {channel.id}")
-        return
-    except discord.HTTPException as exc:
-        logger.error(f"Failed to fetch message {payload.message_id}: {exc}")
+    # Bridged regular channels are answered by the routing index without touching the API.
+    group_name = helpers.get_group_name(channel_id)
+    if group_name:
+        if not group_leases.owns(group_name):
+            return
+        await _process_channel_message_reaction(bot, channel_id, payload.message_id, emoji, operation)
         return
 
-    emoji = payload.emoji
+    # Anything else can only matter if it is a thread of a bridged channel.
+    channel = await helpers.resolve_bridged_channel(bot, payload.guild_id, payload.channel_id)
+    if not isinstance(channel, discord.Thread) or not group_leases.owns(helpers.get_source_group_name(channel)):
+        return
 
-    if isinstance(channel, discord.Thread):
-        if _is_forum_thread(channel):
-            await _process_forum_thread_message_reaction(bot, message, emoji, operation)
-        else:
-            await _process_thread_message_reaction(bot, message, emoji, operation)
+    if _is_forum_thread(channel):
+        await _process_forum_thread_message_reaction(bot, channel, payload.message_id, emoji, operation)
     else:
-        await _process_channel_message_reaction(bot, message, emoji, operation)
+        await _process_thread_message_reaction(bot, channel, payload.message_id, emoji, operation)
 
 
 def _is_forum_thread(thread: discord.Thread) -> bool:
@@ -62,157 +134,119 @@ def _is_forum_thread(thread: discord.Thread) -> bool:
     return getattr(parent, "type", None) == discord.ChannelType.forum
 
 
-async def _process_channel_message_reaction(bot, message: discord.Message, emoji, operation: str):
+async def _process_channel_message_reaction(bot, channel_id: str, message_id: int, emoji, operation: str):
     """Handle reaction propagation for messages in regular channels."""
-    channel_id = str(message.channel.id)
-    target_channel_ids = helpers.find_linked_channels(channel_id)
-    if target_channel_ids is None:
-        logger.debug(f"No linked channels configured for channel {channel_id}")
-        return
-
     group_name = helpers.get_group_name(channel_id)
     if not group_name:
         logger.warning(f"No group name found for channel {channel_id}")
         return
 
-    message_entry = database.get_message_group_entry_by_message_id(str(message.id), group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(str(message_id), group_name)
     if not message_entry:
-        logger.debug(f"No message entry found for message {message.id} in group {group_name}")
+        logger.debug(f"No message entry found for message {message_id} in group {group_name}")
         return
 
     source_guild_id = helpers.get_guild_id_from_channel_id(channel_id)
+    target_entries = [
+        entry for entry in message_entry
+        if not (entry["channel_id"] == channel_id and entry["guild_id"] == source_guild_id)
+    ]
 
-    for entry in message_entry:
-        if entry["channel_id"] == channel_id and entry["guild_id"] == source_guild_id:
-            continue
-
-        await _apply_reaction_to_entry(bot, entry, emoji, operation)
+    await _apply_to_entries(bot, message_id, target_entries, _apply_reaction_to_entry, emoji, operation)
 
 
-async def _process_thread_message_reaction(bot, message: discord.Message, emoji, operation: str):
+async def _process_thread_message_reaction(bot, thread: discord.Thread, message_id: int, emoji, operation: str):
     """Handle reaction propagation for messages posted inside threads."""
-    thread = message.channel
     parent_channel_id = str(thread.parent_id)
-    target_channel_ids = helpers.find_linked_channels(parent_channel_id)
-    if target_channel_ids is None:
-        logger.debug(f"No linked channels configured for parent channel {parent_channel_id}")
-        return
-
     group_name = helpers.get_group_name(parent_channel_id)
     if not group_name:
         logger.warning(f"No group name found for parent channel {parent_channel_id}")
         return
 
-    message_entry = database.get_message_group_entry_by_message_id(str(message.id), group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(str(message_id), group_name)
     if not message_entry:
-        logger.debug(f"No thread message entry found for message {message.id} in group {group_name}")
+        logger.debug(f"No thread message entry found for message {message_id} in group {group_name}")
         return
 
     source_guild_id = helpers.get_guild_id_from_channel_id(parent_channel_id)
     thread_id = str(thread.id)
 
-    for entry in message_entry:
-        if (
+    target_entries = [
+        entry for entry in message_entry
+        if not (
             entry["channel_id"] == parent_channel_id
             and entry["guild_id"] == source_guild_id
             and entry.get("thread_id") == thread_id
-        ):
-            continue
+        )
+    ]
 
-        await _apply_reaction_to_entry(bot, entry, emoji, operation)
+    await _apply_to_entries(bot, message_id, target_entries, _apply_reaction_to_entry, emoji, operation)
 
 
-async def _process_forum_thread_message_reaction(bot, message: discord.Message, emoji, operation: str):
+async def _process_forum_thread_message_reaction(bot, thread: discord.Thread, message_id: int, emoji, operation: str):
     """Handle reaction propagation for messages posted inside forum threads."""
-    thread = message.channel
     parent_channel_id = str(thread.parent_id)
-    target_channel_ids = helpers.find_linked_channels(parent_channel_id)
-    if target_channel_ids is None:
-        logger.debug(f"No linked channels configured for forum parent channel {parent_channel_id}")
-        return
-
     group_name = helpers.get_group_name(parent_channel_id)
     if not group_name:
         logger.warning(f"No group name found for forum parent channel {parent_channel_id}")
         return
 
-    message_entry = database.get_message_group_entry_by_message_id(str(message.id), group_name)
+    message_entry = await async_database.get_message_group_entry_by_message_id(str(message_id), group_name)
     if not message_entry:
-        logger.debug(f"No forum message entry found for message {message.id} in group {group_name}")
+        logger.debug(f"No forum message entry found for message {message_id} in group {group_name}")
         return
 
     thread_id = str(thread.id)
-    for entry in message_entry:
-        # Forum mappings store thread_id as the actual destination thread ID.
-        if entry.get("thread_id") == thread_id:
-            continue
+    # Forum mappings store thread_id as the actual destination thread ID.
+    target_entries = [entry for entry in message_entry if entry.get("thread_id") != thread_id]
+
+    await _apply_to_entries(bot, message_id, target_entries, _apply_reaction_to_forum_entry, emoji, operation)
 
-        await _apply_reaction_to_forum_entry(bot, entry, emoji, operation)
+
+async def _apply_to_entries(bot, message_id: int, entries: list, apply, emoji, operation: str):
+    """Apply a reaction operation to every linked entry, bounded per source message."""
+    async def apply_one(entry: dict):
+        async with reaction_aggregator.slot(message_id):
+            await apply(bot, entry, emoji, operation)
+
+    await fan_out(entries, apply_one)
 
 
 async def _apply_reaction_to_entry(bot, entry: dict, emoji, operation: str):
-    """Fetch the linked message represented by entry and apply the requested reaction operation."""
+    """Apply the requested reaction operation to the linked message represented by entry."""
     target_channel = await _resolve_channel(bot, entry.get("guild_id"), entry["channel_id"])
     if target_channel is None:
         logger.warning(f"Target channel {entry['channel_id']} could not be resolved for reaction sync.")
         return
 
-    try:
-        if "thread_id" in entry:
-            parent_message = await target_channel.fetch_message(int(entry["thread_id"]))
-            target_thread = parent_message.thread
-            if not target_thread:
-                logger.warning(f"No thread found for parent message {entry['thread_id']} in channel {target_channel.id}")
-                return
-            target_message = await target_thread.fetch_message(int(entry["message_id"]))
-        else:
-            target_message = await target_channel.fetch_message(int(entry["message_id"]))
-    except discord.Forbidden:
-        logger.error(f"No permission to fetch linked message {entry['message_id']} in channel {target_channel.id}")
-        return
-    except discord.NotFound:
-        logger.warning(f"Linked message {entry['message_id']} not found in channel {target_channel.id}")
-        return
-    except discord.HTTPException as exc:
-        logger.error(f"Failed to fetch linked message {entry['message_id']}: {exc}")
-        return
+    if "thread_id" in entry:
+        # Address the mirror thread directly instead of going through its parent message.
+        target_thread = bot.get_partial_messageable(int(helpers.get_mirror_thread_id(entry)), guild_id=target_channel.guild.id)
+        target_message = target_thread.get_partial_message(int(entry["message_id"]))
+    else:
+        target_message = target_channel.get_partial_message(int(entry["message_id"]))
 
-    await _apply_reaction(bot, target_message, emoji, operation)
+    await _apply_reaction(bot, target_message, emoji, operation, entry["channel_id"])
 
 
 async def _apply_reaction_to_forum_entry(bot, entry: dict, emoji, operation: str):
-    """Fetch the linked forum-thread message represented by entry and apply the reaction."""
-    try:
-        target_thread = bot.get_channel(int(entry["thread_id"])) or await bot.fetch_channel(int(entry["thread_id"]))
-    except (discord.NotFound, discord.Forbidden):
-        logger.warning(f"Forum thread {entry['thread_id']} could not be resolved for reaction sync.")
-        return
-    except discord.HTTPException as exc:
-        logger.error(f"Failed to fetch forum thread {entry['thread_id']}: {exc}")
-        return
-
-    try:
-        target_message = await target_thread.fetch_message(int(entry["message_id"]))
-    except discord.Forbidden:
-        logger.error(f"No permission to fetch linked forum message {entry['message_id']} in thread {entry['thread_id']}")
-        return
-    except discord.NotFound:
-        logger.warning(f"Linked forum message {entry['message_id']} not found in thread {entry['thread_id']}")
-        return
-    except discord.HTTPException as exc:
-        logger.error(f"Failed to fetch linked forum message {entry['message_id']}: {exc}")
-        return
+    """Apply the reaction to the linked forum-thread message represented by entry."""
+    # Forum mappings store thread_id as the actual destination thread ID.
+    target_thread = bot.get_partial_messageable(int(entry["thread_id"]), guild_id=int(entry["guild_id"]) if entry.get("guild_id") else None)
+    target_message = target_thread.get_partial_message(int(entry["message_id"]))
 
-    await _apply_reaction(bot, target_message, emoji, operation)
+    await _apply_reaction(bot, target_message, emoji, operation, entry["channel_id"])
 
 
-async def _apply_reaction(bot, message: discord.Message, emoji, operation: str):
+async def _apply_reaction(bot, message: discord.PartialMessage, emoji, operation: str, destination_id=None):
     """Add or remove the specified reaction on the provided message."""
     try:
         if operation == "add":
-            await message.add_reaction(emoji)
+            await outbound.submit(ADD_REACTION, message.channel.id, lambda: message.add_reaction(emoji), destination_id=destination_id)
         elif operation == "remove":
-            await message.remove_reaction(emoji, bot.user)
+            await outbound.submit(REMOVE_REACTION, message.channel.id, lambda: message.remove_reaction(emoji, bot.user), destination_id=destination_id)
+    except CircuitOpenError:
+        logger.debug(f"Skipping reaction {emoji} on message {message.id}, destination circuit is open")
     except discord.HTTPException as exc:
         if operation == "add" and exc.status == 400:
             logger.debug(f"Reaction {emoji} already exists on message {message.id}")
@@ -1,9 +1,17 @@
 from datetime import timezone
+from typing import Optional
 import discord
 import helpers
-import database
+from attachments import AttachmentFanout
+from fanout import fan_out
+import async_database
 import message_send
 from header_state import header_state
+from delivery_queue import Dispatch, delivery_queues
+from sender_pool import sender_pool
+from delivery_retry import delivery_retries
+from webhook_pool import webhook_pool
+from circuit_breaker import destination_breakers
 from logger_config import get_logger
 
 logger = get_logger(__name__)
@@ -18,8 +26,10 @@ def _is_forum_thread(thread: discord.Thread) -> bool:
     return getattr(parent, "type", None) == discord.ChannelType.forum
 
 
-async def handle_reply_message_in_channel(bot, message: discord.Message):
+async def handle_reply_message_in_channel(bot, message: discord.Message, dispatch: Optional[Dispatch] = None, saved_entry: Optional[list] = None):
     """Handles reply messages in general channels and forwards them to linked channels."""
+    if dispatch is None:
+        dispatch = delivery_queues.open_dispatch([])
 
     timestamp = message.created_at
     if timestamp.tzinfo is None:
@@ -35,11 +45,11 @@ async def handle_reply_message_in_channel(bot, message: discord.Message):
 
     group_name = helpers.get_group_name(channel_id_for_lookup)
     referenced_message_id = message.reference.message_id
-    referenced_message_entry = database.get_message_group_entry_by_message_id(referenced_message_id, group_name)
+    referenced_message_entry = await async_database.get_message_group_entry_by_message_id(referenced_message_id, group_name)
 
     if not referenced_message_entry:
         logger.warning(f"No message group entry found for referenced message {referenced_message_id}, treating as regular message")
-        await message_send.handle_message(bot, message)
+        await message_send.handle_message(bot, message, dispatch=dispatch, saved_entry=saved_entry)
         return
 
     message_group_entry = [{
@@ -56,95 +66,139 @@ async def handle_reply_message_in_channel(bot, message: discord.Message):
     if source_changed:
         logger.debug("[header] group source changed group=%s source_guild=%s", group_name, source_guild_id)
 
-    for target_channel_id in target_channel_ids:
+    # The mapping is saved before the fan-out and each mirror added once delivered, so a resumed
+    # message (saved_entry) only goes to the destinations that have no mirror yet.
+    pending = helpers.unmirrored(target_channel_ids, saved_entry)
+    if not pending:
+        return
+    if saved_entry is None:
+        try:
+            await async_database.save_message_group_entry(group_name, message_group_entry)
+        except Exception as e:
+            logger.error(f"Failed to save reply message group entry: {e}")
+
+    header_text = await helpers.form_header(message, guild_name, channel_group_len)
+    attachments = await AttachmentFanout.from_message(message)
+
+    async def deliver(target_channel_id: str):
+        if destination_breakers.is_open(target_channel_id):
+            logger.debug(f"Skipping target channel {target_channel_id}, its circuit is open")
+            return None
         target_channel = bot.get_channel(int(target_channel_id))
         target_guild_id = helpers.get_guild_id_from_channel_id(target_channel_id)
-        if target_channel:
-            target_referenced_message_id = None
-
-            for entry in referenced_message_entry:
-                if entry["guild_id"] == target_guild_id and entry["channel_id"] == target_channel_id:
-                    logger.info(f"Found entry for target channel {target_channel_id} in message group entry")
-                    target_referenced_message_id = entry["message_id"]
-                    break
-                else:
-                    logger.info(f"No entry found for target channel {target_channel_id} in message group entry")
+        if not target_channel:
+            logger.error(f"Target channel with ID {target_channel_id} not found")
+            destination_breakers.record_failure(target_channel_id, "channel not found")
+            return None
 
-            try:
-                reference = None
-                if target_referenced_message_id:
-                    reference = discord.MessageReference(
-                        message_id=int(target_referenced_message_id),
-                        channel_id=target_channel.id,
-                        guild_id=target_channel.guild.id
-                    )
-            except Exception as e:
-                logger.error(f"Failed to create message reference for {target_channel.guild.name}#{target_channel.name}: {e}")
+        target_referenced_message_id = None
 
-            lock = header_state.get_lock(group_name, target_channel_id, None)
-            async with lock:
-                include_header, reason, prev_state = header_state.decide_header(
-                    group_name=group_name,
-                    channel_id=target_channel_id,
-                    thread_id=None,
-                    author_id=author_id,
-                    source_guild_id=source_guild_id,
-                    timestamp=timestamp,
-                    is_reply=True,
+        for entry in referenced_message_entry:
+            if entry["guild_id"] == target_guild_id and entry["channel_id"] == target_channel_id:
+                logger.info(f"Found entry for target channel {target_channel_id} in message group entry")
+                target_referenced_message_id = entry["message_id"]
+                break
+            else:
+                logger.info(f"No entry found for target channel {target_channel_id} in message group entry")
+
+        try:
+            reference = None
+            if target_referenced_message_id:
+                reference = discord.MessageReference(
+                    message_id=int(target_referenced_message_id),
+                    channel_id=target_channel.id,
+                    guild_id=target_channel.guild.id
                 )
+        except Exception as e:
+            logger.error(f"Failed to create message reference for {target_channel.guild.name}#{target_channel.name}: {e}")
 
-                logger.debug(
-                    "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
-                    group_name, target_channel_id, None, include_header, reason, author_id, source_guild_id, prev_state,
-                )
+        webhook = await webhook_pool.get(target_channel)
+        async with dispatch.turn(target_channel_id):
+            include_header, reason, prev_state = header_state.decide_header(
+                group_name=group_name,
+                channel_id=target_channel_id,
+                thread_id=None,
+                author_id=author_id,
+                source_guild_id=source_guild_id,
+                timestamp=timestamp,
+                is_reply=True,
+            )
 
-                header = helpers.form_header(message, guild_name, channel_group_len) if include_header else ""
-                msg = helpers.form_message_text(header, message.content)
+            logger.debug(
+                "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
+                group_name, target_channel_id, None, include_header, reason, author_id, source_guild_id, prev_state,
+            )
 
-                try:
-                    files = await helpers.process_attachments(message)
-                    global_stickers, guild_sticker_files = await helpers.process_stickers(message)
-                    files += guild_sticker_files
+            if webhook:
+                include_header = False
+            header = header_text if include_header else ""
+            msg = helpers.form_message_text(header, message.content)
+
+            async def send():
+                files = attachments.files()
+                global_stickers, guild_sticker_files = await helpers.process_stickers(message)
+                files += guild_sticker_files
 
-                    result = await target_channel.send(
+                if webhook:
+                    result = await webhook_pool.send(
+                        webhook,
+                        target_channel,
+                        message,
+                        guild_name,
                         content=msg,
                         embed=message.embeds[0] if message.embeds else None,
                         files=files if files else None,
                         stickers=global_stickers if global_stickers else None,
                         reference=reference
                     )
-                    header_state.update_state(
-                        group_name=group_name,
-                        channel_id=target_channel_id,
-                        thread_id=None,
-                        author_id=author_id,
-                        source_guild_id=source_guild_id,
-                        timestamp=timestamp,
+                else:
+                    result = await sender_pool.send(
+                        target_channel,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=files if files else None,
+                        stickers=global_stickers if global_stickers else None,
+                        reference=reference,
+                        attachments=attachments
                     )
-                except Exception as e:
-                    logger.error(f"Failed to send reply message to {target_channel.guild.name}#{target_channel.name}: {e}")
-                    return
+                # Here rather than after the first attempt, so a late delivery by the retry queue counts too.
+                header_state.update_state(
+                    group_name=group_name,
+                    channel_id=target_channel_id,
+                    thread_id=None,
+                    author_id=author_id,
+                    source_guild_id=source_guild_id,
+                    timestamp=timestamp,
+                )
+                return result
 
-                entry = {
-                    "guild_id": target_guild_id,
-                    "channel_id": target_channel_id,
-                    "message_id": str(result.id)
-                }
-                message_group_entry.append(entry)
-        else:
-            logger.error(f"Target channel with ID {target_channel_id} not found")
-            return
+            entry = {
+                "guild_id": target_guild_id,
+                "channel_id": target_channel_id,
+                "has_header": include_header
+            }
 
-    group_name = helpers.get_group_name(channel_id_for_lookup)
-    try:
-        database.save_message_group_entry(group_name, message_group_entry)
-        logger.info(f"Reply message successfully forwarded and saved")
-    except Exception as e:
-        logger.error(f"Failed to save reply message group entry: {e}")
+            try:
+                result = await send()
+            except Exception as e:
+                logger.error(f"Failed to send reply message to {target_channel.guild.name}#{target_channel.name}: {e}")
+                delivery_retries.schedule(e, group_name, message.id, target_channel_id, send, entry, attachments)
+                return None
 
+            helpers.set_mirror_message(entry, result)
+            await helpers.record_mirror(group_name, message.id, entry)
+            return entry
 
-async def handle_reply_message_in_thread(bot, message: discord.Message):
+    # Queue up at the destinations only now that the payload is ready.
+    dispatch.reserve(pending)
+    await fan_out(pending, dispatch.delivering(deliver))
+    attachments.close()
+
+
+async def handle_reply_message_in_thread(bot, message: discord.Message, dispatch: Optional[Dispatch] = None, saved_entry: Optional[list] = None):
     """Handles reply messages in threads and forwards them to linked channels."""
+    if dispatch is None:
+        dispatch = delivery_queues.open_dispatch([])
 
     timestamp = message.created_at
     if timestamp.tzinfo is None:
@@ -161,17 +215,18 @@ async def handle_reply_message_in_thread(bot, message: discord.Message):
 
     group_name = helpers.get_group_name(parent_channel_id)
     referenced_message_id = message.reference.message_id
-    referenced_message_entry = database.get_message_group_entry_by_message_id(referenced_message_id, group_name)
+    referenced_message_entry = await async_database.get_message_group_entry_by_message_id(referenced_message_id, group_name)
 
     if not referenced_message_entry:
         logger.warning(f"No message group entry found for referenced message {referenced_message_id}, treating as regular message")
-        await message_send.handle_message(bot, message)
+        await message_send.handle_message(bot, message, dispatch=dispatch, saved_entry=saved_entry)
         return
 
     message_group_entry = [{
         "guild_id": helpers.get_guild_id_from_channel_id(parent_channel_id),
         "channel_id": parent_channel_id,
         "thread_id": str(message.channel.id),
+        "thread_channel_id": str(message.channel.id),
         "message_id": str(message.id)
     }]
 
@@ -183,72 +238,114 @@ async def handle_reply_message_in_thread(bot, message: discord.Message):
     if source_changed:
         logger.debug("[header] group source changed group=%s source_guild=%s", group_name, source_guild_id)
 
-    for target_channel_id in target_channel_ids:
+    pending = helpers.unmirrored(target_channel_ids, saved_entry)
+    if not pending:
+        return
+    if saved_entry is None:
+        try:
+            await async_database.save_message_group_entry(group_name, message_group_entry)
+        except Exception as e:
+            logger.error(f"Failed to save reply message group entry: {e}")
+
+    header_text = await helpers.form_header(message, guild_name, channel_group_len)
+    attachments = await AttachmentFanout.from_message(message)
+
+    async def deliver(target_channel_id: str):
+        if destination_breakers.is_open(target_channel_id):
+            logger.debug(f"Skipping target channel {target_channel_id}, its circuit is open")
+            return None
         target_channel = bot.get_channel(int(target_channel_id))
         target_guild_id = helpers.get_guild_id_from_channel_id(target_channel_id)
-        if target_channel:
-            target_referenced_message_id = None
-            target_thread_id = None
-
-            for entry in referenced_message_entry:
-                if entry["guild_id"] == target_guild_id and entry["channel_id"] == target_channel_id:
-                    target_referenced_message_id = entry["message_id"]
-                    target_thread_id = entry["thread_id"]
-                    break
-                else:
-                    logger.info(f"No entry found for target channel {target_channel_id} in thread message group entry")
+        if not target_channel:
+            logger.error(f"Target channel with ID {target_channel_id} not found")
+            destination_breakers.record_failure(target_channel_id, "channel not found")
+            return None
+
+        target_referenced_message_id = None
+        target_thread_id = None
+        target_thread_channel_id = None
+
+        for entry in referenced_message_entry:
+            if entry["guild_id"] == target_guild_id and entry["channel_id"] == target_channel_id:
+                target_referenced_message_id = entry["message_id"]
+                target_thread_id = entry["thread_id"]
+                target_thread_channel_id = helpers.get_mirror_thread_id(entry)
+                break
+            else:
+                logger.info(f"No entry found for target channel {target_channel_id} in thread message group entry")
 
+        target_thread = target_channel.get_thread(int(target_thread_channel_id)) if target_thread_channel_id else None
+        if target_thread is None:
             try:
                 parent_message = await target_channel.fetch_message(target_thread_id)
             except Exception as e:
                 logger.warning(f"Failed to fetch parent message in {target_channel.guild.name}#{target_channel.name}: {e}")
-                return
-
-            if parent_message.thread:
-                target_thread = parent_message.thread
-                reference = None
-                if target_referenced_message_id:
-                    try:
-                        reference = discord.MessageReference(
-                            message_id=int(target_referenced_message_id),
-                            channel_id=target_thread.id,
-                            guild_id=target_channel.guild.id
-                        )
-                    except Exception as e:
-                        logger.error(f"Failed to create message reference for thread {target_thread.name}: {e}")
-                        reference = None
+                destination_breakers.record_result(target_channel_id, e)
+                return None
+            target_thread = parent_message.thread
 
-                lock = header_state.get_lock(group_name, target_channel_id, target_thread.id)
-                async with lock:
-                    include_header, reason, prev_state = header_state.decide_header(
-                        group_name=group_name,
-                        channel_id=target_channel_id,
-                        thread_id=str(target_thread.id),
-                        author_id=author_id,
-                        source_guild_id=source_guild_id,
-                        timestamp=timestamp,
-                        is_reply=True,
+        if target_thread:
+            reference = None
+            if target_referenced_message_id:
+                try:
+                    reference = discord.MessageReference(
+                        message_id=int(target_referenced_message_id),
+                        channel_id=target_thread.id,
+                        guild_id=target_channel.guild.id
                     )
+                except Exception as e:
+                    logger.error(f"Failed to create message reference for thread {target_thread.name}: {e}")
+                    reference = None
 
-                    logger.debug(
-                        "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
-                        group_name, target_channel_id, target_thread.id, include_header, reason, author_id, source_guild_id, prev_state,
-                    )
+            webhook = await webhook_pool.get(target_thread)
+            async with dispatch.turn(target_channel_id, message.channel.id):
+                include_header, reason, prev_state = header_state.decide_header(
+                    group_name=group_name,
+                    channel_id=target_channel_id,
+                    thread_id=str(target_thread.id),
+                    author_id=author_id,
+                    source_guild_id=source_guild_id,
+                    timestamp=timestamp,
+                    is_reply=True,
+                )
+
+                logger.debug(
+                    "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
+                    group_name, target_channel_id, target_thread.id, include_header, reason, author_id, source_guild_id, prev_state,
+                )
 
-                    header = helpers.form_header(message, guild_name, channel_group_len) if include_header else ""
-                    msg = helpers.form_message_text(header, message.content)
+                if webhook:
+                    include_header = False
+                header = header_text if include_header else ""
+                msg = helpers.form_message_text(header, message.content)
 
-                    files = await helpers.process_attachments(message)
+                async def send():
+                    files = attachments.files()
                     global_stickers, guild_sticker_files = await helpers.process_stickers(message)
                     files += guild_sticker_files
 
-                    result = await target_thread.send(
-                        content=msg,
-                        embed=message.embeds[0] if message.embeds else None,
-                        files=files if files else None,
-                        stickers=global_stickers if global_stickers else None,
-                        reference=reference
-                    )
+                    if webhook:
+                        result = await webhook_pool.send(
+                            webhook,
+                            target_thread,
+                            message,
+                            guild_name,
+                            content=msg,
+                            embed=message.embeds[0] if message.embeds else None,
+                            files=files if files else None,
+                            stickers=global_stickers if global_stickers else None,
+                            reference=reference
+                        )
+                    else:
+                        result = await sender_pool.send(
+                            target_thread,
+                            content=msg,
+                            embed=message.embeds[0] if message.embeds else None,
+                            files=files if files else None,
+                            stickers=global_stickers if global_stickers else None,
+                            reference=reference,
+                            attachments=attachments
+                        )
                     header_state.update_state(
                         group_name=group_name,
                         channel_id=target_channel_id,
@@ -257,31 +354,40 @@ async def handle_reply_message_in_thread(bot, message: discord.Message):
                         source_guild_id=source_guild_id,
                         timestamp=timestamp,
                     )
-            else:
-                logger.error(f"Parent message does not have a thread in {target_channel.guild.name}#{target_channel.name}")
-                return
+                    return result
 
-            entry = {
-                "guild_id": target_guild_id,
-                "channel_id": target_channel_id,
-                "thread_id": target_thread_id,
-                "message_id": str(result.id)
-            }
-            message_group_entry.append(entry)
+                entry = {
+                    "guild_id": target_guild_id,
+                    "channel_id": target_channel_id,
+                    "thread_id": target_thread_id,
+                    "thread_channel_id": str(target_thread.id),
+                    "has_header": include_header
+                }
+
+                try:
+                    result = await send()
+                except Exception as e:
+                    logger.error(f"Failed to send thread reply to {target_channel.guild.name}#{target_channel.name}: {e}")
+                    delivery_retries.schedule(e, group_name, message.id, target_thread.id, send, entry, attachments)
+                    return None
         else:
-            logger.error(f"Target channel with ID {target_channel_id} not found")
-            return
+            logger.error(f"Parent message does not have a thread in {target_channel.guild.name}#{target_channel.name}")
+            return None
 
-    group_name = helpers.get_group_name(parent_channel_id)
-    try:
-        database.save_message_group_entry(group_name, message_group_entry)
-        logger.info(f"Thread reply message successfully forwarded and saved")
-    except Exception as e:
-        logger.error(f"Failed to save reply message group entry: {e}")
+        helpers.set_mirror_message(entry, result)
+        await helpers.record_mirror(group_name, message.id, entry)
+        return entry
+
+    # Queue up at the destinations only now that the payload is ready.
+    dispatch.reserve(pending, message.channel.id)
+    await fan_out(pending, dispatch.delivering(deliver, message.channel.id))
+    attachments.close()
 
 
-async def handle_forum_thread_reply_message(bot, message: discord.Message):
+async def handle_forum_thread_reply_message(bot, message: discord.Message, dispatch: Optional[Dispatch] = None, saved_entry: Optional[list] = None):
     """Handles reply messages in forum threads and forwards them to linked forum threads."""
+    if dispatch is None:
+        dispatch = delivery_queues.open_dispatch([])
     if message.author == bot.user:
         return
     if message.webhook_id:
@@ -296,7 +402,7 @@ async def handle_forum_thread_reply_message(bot, message: discord.Message):
     if not group_name:
         return
 
-    thread_entry = database.get_forum_thread_group_entry_by_thread_id(str(message.channel.id), group_name)
+    thread_entry = await async_database.get_forum_thread_group_entry_by_thread_id(str(message.channel.id), group_name)
     if not thread_entry:
         return
 
@@ -304,9 +410,9 @@ async def handle_forum_thread_reply_message(bot, message: discord.Message):
     if not referenced_message_id:
         return
 
-    referenced_entry = database.get_message_group_entry_by_message_id(str(referenced_message_id), group_name)
+    referenced_entry = await async_database.get_message_group_entry_by_message_id(str(referenced_message_id), group_name)
     if not referenced_entry:
-        await message_send.handle_forum_thread_message(bot, message, ignore_reference=True)
+        await message_send.handle_forum_thread_message(bot, message, ignore_reference=True, dispatch=dispatch, saved_entry=saved_entry)
         return
 
     target_channel_ids = helpers.find_linked_channels(parent_channel_id)
@@ -330,17 +436,31 @@ async def handle_forum_thread_reply_message(bot, message: discord.Message):
         "message_id": str(message.id)
     }]
 
-    for entry in thread_entry:
-        if entry["thread_id"] == str(message.channel.id):
-            continue
-
+    target_entries = [entry for entry in thread_entry if entry["thread_id"] != str(message.channel.id)]
+    pending = helpers.unmirrored(target_entries, saved_entry, channel_of=lambda entry: entry["channel_id"])
+    if not pending:
+        return
+    if saved_entry is None:
+        try:
+            await async_database.save_message_group_entry(group_name, message_group_entry)
+        except Exception as e:
+            logger.error(f"Failed to save forum reply group entry: {e}")
+
+    header_text = await helpers.form_header(message, guild_name, channel_group_len)
+    attachments = await AttachmentFanout.from_message(message)
+
+    async def deliver(entry: dict):
+        if destination_breakers.is_open(entry["channel_id"]):
+            logger.debug(f"Skipping forum thread {entry['thread_id']}, the circuit of {entry['channel_id']} is open")
+            return None
         target_thread = bot.get_channel(int(entry["thread_id"]))
         if not target_thread:
             try:
                 target_thread = await bot.fetch_channel(int(entry["thread_id"]))
             except Exception as e:
                 logger.error(f"Failed to fetch target forum thread {entry['thread_id']}: {e}")
-                continue
+                destination_breakers.record_result(entry["channel_id"], e)
+                return None
 
         target_referenced_message_id = None
         for ref_entry in referenced_entry:
@@ -356,8 +476,8 @@ async def handle_forum_thread_reply_message(bot, message: discord.Message):
                 guild_id=target_thread.guild.id
             )
 
-        lock = header_state.get_lock(group_name, entry["channel_id"], entry["thread_id"])
-        async with lock:
+        webhook = await webhook_pool.get(target_thread)
+        async with dispatch.turn(entry["channel_id"], message.channel.id):
             include_header, _, _ = header_state.decide_header(
                 group_name=group_name,
                 channel_id=entry["channel_id"],
@@ -368,21 +488,38 @@ async def handle_forum_thread_reply_message(bot, message: discord.Message):
                 is_reply=True,
             )
 
-            header = helpers.form_header(message, guild_name, channel_group_len) if include_header else ""
+            if webhook:
+                include_header = False
+            header = header_text if include_header else ""
             msg = helpers.form_message_text(header, message.content)
 
-            try:
-                files = await helpers.process_attachments(message)
+            async def send():
+                files = attachments.files()
                 global_stickers, guild_sticker_files = await helpers.process_stickers(message)
                 files += guild_sticker_files
 
-                result = await target_thread.send(
-                    content=msg,
-                    embed=message.embeds[0] if message.embeds else None,
-                    files=files if files else None,
-                    stickers=global_stickers if global_stickers else None,
-                    reference=reference
-                )
+                if webhook:
+                    result = await webhook_pool.send(
+                        webhook,
+                        target_thread,
+                        message,
+                        guild_name,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=files if files else None,
+                        stickers=global_stickers if global_stickers else None,
+                        reference=reference
+                    )
+                else:
+                    result = await sender_pool.send(
+                        target_thread,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=files if files else None,
+                        stickers=global_stickers if global_stickers else None,
+                        reference=reference,
+                        attachments=attachments
+                    )
                 header_state.update_state(
                     group_name=group_name,
                     channel_id=entry["channel_id"],
@@ -391,16 +528,25 @@ async def handle_forum_thread_reply_message(bot, message: discord.Message):
                     source_guild_id=source_guild_id,
                     timestamp=timestamp,
                 )
-                message_group_entry.append({
-                    "guild_id": entry["guild_id"],
-                    "channel_id": entry["channel_id"],
-                    "thread_id": entry["thread_id"],
-                    "message_id": str(result.id)
-                })
+                return result
+
+            mirror_entry = {
+                "guild_id": entry["guild_id"],
+                "channel_id": entry["channel_id"],
+                "thread_id": entry["thread_id"],
+                "has_header": include_header
+            }
+
+            try:
+                result = await send()
+                helpers.set_mirror_message(mirror_entry, result)
+                await helpers.record_mirror(group_name, message.id, mirror_entry)
+                return mirror_entry
             except Exception as e:
                 logger.error(f"Failed to send forum thread reply to {entry['thread_id']}: {e}")
+                delivery_retries.schedule(e, group_name, message.id, entry["thread_id"], send, mirror_entry, attachments)
 
-    try:
-        database.save_message_group_entry(group_name, message_group_entry)
-    except Exception as e:
-        logger.error(f"Failed to save forum reply group entry: {e}")
+    # Queue up at the destinations only now that the payload is ready.
+    dispatch.reserve([entry["channel_id"] for entry in pending], message.channel.id)
+    await fan_out(pending, dispatch.delivering(deliver, message.channel.id, channel_of=lambda entry: entry["channel_id"]))
+    attachments.close()
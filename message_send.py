@@ -1,14 +1,25 @@
 from datetime import timezone
+from typing import Optional
 import discord
 import helpers
-import database
+from attachments import AttachmentFanout
+from fanout import fan_out
+import async_database
 from header_state import header_state
+from delivery_queue import Dispatch, delivery_queues
+from sender_pool import sender_pool
+from delivery_retry import delivery_retries
+from webhook_pool import webhook_pool
+from circuit_breaker import destination_breakers
+from outbound import outbound, CREATE_MESSAGE_THREAD
 from logger_config import get_logger
 
 logger = get_logger(__name__)
 
-async def handle_message(bot, message: discord.Message):
+async def handle_message(bot, message: discord.Message, dispatch: Optional[Dispatch] = None, saved_entry: Optional[list] = None):
     """Handles incoming messages and forwards them to linked channels."""
+    if dispatch is None:
+        dispatch = delivery_queues.open_dispatch([])
 
     timestamp = message.created_at
     if timestamp.tzinfo is None:
@@ -37,89 +48,123 @@ async def handle_message(bot, message: discord.Message):
     if source_changed:
         logger.debug("[header] group source changed group=%s source_guild=%s", group_name, source_guild_id)
 
-    for target_channel_id in target_channel_ids:
+    # The mapping is saved before the fan-out and each mirror added once delivered, so a resumed
+    # message (saved_entry) only goes to the destinations that have no mirror yet.
+    pending = helpers.unmirrored(target_channel_ids, saved_entry)
+    if not pending:
+        return
+    if saved_entry is None:
+        try:
+            await async_database.save_message_group_entry(group_name, message_group_entry)
+        except Exception as e:
+            logger.error(f"Failed to save message group entry: {e}")
+
+    # The header only depends on the source message, so render it once for all destinations.
+    header_text = await helpers.form_header(message, guild_name, channel_group_len)
+    attachments = await AttachmentFanout.from_message(message)
+
+    async def deliver(target_channel_id: str):
+        if destination_breakers.is_open(target_channel_id):
+            logger.debug(f"Skipping target channel {target_channel_id}, its circuit is open")
+            return None
         target_channel = bot.get_channel(int(target_channel_id))
         target_guild_id = helpers.get_guild_id_from_channel_id(target_channel_id)
-        if target_channel:
-            lock = header_state.get_lock(group_name, target_channel_id, None)
-            async with lock:
-                include_header = header_state.should_include_header(
-                    group_name=group_name,
-                    channel_id=target_channel_id,
-                    thread_id=None,
-                    author_id=author_id,
-                    source_guild_id=source_guild_id,
-                    timestamp=timestamp,
-                    is_reply=False,
-                )
+        if not target_channel:
+            logger.error(f"Target channel with ID {target_channel_id} not found")
+            destination_breakers.record_failure(target_channel_id, "channel not found")
+            return None
 
-                include_header, reason, prev_state = header_state.decide_header(
-                    group_name=group_name,
-                    channel_id=target_channel_id,
-                    thread_id=None,
-                    author_id=author_id,
-                    source_guild_id=source_guild_id,
-                    timestamp=timestamp,
-                    is_reply=False,
-                )
+        webhook = await webhook_pool.get(target_channel)
+        async with dispatch.turn(target_channel_id):
+            include_header, reason, prev_state = header_state.decide_header(
+                group_name=group_name,
+                channel_id=target_channel_id,
+                thread_id=None,
+                author_id=author_id,
+                source_guild_id=source_guild_id,
+                timestamp=timestamp,
+                is_reply=False,
+            )
 
-                logger.debug(
-                    "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
-                    group_name, target_channel_id, None, include_header, reason, author_id, source_guild_id, prev_state,
-                )
+            logger.debug(
+                "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
+                group_name, target_channel_id, None, include_header, reason, author_id, source_guild_id, prev_state,
+            )
 
-                header = helpers.form_header(message, guild_name, channel_group_len) if include_header else ""
-                msg = helpers.form_message_text(header, message.content)
+            if webhook:
+                # A webhook shows the author's name and avatar, so it needs no header line.
+                include_header = False
+            header = header_text if include_header else ""
+            msg = helpers.form_message_text(header, message.content)
 
-                # Send the message to the target channel
-                try:
-                    # Process attachments and stickers
-                    files = await helpers.process_attachments(message)
-                    global_stickers, guild_sticker_files = await helpers.process_stickers(message)
+            async def send():
+                # Process attachments and stickers
+                files = attachments.files()
+                global_stickers, guild_sticker_files = await helpers.process_stickers(message)
 
-                    # Merge attachments + guild-native sticker files
-                    files += guild_sticker_files
+                # Merge attachments + guild-native sticker files
+                files += guild_sticker_files
 
-                    result = await target_channel.send(
+                if webhook:
+                    result = await webhook_pool.send(
+                        webhook,
+                        target_channel,
+                        message,
+                        guild_name,
                         content=msg,
                         embed=message.embeds[0] if message.embeds else None,
                         files=files if files else None,
                         stickers=global_stickers if global_stickers else None
                     )
-                    header_state.update_state(
-                        group_name=group_name,
-                        channel_id=target_channel_id,
-                        thread_id=None,
-                        author_id=author_id,
-                        source_guild_id=source_guild_id,
-                        timestamp=timestamp,
+                else:
+                    result = await sender_pool.send(
+                        target_channel,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=files if files else None,
+                        stickers=global_stickers if global_stickers else None,
+                        attachments=attachments
                     )
-                    logger.debug(f"Message forwarded to {target_channel.guild.name}#{target_channel.name}")
-                except Exception as e:
-                    logger.error(f"Failed to send message to {target_channel.guild.name}#{target_channel.name}: {e}")
-                    continue
+                # Here rather than after the first attempt, so a late delivery by the retry queue counts too.
+                header_state.update_state(
+                    group_name=group_name,
+                    channel_id=target_channel_id,
+                    thread_id=None,
+                    author_id=author_id,
+                    source_guild_id=source_guild_id,
+                    timestamp=timestamp,
+                )
+                return result
 
-                # Form message entry for every linked channel
-                message_group_entry.append({
-                     "guild_id": target_guild_id,
-                     "channel_id": target_channel_id,
-                     "message_id": str(result.id)
-                })
+            entry = {
+                "guild_id": target_guild_id,
+                "channel_id": target_channel_id,
+                "has_header": include_header
+            }
 
-        else:
-            logger.error(f"Target channel with ID {target_channel_id} not found")
-            return
-        
-    # Save the message group entry to the database
-    group_name = helpers.get_group_name(str(message.channel.id))
-    try:
-        database.save_message_group_entry(group_name, message_group_entry)
-        logger.debug(f"Message group entry saved for group {group_name}")
-    except Exception as e:
-        logger.error(f"Failed to save message group entry: {e}")
+            # Send the message to the target channel
+            try:
+                result = await send()
+                logger.debug(f"Message forwarded to {target_channel.guild.name}#{target_channel.name}")
+            except Exception as e:
+                logger.error(f"Failed to send message to {target_channel.guild.name}#{target_channel.name}: {e}")
+                delivery_retries.schedule(e, group_name, message.id, target_channel_id, send, entry, attachments)
+                return None
+
+        # Form message entry for every linked channel
+        helpers.set_mirror_message(entry, result)
+        await helpers.record_mirror(group_name, message.id, entry)
+        return entry
 
-async def handle_thread_message(bot, message: discord.Message):
+    # Queue up at the destinations only now that the payload is ready.
+    dispatch.reserve(pending)
+    await fan_out(pending, dispatch.delivering(deliver))
+    attachments.close()
+
+async def handle_thread_message(bot, message: discord.Message, dispatch: Optional[Dispatch] = None, saved_entry: Optional[list] = None):
     """Handles messages in threads and forwards them to linked channels."""
+    if dispatch is None:
+        dispatch = delivery_queues.open_dispatch([])
     
     logger.info(f"Handling thread message from {message.author} in thread {message.channel.name}")
 
@@ -143,12 +188,12 @@ async def handle_thread_message(bot, message: discord.Message):
         "guild_id": helpers.get_guild_id_from_channel_id(parent_channel_id),
         "channel_id": parent_channel_id,
         "thread_id": str(message.channel.id),
+        "thread_channel_id": str(message.channel.id),
         "message_id": str(message.id)
     }]
 
     group_name = helpers.get_group_name(parent_channel_id)
     guild_name = message.guild.name if message.guild else "Unknown Guild"
-    thread_name = message.channel.name
     channel_group_len = len(target_channel_ids)
     author_id = str(message.author.id)
     source_guild_id = str(message.guild.id) if message.guild else "unknown"
@@ -156,118 +201,162 @@ async def handle_thread_message(bot, message: discord.Message):
     if source_changed:
         logger.debug("[header] group source changed group=%s source_guild=%s", group_name, source_guild_id)
 
-    thread_message_entry = database.get_message_group_entry_by_message_id(message.channel.id, group_name)
+    thread_message_entry = await async_database.get_message_group_entry_by_message_id(message.channel.id, group_name)
     
-    for target_channel_id in target_channel_ids:
+    pending = helpers.unmirrored(target_channel_ids, saved_entry)
+    if not pending:
+        return
+    if saved_entry is None:
+        try:
+            await async_database.save_message_group_entry(group_name, message_group_entry)
+        except Exception as e:
+            logger.error(f"Failed to save thread message group entry: {e}")
+
+    header_text = await helpers.form_header(message, guild_name, channel_group_len)
+    attachments = await AttachmentFanout.from_message(message)
+
+    async def deliver(target_channel_id: str):
+        if destination_breakers.is_open(target_channel_id):
+            logger.debug(f"Skipping target channel {target_channel_id}, its circuit is open")
+            return None
         target_channel = bot.get_channel(int(target_channel_id))
         target_guild_id = helpers.get_guild_id_from_channel_id(target_channel_id)
-        
-        if target_channel:
-            target_thread_message_id = None
-            target_thread = None
-            try:
-                for entry in thread_message_entry:
-                    if entry["guild_id"] == target_guild_id and entry["channel_id"] == target_channel_id:
-                        target_thread_message_id = entry["message_id"]
-                        break
-                    else:
-                        logger.info(f"No entry found for target channel {target_channel_id} in thread message group entry")
-                if not target_thread_message_id:
-                    logger.warning(f"No parent thread message found for target channel {target_channel_id}")
-                    continue
+
+        if not target_channel:
+            logger.error(f"Target channel with ID {target_channel_id} not found")
+            destination_breakers.record_failure(target_channel_id, "channel not found")
+            return None
+
+        target_thread_message_id = None
+        target_thread = None
+        try:
+            for entry in thread_message_entry:
+                if entry["guild_id"] == target_guild_id and entry["channel_id"] == target_channel_id:
+                    target_thread_message_id = entry["message_id"]
+                    break
+                else:
+                    logger.info(f"No entry found for target channel {target_channel_id} in thread message group entry")
+            if not target_thread_message_id:
+                logger.warning(f"No parent thread message found for target channel {target_channel_id}")
+                return None
+
+            # A thread started from a message shares its ID; only go to the API when it is not cached.
+            target_thread = target_channel.get_thread(int(target_thread_message_id))
+            if target_thread is None:
                 try:
                     parent_message = await target_channel.fetch_message(target_thread_message_id)
                 except Exception as e:
                     logger.warning(f"Failed to fetch parent message in {target_channel.guild.name}#{target_channel.name}: {e}")
-                    return 
-                
-                parent_text = parent_message.content
-                thread_name = " ".join(parent_text.split()[:5])
-
-                # Process attachments and stickers
-                files = await helpers.process_attachments(message)
-                global_stickers, guild_sticker_files = await helpers.process_stickers(message)
+                    destination_breakers.record_result(target_channel_id, e)
+                    return None
 
-                # Merge attachments + guild-native sticker files
-                files += guild_sticker_files
+                parent_text = parent_message.content
+                target_thread_name = " ".join(parent_text.split()[:5])
 
                 if parent_message.thread:
                     target_thread = parent_message.thread
                 else:
                     try:
-                        thread = await parent_message.create_thread(
-                            name=f"{thread_name}",
+                        thread = await outbound.submit(
+                            CREATE_MESSAGE_THREAD,
+                            target_channel.id,
+                            lambda: parent_message.create_thread(name=f"{target_thread_name}"),
                         )
                         target_thread = thread
                     except Exception as e:
                         logger.info(f"Error while creating a new thread: {e}")
 
-            except Exception as e:
-                logger.error(f"Some error occurred while sending thread message to {target_channel.guild.name}#{target_channel.name}: {e}")
-            
-            if not target_thread:
-                logger.error(f"Could not resolve target thread for {target_channel.guild.name}#{target_channel.name}")
-                continue
-
-            lock = header_state.get_lock(group_name, target_channel_id, target_thread.id)
-            async with lock:
-                include_header, reason, prev_state = header_state.decide_header(
+        except Exception as e:
+            logger.error(f"Some error occurred while sending thread message to {target_channel.guild.name}#{target_channel.name}: {e}")
+
+        if not target_thread:
+            logger.error(f"Could not resolve target thread for {target_channel.guild.name}#{target_channel.name}")
+            return None
+
+        webhook = await webhook_pool.get(target_thread)
+        async with dispatch.turn(target_channel_id, message.channel.id):
+            include_header, reason, prev_state = header_state.decide_header(
+                group_name=group_name,
+                channel_id=target_channel_id,
+                thread_id=str(target_thread.id),
+                author_id=author_id,
+                source_guild_id=source_guild_id,
+                timestamp=timestamp,
+                is_reply=False,
+            )
+
+            logger.debug(
+                "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
+                group_name, target_channel_id, target_thread.id, include_header, reason, author_id, source_guild_id, prev_state,
+            )
+
+            if webhook:
+                include_header = False
+            header = header_text if include_header else ""
+            msg = helpers.form_message_text(header, message.content)
+
+            async def send():
+                # Process attachments and stickers
+                files = attachments.files()
+                global_stickers, guild_sticker_files = await helpers.process_stickers(message)
+
+                # Merge attachments + guild-native sticker files
+                files += guild_sticker_files
+
+                if webhook:
+                    result = await webhook_pool.send(
+                        webhook,
+                        target_thread,
+                        message,
+                        guild_name,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=files if files else None,
+                        stickers=global_stickers if global_stickers else None
+                    )
+                else:
+                    result = await sender_pool.send(
+                        target_thread,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=files if files else None,
+                        stickers=global_stickers if global_stickers else None,
+                        attachments=attachments
+                    )
+                header_state.update_state(
                     group_name=group_name,
                     channel_id=target_channel_id,
                     thread_id=str(target_thread.id),
                     author_id=author_id,
                     source_guild_id=source_guild_id,
                     timestamp=timestamp,
-                    is_reply=False,
                 )
+                return result
 
-                logger.debug(
-                    "[header] decision group=%s dest=%s thread=%s include=%s reason=%s author=%s source_guild=%s prev_state=%s",
-                    group_name, target_channel_id, target_thread.id, include_header, reason, author_id, source_guild_id, prev_state,
-                )
+            entry = {
+                "guild_id": target_guild_id,
+                "channel_id": target_channel_id,
+                "thread_id": target_thread_message_id,
+                "thread_channel_id": str(target_thread.id),
+                "has_header": include_header
+            }
+
+            try:
+                result = await send()
+            except Exception as e:
+                logger.error(f"Some error occurred while sending thread message to {target_channel.guild.name}#{target_channel.name}: {e}")
+                delivery_retries.schedule(e, group_name, message.id, target_thread.id, send, entry, attachments)
+                return None
 
-                header = helpers.form_header(message, guild_name, channel_group_len) if include_header else ""
-                msg = helpers.form_message_text(header, message.content)
+        # Form message entry for every linked channel
+        helpers.set_mirror_message(entry, result)
+        await helpers.record_mirror(group_name, message.id, entry)
+        return entry
 
-                try:
-                    result = await target_thread.send(
-                        content=msg,
-                        embed=message.embeds[0] if message.embeds else None,
-                        files=files if files else None,
-                        stickers=global_stickers if global_stickers else None
-                    )
-                    header_state.update_state(
-                        group_name=group_name,
-                        channel_id=target_channel_id,
-                        thread_id=str(target_thread.id),
-                        author_id=author_id,
-                        source_guild_id=source_guild_id,
-                        timestamp=timestamp,
-                    )
-                except Exception as e:
-                    logger.error(f"Some error occurred while sending thread message to {target_channel.guild.name}#{target_channel.name}: {e}")
-                    continue
-
-                # Form message entry for every linked channel
-                entry = {
-                    "guild_id": target_guild_id,
-                    "channel_id": target_channel_id,
-                    "thread_id": target_thread_message_id,
-                    "message_id": str(result.id)
-                }
-                message_group_entry.append(entry)
-            
-        else:
-            logger.error(f"Target channel with ID {target_channel_id} not found")
-            return
-    
-    # Save the message group entry to the database
-    group_name = helpers.get_group_name(parent_channel_id)
-    try:
-        database.save_message_group_entry(group_name, message_group_entry)
-        logger.info(f"Thread message successfully forwarded and saved")
-    except Exception as e:
-        logger.error(f"Failed to save thread message group entry: {e}")
+    # Queue up at the destinations only now that the payload is ready.
+    dispatch.reserve(pending, message.channel.id)
+    await fan_out(pending, dispatch.delivering(deliver, message.channel.id))
+    attachments.close()
 
 def _is_forum_thread(thread: discord.Thread) -> bool:
     parent = thread.parent
@@ -290,8 +379,10 @@ def _is_forum_starter_message(message: discord.Message, thread_entry: list, pare
                 return True
     return str(message.id) == str(message.channel.id)
 
-async def handle_forum_thread_message(bot, message: discord.Message, ignore_reference: bool = False):
+async def handle_forum_thread_message(bot, message: discord.Message, ignore_reference: bool = False, dispatch: Optional[Dispatch] = None, saved_entry: Optional[list] = None):
     """Handles messages in forum threads and forwards them to linked forum threads."""
+    if dispatch is None:
+        dispatch = delivery_queues.open_dispatch([])
     if message.author == bot.user:
         return
     if message.webhook_id:
@@ -306,7 +397,7 @@ async def handle_forum_thread_message(bot, message: discord.Message, ignore_refe
     if not group_name:
         return
 
-    thread_entry = database.get_forum_thread_group_entry_by_thread_id(str(message.channel.id), group_name)
+    thread_entry = await async_database.get_forum_thread_group_entry_by_thread_id(str(message.channel.id), group_name)
     if not thread_entry:
         return
 
@@ -337,20 +428,34 @@ async def handle_forum_thread_message(bot, message: discord.Message, ignore_refe
         "message_id": str(message.id)
     }]
 
-    for entry in thread_entry:
-        if entry["thread_id"] == str(message.channel.id):
-            continue
-
+    target_entries = [entry for entry in thread_entry if entry["thread_id"] != str(message.channel.id)]
+    pending = helpers.unmirrored(target_entries, saved_entry, channel_of=lambda entry: entry["channel_id"])
+    if not pending:
+        return
+    if saved_entry is None:
+        try:
+            await async_database.save_message_group_entry(group_name, message_group_entry)
+        except Exception as e:
+            logger.error(f"Failed to save forum message group entry: {e}")
+
+    header_text = await helpers.form_header(message, guild_name, channel_group_len)
+    attachments = await AttachmentFanout.from_message(message)
+
+    async def deliver(entry: dict):
+        if destination_breakers.is_open(entry["channel_id"]):
+            logger.debug(f"Skipping forum thread {entry['thread_id']}, the circuit of {entry['channel_id']} is open")
+            return None
         target_thread = bot.get_channel(int(entry["thread_id"]))
         if not target_thread:
             try:
                 target_thread = await bot.fetch_channel(int(entry["thread_id"]))
             except Exception as e:
                 logger.error(f"Failed to fetch target forum thread {entry['thread_id']}: {e}")
-                continue
+                destination_breakers.record_result(entry["channel_id"], e)
+                return None
 
-        lock = header_state.get_lock(group_name, entry["channel_id"], entry["thread_id"])
-        async with lock:
+        webhook = await webhook_pool.get(target_thread)
+        async with dispatch.turn(entry["channel_id"], message.channel.id):
             include_header, _, _ = header_state.decide_header(
                 group_name=group_name,
                 channel_id=entry["channel_id"],
@@ -361,20 +466,36 @@ async def handle_forum_thread_message(bot, message: discord.Message, ignore_refe
                 is_reply=False,
             )
 
-            header = helpers.form_header(message, guild_name, channel_group_len) if include_header else ""
+            if webhook:
+                include_header = False
+            header = header_text if include_header else ""
             msg = helpers.form_message_text(header, message.content)
 
-            try:
-                files = await helpers.process_attachments(message)
+            async def send():
+                files = attachments.files()
                 global_stickers, guild_sticker_files = await helpers.process_stickers(message)
                 files += guild_sticker_files
 
-                result = await target_thread.send(
-                    content=msg,
-                    embed=message.embeds[0] if message.embeds else None,
-                    files=files if files else None,
-                    stickers=global_stickers if global_stickers else None
-                )
+                if webhook:
+                    result = await webhook_pool.send(
+                        webhook,
+                        target_thread,
+                        message,
+                        guild_name,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=files if files else None,
+                        stickers=global_stickers if global_stickers else None
+                    )
+                else:
+                    result = await sender_pool.send(
+                        target_thread,
+                        content=msg,
+                        embed=message.embeds[0] if message.embeds else None,
+                        files=files if files else None,
+                        stickers=global_stickers if global_stickers else None,
+                        attachments=attachments
+                    )
                 header_state.update_state(
                     group_name=group_name,
                     channel_id=entry["channel_id"],
@@ -383,16 +504,25 @@ async def handle_forum_thread_message(bot, message: discord.Message, ignore_refe
                     source_guild_id=source_guild_id,
                     timestamp=timestamp,
                 )
-                message_group_entry.append({
-                    "guild_id": entry["guild_id"],
-                    "channel_id": entry["channel_id"],
-                    "thread_id": entry["thread_id"],
-                    "message_id": str(result.id)
-                })
+                return result
+
+            mirror_entry = {
+                "guild_id": entry["guild_id"],
+                "channel_id": entry["channel_id"],
+                "thread_id": entry["thread_id"],
+                "has_header": include_header
+            }
+
+            try:
+                result = await send()
+                helpers.set_mirror_message(mirror_entry, result)
+                await helpers.record_mirror(group_name, message.id, mirror_entry)
+                return mirror_entry
             except Exception as e:
                 logger.error(f"Failed to send forum thread message to {entry['thread_id']}: {e}")
+                delivery_retries.schedule(e, group_name, message.id, entry["thread_id"], send, mirror_entry, attachments)
 
-    try:
-        database.save_message_group_entry(group_name, message_group_entry)
-    except Exception as e:
-        logger.error(f"Failed to save forum message group entry: {e}")
+    # Queue up at the destinations only now that the payload is ready.
+    dispatch.reserve([entry["channel_id"] for entry in pending], message.channel.id)
+    await fan_out(pending, dispatch.delivering(deliver, message.channel.id, channel_of=lambda entry: entry["channel_id"]))
+    attachments.close()
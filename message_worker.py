@@ -1,9 +1,13 @@
+from typing import Optional
 import discord
 from logger_config import get_logger
 import message_send
 import message_reply
 import message_forward
 import helpers
+from delivery_queue import delivery_queues
+from group_leases import group_leases
+from outbox import outbox
 
 logger = get_logger(__name__)
 
@@ -30,54 +34,71 @@ class MessageWorker:
 
         return False
 
-    async def process_message(self, message: discord.Message):
+    async def process_message(self, message: discord.Message, saved_entry: Optional[list] = None):
         """
         Main entry point for processing messages. Routes messages to appropriate handlers
-        based on their type (regular, reply, thread, reply in thread).
+        based on their type (regular, reply, thread, reply in thread). saved_entry is the
+        message group entry already saved for a message resumed from the outbox; destinations
+        that have a mirror in it are skipped.
         """
         if self._should_ignore_message(message):
             return
 
         # Ignore messages in channels that are not part of any linked group.
         if isinstance(message.channel, discord.Thread):
-            group_name = helpers.get_group_name(str(message.channel.parent_id))
+            source_channel_id = str(message.channel.parent_id)
         else:
-            group_name = helpers.get_group_name(str(message.channel.id))
+            source_channel_id = str(message.channel.id)
+        group_name = helpers.get_group_name(source_channel_id)
         if not group_name:
             logger.debug("Ignoring message outside of any group: %s in %s", message.author, message.channel)
             return
+        if not group_leases.owns(group_name):
+            # Recorded anyway, so a message arriving while the lease changes hands is resumed by the next owner.
+            outbox.add_unowned(message, group_name)
+            return
+        if not outbox.add(message, group_name):
+            logger.info(f"Shutting down, leaving message {message.id} in the outbox for the next start")
+            return
+
+        # Handlers queue up at the destinations once their payload is ready; closing the
+        # dispatch releases any turn left unused when a handler fails.
+        dispatch = delivery_queues.open_dispatch()
 
         try:
             if isinstance(message.channel, discord.Thread):
                 if self.forum_sync and self.forum_sync.is_forum_thread(message.channel):
                     logger.info(f"Processing forum thread message from {message.author} in {message.channel.name}")
                     if message.reference:
-                        await message_reply.handle_forum_thread_reply_message(self.bot, message)
+                        await message_reply.handle_forum_thread_reply_message(self.bot, message, dispatch=dispatch, saved_entry=saved_entry)
                     else:
-                        await message_send.handle_forum_thread_message(self.bot, message)
-                    return
-                if message.reference:
+                        await message_send.handle_forum_thread_message(self.bot, message, dispatch=dispatch, saved_entry=saved_entry)
+                elif message.reference:
                     # Reply in thread
                     logger.info(f"Processing reply in thread from {message.author} in {message.channel.name}")
-                    await message_reply.handle_reply_message_in_thread(self.bot, message)
+                    await message_reply.handle_reply_message_in_thread(self.bot, message, dispatch=dispatch, saved_entry=saved_entry)
                 else:
                     # Regular thread message
                     logger.info(f"Processing thread message from {message.author} in {message.channel.name}")
-                    await message_send.handle_thread_message(self.bot, message)
+                    await message_send.handle_thread_message(self.bot, message, dispatch=dispatch, saved_entry=saved_entry)
             else:
                 if message.reference:
                     if message.reference.type == discord.MessageReferenceType.forward:
                         # Forward message
                         logger.info(f"Processing forward message from {message.author} in {message.channel.name}")
-                        await message_forward.handle_forward_message(self.bot, message)
+                        await message_forward.handle_forward_message(self.bot, message, dispatch=dispatch, saved_entry=saved_entry)
                     else:
                         # Reply in regular channel
                         logger.info(f"Processing reply message from {message.author} in {message.channel.name}")
-                        await message_reply.handle_reply_message_in_channel(self.bot, message)
+                        await message_reply.handle_reply_message_in_channel(self.bot, message, dispatch=dispatch, saved_entry=saved_entry)
                 else:
                     # Regular message
                     logger.info(f"Processing regular message from {message.author} in {message.channel.name}")
-                    await message_send.handle_message(self.bot, message)
+                    await message_send.handle_message(self.bot, message, dispatch=dispatch, saved_entry=saved_entry)
 
         except Exception as e:
             logger.error(f"Error processing message: {e}", exc_info=True)
+        finally:
+            dispatch.close()
+        # Not reached when the handler is cancelled at shutdown, so the job stays in the outbox.
+        outbox.done(message.id)
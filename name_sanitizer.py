@@ -0,0 +1,16 @@
+import re
+from functools import lru_cache
+import emoji
+import config
+
+# Emoji codes (pattern :emoji_name:) left behind by demojize or typed into the name.
+EMOJI_CODE_PATTERN = re.compile(r':[a-zA-Z0-9_+-]+:')
+
+
+@lru_cache(maxsize=config.DISPLAY_NAME_CACHE_SIZE)
+def sanitize_display_name(display_name: str) -> str:
+    """Strip emojis and emoji codes from a display name for cleaner headers."""
+    # demojize only rewrites non-ASCII emoji, so plain ASCII names can skip the slow scan.
+    if not display_name.isascii():
+        display_name = emoji.demojize(display_name)
+    return EMOJI_CODE_PATTERN.sub('', display_name).strip()
@@ -0,0 +1,262 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+from typing import Awaitable, Callable, Deque, Dict, NamedTuple, Optional, Tuple, TypeVar
+import aiohttp
+import config
+from circuit_breaker import CircuitOpenError, destination_breakers
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """Lower values are dispatched first."""
+    MESSAGE = 0
+    EDIT = 1
+    DELETE = 2
+    REACTION = 3
+
+
+class Route(NamedTuple):
+    method: str
+    template: str
+    priority: Priority
+
+
+SEND_MESSAGE = Route("POST", "/channels/{channel_id}/messages", Priority.MESSAGE)
+CREATE_THREAD = Route("POST", "/channels/{channel_id}/threads", Priority.MESSAGE)
+CREATE_MESSAGE_THREAD = Route("POST", "/channels/{channel_id}/messages/{message_id}/threads", Priority.MESSAGE)
+EDIT_MESSAGE = Route("PATCH", "/channels/{channel_id}/messages/{message_id}", Priority.EDIT)
+EDIT_CHANNEL = Route("PATCH", "/channels/{channel_id}", Priority.EDIT)
+DELETE_MESSAGE = Route("DELETE", "/channels/{channel_id}/messages/{message_id}", Priority.DELETE)
+BULK_DELETE_MESSAGES = Route("POST", "/channels/{channel_id}/messages/bulk-delete", Priority.DELETE)
+DELETE_CHANNEL = Route("DELETE", "/channels/{channel_id}", Priority.DELETE)
+EXECUTE_WEBHOOK = Route("POST", "/webhooks/{webhook_id}/{webhook_token}", Priority.MESSAGE)
+EDIT_WEBHOOK_MESSAGE = Route("PATCH", "/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}", Priority.EDIT)
+DELETE_WEBHOOK_MESSAGE = Route("DELETE", "/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}", Priority.DELETE)
+ADD_REACTION = Route("PUT", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me", Priority.REACTION)
+REMOVE_REACTION = Route("DELETE", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me", Priority.REACTION)
+
+# Routes whose 403 means the destination no longer takes mirrors, and counts toward its circuit.
+SENDING_ROUTES = {SEND_MESSAGE, CREATE_THREAD, CREATE_MESSAGE_THREAD, EXECUTE_WEBHOOK}
+
+# Response headers a rate limit bucket is learned from.
+RATE_LIMIT_HEADERS = ("X-RateLimit-Bucket", "X-RateLimit-Remaining", "X-RateLimit-Reset-After")
+
+_CHANNEL_PATH = re.compile(r"/channels/(\d+)")
+_PATH_PARAMS = (
+    (re.compile(r"/channels/\d+"), "/channels/{channel_id}"),
+    (re.compile(r"/messages/\d+"), "/messages/{message_id}"),
+    (re.compile(r"/reactions/[^/]+"), "/reactions/{emoji}"),
+)
+
+
+def _route_template(path: str) -> Optional[str]:
+    start = path.find("/channels/")
+    if start < 0:
+        return None
+    template = path[start:]
+    for pattern, replacement in _PATH_PARAMS:
+        template = pattern.sub(replacement, template, count=1)
+    return template
+
+
+class BucketState:
+    __slots__ = ("remaining", "reset_at")
+
+    def __init__(self):
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a request may be sent in this bucket."""
+        if self.remaining is None or self.remaining > 0 or now >= self.reset_at:
+            return 0.0
+        return self.reset_at - now
+
+
+class _Operation:
+    __slots__ = ("route", "channel_id", "call", "future", "enqueued_at")
+
+    def __init__(self, route: Route, channel_id: str, call: Callable[[], Awaitable], future: asyncio.Future):
+        self.route = route
+        self.channel_id = channel_id
+        self.call = call
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class OutboundScheduler:
+    """
+    Central queue for the REST calls that mirror messages, edits, deletes and reactions.
+
+    Calls are dispatched by priority (messages, then edits, deletes and reactions) and round-robin
+    across channels within a priority, with at most max_concurrency in flight. Rate limit buckets
+    are learned from response headers through trace_config(); a call whose channel bucket is
+    exhausted waits in the queue until the bucket resets instead of occupying a slot, so traffic
+    to other channels and higher priorities keeps flowing.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[_Operation]]"] = {priority: OrderedDict() for priority in Priority}
+        self._route_buckets: Dict[Tuple[str, str], str] = {}
+        self._buckets: Dict[Tuple[str, str], BucketState] = {}
+        self._in_flight = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._stats = {priority: {"submitted": 0, "started": 0, "completed": 0, "total_wait": 0.0, "max_wait": 0.0} for priority in Priority}
+
+    async def submit(self, route: Route, channel_id, call: Callable[[], Awaitable[T]], destination_id=None) -> T:
+        """
+        Queue call() for the route in channel_id and return its result once it has run.
+
+        destination_id is the linked channel the call belongs to (the parent of a thread) and
+        keys its circuit breaker; it defaults to channel_id. Raises CircuitOpenError without
+        queueing when that circuit is open.
+        """
+        destination_id = channel_id if destination_id is None else destination_id
+        if not destination_breakers.allow(destination_id):
+            raise CircuitOpenError(str(destination_id))
+
+        operation = _Operation(route, str(channel_id), call, asyncio.get_running_loop().create_future())
+        channel_queues = self._queues[route.priority]
+        channel_queues.setdefault(operation.channel_id, deque()).append(operation)
+        self._stats[route.priority]["submitted"] += 1
+        self._wake()
+        try:
+            result = await operation.future
+        except BaseException as e:
+            # Cancellation included, so a probe that never finished does not hold the circuit open.
+            destination_breakers.record_result(destination_id, e, sending=route in SENDING_ROUTES)
+            raise
+        destination_breakers.record_result(destination_id, None)
+        return result
+
+    def _wake(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="outbound-dispatcher")
+        self._wakeup.set()
+
+    def _bucket(self, route: Route, channel_id: str) -> Optional[BucketState]:
+        bucket_hash = self._route_buckets.get((route.method, route.template))
+        if bucket_hash is None:
+            return None
+        return self._buckets.get((bucket_hash, channel_id))
+
+    def _next_ready(self) -> Tuple[Optional[_Operation], Optional[float]]:
+        """Pick the next runnable operation, or return how long until a blocked one can run."""
+        now = time.monotonic()
+        soonest = None
+        for priority in Priority:
+            channel_queues = self._queues[priority]
+            for channel_id, operations in channel_queues.items():
+                bucket = self._bucket(operations[0].route, channel_id)
+                delay = bucket.delay(now) if bucket else 0.0
+                if delay > 0:
+                    soonest = delay if soonest is None else min(soonest, delay)
+                    continue
+                operation = operations.popleft()
+                if operations:
+                    channel_queues.move_to_end(channel_id)
+                else:
+                    del channel_queues[channel_id]
+                if bucket and bucket.remaining:
+                    # Spend the slot now; the response headers will correct it.
+                    bucket.remaining -= 1
+                return operation, None
+        return None, soonest
+
+    async def _dispatch(self):
+        while True:
+            operation, delay = (None, None) if self._in_flight >= self.max_concurrency else self._next_ready()
+            if operation is None:
+                if self._in_flight == 0 and delay is None and not self.depth():
+                    return
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._in_flight += 1
+            asyncio.create_task(self._run(operation))
+
+    async def _run(self, operation: _Operation):
+        wait = time.monotonic() - operation.enqueued_at
+        stats = self._stats[operation.route.priority]
+        stats["started"] += 1
+        stats["total_wait"] += wait
+        stats["max_wait"] = max(stats["max_wait"], wait)
+        try:
+            result = await operation.call()
+        except BaseException as e:
+            if not operation.future.done():
+                operation.future.set_exception(e)
+        else:
+            if not operation.future.done():
+                operation.future.set_result(result)
+        finally:
+            stats["completed"] += 1
+            self._in_flight -= 1
+            self._wake()
+
+    def depth(self) -> int:
+        return sum(len(operations) for channel_queues in self._queues.values() for operations in channel_queues.values())
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Queue depth and wait-time counters per priority class."""
+        snapshot = {}
+        for priority in Priority:
+            stats = self._stats[priority]
+            started = stats["started"]
+            snapshot[priority.name.lower()] = {
+                "depth": sum(len(operations) for operations in self._queues[priority].values()),
+                "submitted": stats["submitted"],
+                "completed": stats["completed"],
+                "avg_wait": stats["total_wait"] / started if started else 0.0,
+                "max_wait": stats["max_wait"],
+            }
+        return snapshot
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """aiohttp tracing hooks that feed rate limit headers of Discord responses into the buckets."""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(self._on_request_end)
+        return trace_config
+
+    async def _on_request_end(self, session, context, params: aiohttp.TraceRequestEndParams):
+        self.observe(params.method, params.url.path, params.response.headers)
+
+    def observe(self, method: str, path: str, headers):
+        """Learn the rate limit bucket of a Discord response, including the ones sender processes receive."""
+        bucket_hash = headers.get("X-RateLimit-Bucket")
+        if bucket_hash is None:
+            return
+        template = _route_template(path)
+        channel_match = _CHANNEL_PATH.search(path)
+        if template is None or channel_match is None:
+            return
+
+        self._route_buckets[(method, template)] = bucket_hash
+        bucket = self._buckets.setdefault((bucket_hash, channel_match.group(1)), BucketState())
+        try:
+            bucket.remaining = int(headers.get("X-RateLimit-Remaining", 1))
+            bucket.reset_at = time.monotonic() + float(headers.get("X-RateLimit-Reset-After", 0))
+        except ValueError:
+            return
+        if bucket.remaining == 0:
+            logger.debug(f"Rate limit bucket {bucket_hash} exhausted for channel {channel_match.group(1)}")
+
+
+outbound = OutboundScheduler(config.OUTBOUND_MAX_CONCURRENCY)
@@ -0,0 +1,229 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional, Set
+import discord
+import config
+import helpers
+import async_database
+from group_leases import group_leases
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# Orphaned jobs picked up per resume pass.
+RESUME_BATCH_SIZE = 200
+
+
+class Outbox:
+    """
+    Durable record of the messages being mirrored, so a crash or redeploy does not lose them.
+
+    add() and done() only touch memory; a flusher task appends new jobs with one insert_many per
+    batch and marks finished jobs with one update_many. A job that finishes before its batch is
+    written never reaches MongoDB. Unfinished jobs of instances that are gone (including this
+    instance before a restart) are claimed and resumed: the source message is fetched again and
+    mirrored to the destinations that have no mirror in its saved mapping yet. A resume that does not finish the job is retried once its claim is one
+    resume interval old, up to max_resume_attempts.
+    """
+
+    def __init__(self, instance_id: str, batch_size: int, flush_interval: float, resume_interval: float, max_resume_attempts: int):
+        self.instance_id = instance_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.resume_interval = resume_interval
+        self.max_resume_attempts = max_resume_attempts
+        self.started_at = datetime.now(timezone.utc)
+        self.draining = False
+        self._unwritten: Dict[str, dict] = {}
+        self._finished: Set[str] = set()
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._flush_now = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._resumer: Optional[asyncio.Task] = None
+
+    def _record(self, message: discord.Message, group_name: str, instance_id: Optional[str]):
+        job_id = str(message.id)
+        self._unwritten[job_id] = {
+            "_id": job_id,
+            "channel_id": str(message.channel.id),
+            "guild_id": str(message.guild.id) if message.guild else None,
+            "group_name": group_name,
+            "instance_id": instance_id,
+            "created_at": datetime.now(timezone.utc),
+        }
+        if len(self._unwritten) >= self.batch_size:
+            self._flush_now.set()
+
+    def add(self, message: discord.Message, group_name: str) -> bool:
+        """
+        Record a message that is about to be mirrored. Returns False while draining for shutdown:
+        the job is persisted but left for the next instance, and the caller should not mirror it.
+        """
+        self._record(message, group_name, self.instance_id)
+        if self.draining:
+            return False
+        self._in_flight += 1
+        self._idle.clear()
+        return True
+
+    def add_unowned(self, message: discord.Message, group_name: str):
+        """
+        Record a message of a group this instance does not own, without an owner. The instance
+        owning the group resumes it once it is one resume interval old and still has no mapping,
+        so messages arriving while a lease changes hands are not lost.
+        """
+        self._record(message, group_name, None)
+
+    def done(self, message_id):
+        """Mark the job of a mirrored message finished."""
+        job_id = str(message_id)
+        if self._unwritten.pop(job_id, None) is None:
+            self._finished.add(job_id)
+        self._in_flight -= 1
+        if self._in_flight <= 0:
+            self._in_flight = 0
+            self._idle.set()
+
+    def start(self, bot, process_message: Callable[[discord.Message, Optional[list]], Awaitable]):
+        """Start flushing, and resume orphaned jobs once the bot is ready. Call inside `async with bot`."""
+        self._flusher = asyncio.create_task(self._flush_loop(), name="outbox-flush")
+        self._resumer = asyncio.create_task(self._resume_loop(bot, process_message), name="outbox-resume")
+
+    async def _flush_loop(self):
+        indexed = False
+        index_retry_at = 0.0
+        while True:
+            if not indexed and time.monotonic() >= index_retry_at:
+                # Indexes only speed up resumes and expire done jobs; keep flushing without them.
+                try:
+                    await async_database.ensure_outbox_indexes(config.OUTBOX_DONE_TTL_SECONDS)
+                    indexed = True
+                except Exception as e:
+                    logger.error(f"Failed to create outbox indexes, retrying in {self.resume_interval:.0f}s: {e}")
+                    index_retry_at = time.monotonic() + self.resume_interval
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Outbox flush failed: {e}")
+
+    async def flush(self):
+        """Write buffered jobs and done marks; on failure they stay buffered for the next flush."""
+        if self._unwritten:
+            jobs, self._unwritten = self._unwritten, {}
+            try:
+                await async_database.append_outbox_jobs(list(jobs.values()))
+            except Exception as e:
+                logger.error(f"Failed to append {len(jobs)} outbox jobs: {e}")
+                self._unwritten = {**jobs, **self._unwritten}
+                return
+        if self._finished:
+            finished, self._finished = self._finished, set()
+            try:
+                await async_database.mark_outbox_jobs_done(list(finished))
+            except Exception as e:
+                logger.error(f"Failed to mark {len(finished)} outbox jobs done: {e}")
+                self._finished |= finished
+
+    async def _resume_loop(self, bot, process_message):
+        await bot.wait_until_ready()
+        while True:
+            try:
+                await self._resume_orphans(bot, process_message)
+            except Exception as e:
+                logger.error(f"Outbox resume pass failed: {e}")
+            await asyncio.sleep(self.resume_interval)
+
+    async def _resume_orphans(self, bot, process_message):
+        if self.draining:
+            return
+        live_instance_ids = await async_database.load_live_instance_ids() if config.MULTI_INSTANCE_MODE else []
+        live_instance_ids = set(live_instance_ids) | {self.instance_id}
+        retry_before = datetime.now(timezone.utc) - timedelta(seconds=self.resume_interval)
+        jobs = await async_database.load_orphaned_outbox_jobs(
+            self.instance_id, list(live_instance_ids), self.started_at, retry_before, RESUME_BATCH_SIZE
+        )
+
+        resumed = 0
+        for job in jobs:
+            if not group_leases.owns(job["group_name"]):
+                continue
+            if not await async_database.claim_outbox_job(job["_id"], job["instance_id"], job.get("claimed_at"), self.instance_id):
+                continue
+            await self._resume_job(bot, process_message, job)
+            resumed += 1
+        if resumed:
+            logger.info(f"Resumed {resumed} unfinished mirror jobs from the outbox")
+
+    async def _resume_job(self, bot, process_message, job: dict):
+        job_id = job["_id"]
+        if job.get("attempts", 0) >= self.max_resume_attempts:
+            logger.error(f"Giving up outbox job {job_id} after {job['attempts']} resume attempts")
+            self._finished.add(job_id)
+            return
+
+        try:
+            channel = await helpers.resolve_bridged_channel(bot, int(job["guild_id"]) if job.get("guild_id") else None, int(job["channel_id"]))
+            message = await channel.fetch_message(int(job_id)) if channel is not None else None
+        except (discord.NotFound, discord.Forbidden) as e:
+            logger.info(f"Source message of outbox job {job_id} is gone, dropping the job: {e}")
+            self._finished.add(job_id)
+            return
+        except discord.HTTPException as e:
+            logger.warning(f"Could not fetch source message of outbox job {job_id}, will retry: {e}")
+            return
+        if message is None:
+            logger.info(f"Channel {job['channel_id']} of outbox job {job_id} is no longer bridged, dropping the job")
+            self._finished.add(job_id)
+            return
+
+        if self.draining:
+            # Shutting down; the claimed job stays unfinished for the next start.
+            return
+        # Saved before the fan-out with each mirror added as it is delivered: only the destinations
+        # missing from it are mirrored again.
+        saved_entry = await async_database.get_message_group_entry_by_message_id(job_id, job["group_name"])
+        logger.info(f"Resuming mirror of message {job_id} from channel {job['channel_id']}")
+        await process_message(message, saved_entry)
+        self._finished.add(job_id)
+
+    async def drain(self, timeout: float):
+        """Stop taking new jobs and wait up to timeout for the ones in flight to finish."""
+        self.draining = True
+        if self._in_flight:
+            logger.info(f"Waiting up to {timeout:.0f}s for {self._in_flight} mirror jobs to finish")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._in_flight} mirror jobs still running at shutdown; they will be resumed on the next start")
+        self._flush_now.set()
+
+    async def stop(self):
+        """Stop the background tasks and write everything still buffered."""
+        for task in (self._resumer, self._flusher):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    logger.error(f"Outbox task {task.get_name()} had failed: {e}")
+        self._resumer = self._flusher = None
+        await self.flush()
+
+
+outbox = Outbox(
+    config.INSTANCE_ID,
+    config.OUTBOX_BATCH_SIZE,
+    config.OUTBOX_FLUSH_SECONDS,
+    config.OUTBOX_RESUME_INTERVAL_SECONDS,
+    config.OUTBOX_MAX_RESUME_ATTEMPTS,
+)
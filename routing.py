@@ -0,0 +1,81 @@
+from typing import Dict, List, Optional, Set
+import database
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class RoutingIndex:
+    """In-memory view of the linked channel groups used on the message hot path."""
+
+    def __init__(self):
+        self._channel_groups: Dict[str, str] = {}
+        self._group_channels: Dict[str, List[str]] = {}
+        self._channel_guilds: Dict[str, str] = {}
+        self._linked_guilds: Set[str] = set()
+        self._loaded = False
+
+    def rebuild(self, linked_channels: dict):
+        """Rebuild all lookup tables from a linked channel groups state document."""
+        channel_groups = {}
+        group_channels = {}
+        channel_guilds = {}
+
+        for group in linked_channels.get("groups", []):
+            group_name = group["group_name"]
+            channel_list = list(group.get("channel_list", []))
+            group_channels[group_name] = channel_list
+            for channel_id in channel_list:
+                channel_groups.setdefault(channel_id, group_name)
+            for link in group.get("links", []):
+                channel_guilds.setdefault(link["channel_id"], link["guild_id"])
+
+        self._channel_groups = channel_groups
+        self._group_channels = group_channels
+        self._channel_guilds = channel_guilds
+        self._linked_guilds = set(channel_guilds.values())
+        self._loaded = True
+        logger.info(
+            "Routing index rebuilt: %s groups, %s channels",
+            len(group_channels),
+            len(channel_groups),
+        )
+
+    def refresh(self):
+        """Reload the index from the database. Call after the linked groups change."""
+        self.rebuild(database.load_linked_channel_groups_state())
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+
+    def get_group_name(self, channel_id: str) -> Optional[str]:
+        self._ensure_loaded()
+        return self._channel_groups.get(channel_id)
+
+    def get_group_names(self) -> List[str]:
+        self._ensure_loaded()
+        return list(self._group_channels)
+
+    def get_group_channels(self, group_name: str) -> List[str]:
+        self._ensure_loaded()
+        return list(self._group_channels.get(group_name, []))
+
+    def find_linked_channels(self, channel_id: str) -> Optional[List[str]]:
+        """Return the other channel IDs in the channel's group, or None if it is not linked."""
+        group_name = self.get_group_name(channel_id)
+        if group_name is None:
+            return None
+        return [linked_channel_id for linked_channel_id in self._group_channels[group_name] if linked_channel_id != channel_id]
+
+    def get_guild_id(self, channel_id: str) -> Optional[str]:
+        self._ensure_loaded()
+        return self._channel_guilds.get(channel_id)
+
+    def has_guild(self, guild_id: str) -> bool:
+        """Return True if any linked channel belongs to the guild."""
+        self._ensure_loaded()
+        return guild_id in self._linked_guilds
+
+
+routing_index = RoutingIndex()
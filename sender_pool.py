@@ -0,0 +1,334 @@
+import asyncio
+import contextvars
+import io
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+import aiohttp
+import discord
+import config
+from outbound import outbound, RATE_LIMIT_HEADERS, SEND_MESSAGE
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# How often the gateway process checks that its sender processes are still running.
+HEALTH_CHECK_SECONDS = 1.0
+
+# The result of the job running in the current task; the worker's HTTP trace adds the rate limit
+# headers of its responses to it.
+_job_result: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("job_result", default=None)
+
+
+class SenderError(Exception):
+    """
+    A delivery job failed in a sender process. status and code are the HTTP status and Discord
+    error code, if there were any; connection_error is set when no connection could be opened.
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None, code: Optional[int] = None, connection_error: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.connection_error = connection_error
+
+
+def _pack_file(file: discord.File) -> tuple:
+    # Attachments are spooled while the pool runs; pass the path instead of copying the bytes.
+    # Only small in-memory files (guild sticker images) are copied.
+    path = getattr(file.fp, "name", None)
+    if isinstance(path, str) and os.path.isfile(path):
+        data = None
+    else:
+        data = file.fp.read()
+        path = None
+    file.close()
+    return file.filename, data, path, file.spoiler, file.description
+
+
+def _unpack_file(packed: tuple) -> discord.File:
+    filename, data, path, spoiler, description = packed
+    fp = path if path is not None else io.BytesIO(data)
+    return discord.File(fp, filename=filename, spoiler=spoiler, description=description)
+
+
+def _pack_job(channel_id: int, content, embed, files, stickers, reference) -> dict:
+    return {
+        "channel_id": channel_id,
+        "content": content,
+        "embed": embed.to_dict() if embed else None,
+        "files": [_pack_file(file) for file in files or []],
+        "sticker_ids": [sticker.id for sticker in stickers or []],
+        "reference": (
+            (reference.message_id, reference.channel_id, reference.guild_id, reference.fail_if_not_exists)
+            if reference else None
+        ),
+    }
+
+
+async def _on_request_end(session, context, params: aiohttp.TraceRequestEndParams):
+    result = _job_result.get()
+    if result is None:
+        return
+    headers = params.response.headers
+    result["rate_limit"] = (
+        params.method,
+        params.url.path,
+        {name: headers[name] for name in RATE_LIMIT_HEADERS if name in headers},
+    )
+
+
+async def _run_job(client: discord.Client, job: dict, result_queue):
+    result = {"job_id": job["job_id"]}
+    _job_result.set(result)
+    try:
+        reference = None
+        if job["reference"]:
+            message_id, channel_id, guild_id, fail_if_not_exists = job["reference"]
+            reference = discord.MessageReference(
+                message_id=message_id, channel_id=channel_id, guild_id=guild_id, fail_if_not_exists=fail_if_not_exists
+            )
+        files = [_unpack_file(packed) for packed in job["files"]]
+        message = await client.get_partial_messageable(job["channel_id"]).send(
+            content=job["content"],
+            embed=discord.Embed.from_dict(job["embed"]) if job["embed"] else None,
+            files=files or None,
+            stickers=[discord.Object(id=sticker_id) for sticker_id in job["sticker_ids"]] or None,
+            reference=reference,
+        )
+        result["message_id"] = message.id
+    except discord.HTTPException as e:
+        result["error"] = str(e)
+        result["status"] = e.status
+        result["code"] = e.code
+    except aiohttp.ClientConnectorError as e:
+        result["error"] = str(e)
+        result["connection_error"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    result_queue.put(result)
+
+
+async def _worker_loop(index: int, token: str, job_queue, result_queue):
+    # REST-only client: no gateway connection, its own HTTP session and rate limit state.
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_end.append(_on_request_end)
+    client = discord.Client(intents=discord.Intents.none(), http_trace=trace_config)
+    await client.login(token)
+    logger.info(f"Sender process {index} ready (pid {os.getpid()})")
+
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    try:
+        while True:
+            job = await loop.run_in_executor(None, job_queue.get)
+            if job is None:
+                break
+            task = asyncio.create_task(_run_job(client, job, result_queue))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        await client.close()
+
+
+def _worker_main(index: int, token: str, job_queue, result_queue):
+    try:
+        asyncio.run(_worker_loop(index, token, job_queue, result_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+def _release(attachments):
+    if attachments is not None:
+        attachments.close()
+
+
+class SenderPool:
+    """
+    Sends mirrored messages from separate worker processes.
+
+    The gateway process keeps routing, header decisions, ordering and mappings; the REST call
+    itself (payload and multipart encoding, rate limit handling, response parsing) runs in one of
+    SENDER_PROCESSES workers. Jobs for a destination always go to the same worker, so its rate
+    limit buckets are tracked in one place. Workers report the rate limit headers of each
+    response, which the outbound scheduler learns its send buckets from as if it had made the call.
+    With no processes configured, send() calls the destination directly.
+
+    Only channel and thread sends run in the workers. The gateway process still renders headers,
+    demojizes content, downloads attachments, and makes every other call itself: webhook
+    executes, edits, deletes and reactions.
+
+    A worker that exits (failed login, crash) is not restarted, since forking again from the
+    running, multi-threaded process is unsafe: its pending jobs fail at once and later jobs are
+    routed to the next live worker, or sent directly once none is left.
+    """
+
+    def __init__(self, processes: int, job_timeout: float):
+        self.processes = processes
+        self.job_timeout = job_timeout
+        self._job_queues: List = []
+        self._workers: List[multiprocessing.Process] = []
+        self._result_queue = None
+        # job ID -> (worker index, future, attachments retained until the worker answers)
+        self._pending: Dict[int, Tuple[int, asyncio.Future, Optional[object]]] = {}
+        self._dead: Set[int] = set()
+        self._job_ids = itertools.count()
+        self._reader: Optional[asyncio.Task] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._reader_executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return self._reader is not None
+
+    def start(self, token: str):
+        """Start the worker processes. Call before the event loop starts and before any MongoDB access."""
+        if self.processes <= 0:
+            return
+        # Fork while the process is still single-threaded, so workers start from a clean copy
+        # without re-importing main.py the way spawn would.
+        threads = [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()]
+        if threads:
+            logger.warning(f"Forking sender processes while other threads are running: {threads}")
+        context = multiprocessing.get_context("fork")
+        self._result_queue = context.Queue()
+        for index in range(self.processes):
+            job_queue = context.Queue()
+            worker = context.Process(
+                target=_worker_main,
+                args=(index, token, job_queue, self._result_queue),
+                name=f"sender-{index}",
+                daemon=True,
+            )
+            worker.start()
+            self._job_queues.append(job_queue)
+            self._workers.append(worker)
+        logger.info(f"Started {self.processes} sender processes")
+
+    def attach(self):
+        """Start collecting results on the running event loop."""
+        if not self._workers or self._reader is not None:
+            return
+        self._reader_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sender-results")
+        self._reader = asyncio.create_task(self._read_results(), name="sender-results")
+        self._monitor = asyncio.create_task(self._watch_workers(), name="sender-health")
+
+    async def _read_results(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            result = await loop.run_in_executor(self._reader_executor, self._result_queue.get)
+            if result is None:
+                return
+            if "rate_limit" in result:
+                # The gateway never sees the worker's responses; keep its send buckets current.
+                outbound.observe(*result["rate_limit"])
+            pending = self._pending.pop(result["job_id"], None)
+            if pending is None:
+                continue
+            _, future, attachments = pending
+            _release(attachments)
+            if future.done():
+                continue
+            if "error" in result:
+                future.set_exception(SenderError(result["error"], result.get("status"), result.get("code"), result.get("connection_error", False)))
+            else:
+                future.set_result(result["message_id"])
+
+    async def _watch_workers(self):
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_SECONDS)
+            for index, worker in enumerate(self._workers):
+                if index not in self._dead and not worker.is_alive():
+                    self._worker_died(index, worker.exitcode)
+
+    def _worker_died(self, index: int, exitcode: Optional[int]):
+        self._dead.add(index)
+        error = SenderError(f"Sender process {index} exited with code {exitcode}")
+        failed = 0
+        for job_id, (worker_index, future, attachments) in list(self._pending.items()):
+            if worker_index == index:
+                del self._pending[job_id]
+                _release(attachments)
+                if not future.done():
+                    future.set_exception(error)
+                    failed += 1
+        live = len(self._workers) - len(self._dead)
+        logger.error(
+            f"Sender process {index} exited with code {exitcode}; failed {failed} pending jobs, "
+            f"{live} sender processes left" + ("" if live else ", sending from the gateway process")
+        )
+
+    def _worker_for(self, destination_id: int) -> Optional[int]:
+        """The worker that owns destination_id, or the next live one if it has exited."""
+        count = len(self._job_queues)
+        preferred = destination_id % count
+        for offset in range(count):
+            index = (preferred + offset) % count
+            if index not in self._dead:
+                return index
+        return None
+
+    async def send(self, destination, *, content=None, embed=None, files=None, stickers=None, reference=None, attachments=None):
+        """
+        Send to a channel or thread through the outbound scheduler and return the sent message (only
+        .id is guaranteed). attachments is the AttachmentFanout the files come from; it is retained
+        until the worker answers, so its spooled files outlive a job that timed out.
+        """
+        return await outbound.submit(
+            SEND_MESSAGE,
+            destination.id,
+            lambda: self._send(destination, content=content, embed=embed, files=files, stickers=stickers, reference=reference, attachments=attachments),
+            destination_id=getattr(destination, "parent_id", None) or destination.id,
+        )
+
+    async def _send(self, destination, *, content, embed, files, stickers, reference, attachments):
+        index = self._worker_for(destination.id) if self.running else None
+        if index is None:
+            return await destination.send(content=content, embed=embed, files=files, stickers=stickers, reference=reference)
+
+        job = _pack_job(destination.id, content, embed, files, stickers, reference)
+        job["job_id"] = job_id = next(self._job_ids)
+        future = asyncio.get_running_loop().create_future()
+        if attachments is not None:
+            attachments.retain()
+        # Stays pending after a timeout until the worker answers, which releases the attachments.
+        self._pending[job_id] = (index, future, attachments)
+        self._job_queues[index].put(job)
+        message_id = await asyncio.wait_for(future, timeout=self.job_timeout)
+        return discord.Object(id=message_id)
+
+    async def stop(self):
+        """Let the workers finish queued jobs, then shut them down."""
+        if not self._workers:
+            return
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        for job_queue in self._job_queues:
+            job_queue.put(None)
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            await loop.run_in_executor(None, worker.join, self.job_timeout)
+        if self._reader is not None:
+            self._result_queue.put(None)
+            await self._reader
+            self._reader = None
+            self._reader_executor.shutdown(wait=False)
+        self._workers.clear()
+        self._job_queues.clear()
+        self._dead.clear()
+        for _, _, attachments in self._pending.values():
+            _release(attachments)
+        self._pending.clear()
+
+
+sender_pool = SenderPool(config.SENDER_PROCESSES, config.SENDER_JOB_TIMEOUT_SECONDS)
@@ -0,0 +1,80 @@
+import asyncio
+from typing import Dict, Optional
+import aiohttp
+import discord
+import config
+from ttl_cache import TTLCache
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class ResolvedSticker:
+    """Result of resolving a sticker once: guild-native stickers carry their PNG bytes."""
+
+    def __init__(self, is_guild: bool, name: str, data: Optional[bytes] = None):
+        self.is_guild = is_guild
+        self.name = name
+        self.data = data
+
+
+class StickerCache:
+    """Caches sticker type lookups and downloads by sticker ID, using one shared HTTP session."""
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self._cache = TTLCache(maxsize, ttl_seconds)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def bind_session(self, session: aiohttp.ClientSession):
+        """Use the long-lived HTTP session owned by the bot."""
+        self._session = session
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            logger.warning("Sticker cache has no bound HTTP session; creating one")
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def resolve(self, guild: discord.Guild, sticker_item: discord.StickerItem) -> ResolvedSticker:
+        """Return the cached resolution for a sticker, resolving it once if needed. Raises on failure."""
+        cached = self._cache.get(sticker_item.id)
+        if cached is not None:
+            return cached
+
+        # Collapse concurrent lookups of the same sticker (e.g. a sticker spam burst) into one request.
+        pending = self._pending.get(sticker_item.id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[sticker_item.id] = future
+        try:
+            resolved = await self._fetch(guild, sticker_item)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no one else is waiting on it.
+            future.exception()
+            raise
+        else:
+            self._cache.set(sticker_item.id, resolved)
+            future.set_result(resolved)
+            return resolved
+        finally:
+            self._pending.pop(sticker_item.id, None)
+
+    async def _fetch(self, guild: discord.Guild, sticker_item: discord.StickerItem) -> ResolvedSticker:
+        sticker = await guild.fetch_sticker(sticker_item.id)
+        if sticker.type != discord.StickerType.guild:
+            return ResolvedSticker(is_guild=False, name=sticker.name)
+
+        data = None
+        async with self._get_session().get(sticker.url) as resp:
+            if resp.status == 200:
+                data = await resp.read()
+            else:
+                logger.warning(f"Sticker {sticker_item.id} download returned HTTP {resp.status}")
+        return ResolvedSticker(is_guild=True, name=sticker.name, data=data)
+
+
+sticker_cache = StickerCache(config.STICKER_CACHE_SIZE, config.STICKER_CACHE_TTL_SECONDS)
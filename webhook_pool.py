@@ -0,0 +1,183 @@
+import asyncio
+import re
+from typing import Dict, List, Optional, Set
+import discord
+import config
+import helpers
+from outbound import outbound, EXECUTE_WEBHOOK, EDIT_WEBHOOK_MESSAGE, DELETE_WEBHOOK_MESSAGE
+from ttl_cache import TTLCache
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+UNKNOWN_WEBHOOK = 10015
+WEBHOOK_USERNAME_MAX_LENGTH = 80
+# Discord rejects webhook usernames containing these words.
+_RESERVED_NAME_PATTERN = re.compile(r"(disc)(ord)|(cl)(yde)", re.IGNORECASE)
+
+
+def _is_unknown_webhook(error: discord.HTTPException) -> bool:
+    return error.status == 404 and error.code == UNKNOWN_WEBHOOK
+
+
+def webhook_username(message: discord.Message, guild_name: str) -> str:
+    """Display name for a mirrored message: the author and the server it came from."""
+    name = f"{message.author.display_name} ({guild_name})"
+    name = _RESERVED_NAME_PATTERN.sub(lambda match: "\u200b".join(part for part in match.groups() if part), name)
+    return name[:WEBHOOK_USERNAME_MAX_LENGTH]
+
+
+def _thread_of(destination):
+    return destination if isinstance(destination, discord.Thread) else discord.utils.MISSING
+
+
+class WebhookPool:
+    """
+    The bridge webhook of every destination channel, looked up or created once and then reused.
+
+    Threads (including forum posts) are served by their parent's webhook with thread=. A webhook
+    that was deleted is dropped from the cache on 404 Unknown Webhook and recreated on next use.
+    Channels where no webhook can be created (missing Manage Webhooks) are remembered for
+    WEBHOOK_UNAVAILABLE_RETRY_SECONDS, and mirrored by the bot meanwhile.
+    """
+
+    def __init__(self, enabled: bool, unavailable_ttl: float):
+        self.enabled = enabled
+        self._webhooks: Dict[int, discord.Webhook] = {}
+        # Webhooks by ID, including ones fetched for earlier mirrors, and IDs known to be deleted.
+        self._by_id: Dict[int, discord.Webhook] = {}
+        self._gone: Set[int] = set()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._unavailable = TTLCache(4096, unavailable_ttl)
+
+    async def get(self, destination) -> Optional[discord.Webhook]:
+        """The webhook to mirror into a channel or thread, or None to send as the bot."""
+        if not self.enabled:
+            return None
+        channel = destination.parent if isinstance(destination, discord.Thread) else destination
+        if channel is None:
+            return None
+        return await self._channel_webhook(channel)
+
+    async def _channel_webhook(self, channel) -> Optional[discord.Webhook]:
+        webhook = self._webhooks.get(channel.id)
+        if webhook is not None or channel.id in self._unavailable:
+            return webhook
+
+        async with self._locks.setdefault(channel.id, asyncio.Lock()):
+            webhook = self._webhooks.get(channel.id)
+            if webhook is None and channel.id not in self._unavailable:
+                try:
+                    webhook = await helpers.get_or_create_webhook(channel)
+                except discord.HTTPException as e:
+                    logger.warning(f"No webhook available in {channel.guild.name}#{channel.name}, mirroring as the bot: {e}")
+                    self._unavailable.set(channel.id, True)
+                    return None
+                self._webhooks[channel.id] = webhook
+                self._by_id[webhook.id] = webhook
+        return webhook
+
+    def invalidate(self, webhook: discord.Webhook):
+        self._by_id.pop(webhook.id, None)
+        self._gone.add(webhook.id)
+        if self._webhooks.get(webhook.channel_id) is webhook:
+            del self._webhooks[webhook.channel_id]
+            logger.info(f"Webhook {webhook.id} of channel {webhook.channel_id} is gone, dropping it from the cache")
+
+    async def send(self, webhook: discord.Webhook, destination, message: discord.Message, guild_name: str, *,
+                   content=None, embed=None, files: Optional[List[discord.File]] = None, stickers=None, reference=None) -> discord.WebhookMessage:
+        """Mirror message into destination as its author, through the outbound scheduler."""
+        # Webhooks cannot reply or send stickers: link the replied-to mirror and the sticker images instead.
+        prefix = ""
+        if reference is not None:
+            prefix = f"-# ↪ https://discord.com/channels/{reference.guild_id}/{reference.channel_id}/{reference.message_id}\n"
+        sticker_links = "\n".join(sticker.url for sticker in stickers or [])
+        text = "\n".join(part for part in (f"{prefix}{content or ''}".strip("\n"), sticker_links) if part)
+
+        kwargs = {
+            "content": text or discord.utils.MISSING,
+            "username": webhook_username(message, guild_name),
+            "avatar_url": message.author.display_avatar.url,
+            "embed": embed or discord.utils.MISSING,
+            "files": files or discord.utils.MISSING,
+            "thread": _thread_of(destination),
+            "wait": True,
+        }
+        linked_channel_id = getattr(destination, "parent_id", None) or destination.id
+
+        async def execute():
+            nonlocal webhook
+            try:
+                return await webhook.send(**kwargs)
+            except discord.NotFound as e:
+                if not _is_unknown_webhook(e):
+                    raise
+                self.invalidate(webhook)
+                webhook = await self.get(destination)
+                if webhook is None:
+                    raise
+                for file in files or []:
+                    file.reset()
+                return await webhook.send(**kwargs)
+
+        return await outbound.submit(EXECUTE_WEBHOOK, destination.id, execute, destination_id=linked_channel_id)
+
+    async def for_entry(self, bot, entry: dict) -> Optional[discord.Webhook]:
+        """
+        The webhook that owns the mirror in entry, if the mirror was sent by one and it still exists.
+        Never lists or creates webhooks: one that is not cached is fetched by the ID in entry.
+        """
+        webhook_id = entry.get("webhook_id")
+        if not webhook_id:
+            return None
+        webhook_id = int(webhook_id)
+        if webhook_id in self._gone:
+            return None
+        webhook = self._by_id.get(webhook_id)
+        if webhook is not None:
+            return webhook
+
+        # Also used after webhook delivery is switched off, to edit and delete earlier mirrors.
+        try:
+            webhook = await bot.fetch_webhook(webhook_id)
+        except discord.NotFound:
+            self._gone.add(webhook_id)
+            return None
+        except discord.HTTPException as e:
+            logger.warning(f"Failed to fetch webhook {webhook_id} of linked message {entry.get('message_id')}: {e}")
+            return None
+        self._by_id[webhook_id] = webhook
+        return webhook
+
+    async def edit_message(self, webhook: discord.Webhook, entry: dict, content: str):
+        thread = discord.Object(id=int(helpers.get_mirror_thread_id(entry))) if "thread_id" in entry else discord.utils.MISSING
+        target_id = helpers.get_mirror_thread_id(entry) if "thread_id" in entry else entry["channel_id"]
+        try:
+            return await outbound.submit(
+                EDIT_WEBHOOK_MESSAGE,
+                target_id,
+                lambda: webhook.edit_message(int(entry["message_id"]), content=content, thread=thread),
+                destination_id=entry["channel_id"],
+            )
+        except discord.NotFound as e:
+            if _is_unknown_webhook(e):
+                self.invalidate(webhook)
+            raise
+
+    async def delete_message(self, webhook: discord.Webhook, entry: dict):
+        thread = discord.Object(id=int(helpers.get_mirror_thread_id(entry))) if "thread_id" in entry else discord.utils.MISSING
+        target_id = helpers.get_mirror_thread_id(entry) if "thread_id" in entry else entry["channel_id"]
+        try:
+            return await outbound.submit(
+                DELETE_WEBHOOK_MESSAGE,
+                target_id,
+                lambda: webhook.delete_message(int(entry["message_id"]), thread=thread),
+                destination_id=entry["channel_id"],
+            )
+        except discord.NotFound as e:
+            if _is_unknown_webhook(e):
+                self.invalidate(webhook)
+            raise
+
+
+webhook_pool = WebhookPool(config.WEBHOOK_DELIVERY, config.WEBHOOK_UNAVAILABLE_RETRY_SECONDS)